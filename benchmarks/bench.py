@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Times PrestineRepo and the reflex actions against synthetic repositories
+served over file:// so the benchmarks run offline.
+
+    python benchmarks/bench.py --commits 2000 --output after.json \
+        --compare before.json
+"""
+
+import json
+import os
+import platform
+import sys
+from contextlib import contextmanager
+from shutil import rmtree
+from tempfile import mkdtemp
+from timeit import default_timer
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reflex import cli  # noqa: E402
+from reflex.process import run_git  # noqa: E402
+from reflex.repo import CLONE_STRATEGIES, PrestineRepo  # noqa: E402
+
+from synthetic import Layout, copy_upstream, make_upstream  # noqa: E402
+
+# Changes smaller than this many seconds are timer noise, not regressions.
+NOISE = 0.002
+
+
+@contextmanager
+def quiet():
+    """ Silences the progress the actions write while they are timed.
+    """
+    stdout, stderr = sys.stdout, sys.stderr
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = sys.stderr = devnull
+        try:
+            yield
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+
+class Bench():
+    """
+    Runs the benchmarks against copies of one synthetic upstream. Each
+    benchmark is run `repeat` times and every run is timed on its own.
+    """
+
+    def __init__(self, workdir, layout, repeat, clone_strategy):
+        self.workdir = workdir
+        self.layout = layout
+        self.repeat = repeat
+        self.clone_strategy = clone_strategy
+        self.template = os.path.join(workdir, 'template.git')
+        self.copies = 0
+        self.results = {}
+
+    def strategy(self, action):
+        if self.clone_strategy == 'auto':
+            return cli.ACTION_CLONE_STRATEGIES[action]
+        return self.clone_strategy
+
+    def fresh_upstream(self):
+        """ Returns the uri of an untouched copy of the template upstream.
+        """
+        self.copies += 1
+        return copy_upstream(self.template, os.path.join(
+            self.workdir, 'upstream-{}.git'.format(self.copies)))
+
+    def time(self, name, run, prepare=None):
+        """
+        Times `run` once per repeat. `prepare` is called untimed before every
+        run and its return value is passed to `run`.
+        """
+        runs = []
+        for _ in range(self.repeat):
+            argument = prepare() if prepare else None
+            with quiet():
+                start = default_timer()
+                run(argument)
+                runs.append(default_timer() - start)
+        runs.sort()
+        self.results[name] = {
+            'runs': runs,
+            'min': runs[0],
+            'median': runs[len(runs) // 2],
+        }
+        sys.stdout.write('{:<18} min {:>8.3f}s  median {:>8.3f}s\n'.format(
+            name, runs[0], runs[len(runs) // 2]))
+
+    def action(self, name, version):
+        """ Returns a run which performs an action end to end, like `reflex`.
+        """
+        def run(uri):
+            cli.preflight(name, uri, version)
+            with PrestineRepo(uri, clone_strategy=self.strategy(name),
+                              fetch_refs=cli.action_refs(name)) as repo:
+                cli.get_action(name)(repo, version)
+        return run
+
+    def open_release(self):
+        """ Returns the uri of a fresh upstream with an open release branch.
+        """
+        uri = self.fresh_upstream()
+        with quiet():
+            self.action('release', self.layout.next_release)(uri)
+        return uri
+
+    def run(self):
+        sys.stdout.write('Generating {}.\n'.format(', '.join(
+            '{} {}'.format(value, key)
+            for key, value in sorted(self.layout.as_dict().items()))))
+        start = default_timer()
+        make_upstream(self.template, self.layout)
+        sys.stdout.write('Generated in {:.1f}s.\n'.format(
+            default_timer() - start))
+
+        uri = self.fresh_upstream()
+
+        def setup(_):
+            with PrestineRepo(uri, clone_strategy=self.strategy('close')):
+                pass
+        self.time('setup', setup)
+
+        with PrestineRepo(uri, clone_strategy=self.strategy('close')) as repo:
+            def branches(_):
+                repo._refs = None
+                repo.branches()
+            self.time('branches', branches)
+
+            def last_release(_):
+                repo._last_releases = {}
+                repo.get_last_release('origin/main')
+            self.time('get_last_release', last_release)
+
+            # History walks before and after the repo is maintained the way
+            # long-lived repos are, to show what the commit-graph buys.
+            def describe(_):
+                repo.git('describe', '--abbrev=0', 'origin/develop')
+
+            def merge_base(_):
+                repo.git('merge-base', 'origin/main', 'origin/develop')
+            self.time('describe', describe)
+            self.time('merge-base', merge_base)
+            repo.maintain()
+            self.time('describe+maint', describe)
+            self.time('merge-base+maint', merge_base)
+            for name in ('describe', 'merge-base'):
+                before = self.results[name]['median']
+                after = self.results[name + '+maint']['median']
+                sys.stdout.write('{:<18} {:.1f}x faster when maintained\n'
+                                 .format(name, before / after if after else 0))
+
+        self.time('release', self.action('release', self.layout.next_release),
+                  self.fresh_upstream)
+        self.time('hotfix', self.action('hotfix', self.layout.next_hotfix),
+                  self.fresh_upstream)
+        self.time('complete_release',
+                  self.action('close', self.layout.next_release),
+                  self.open_release)
+        return self.results
+
+
+def environment():
+    """ Describes what the benchmarks ran on, so results can be told apart.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    revision = run_git(root, 'describe', '--always', '--dirty', check=False)
+    return {
+        'reflex': revision.stdout.strip() or 'unknown',
+        'git': run_git(None, 'version').stdout.strip(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Prints how the medians of two result sets differ. Returns the names of
+    the benchmarks which got slower by more than threshold percent and more
+    than NOISE seconds.
+    """
+    slower = []
+    sys.stdout.write('\n{:<18} {:>10} {:>10} {:>8}\n'.format(
+        'benchmark', 'baseline', 'current', 'change'))
+    for name, result in sorted(current.items()):
+        if name not in baseline:
+            continue
+        before = baseline[name]['median']
+        after = result['median']
+        change = (after - before) / before * 100 if before else 0.0
+        flag = ''
+        if change > threshold and after - before > NOISE:
+            slower.append(name)
+            flag = '  slower'
+        sys.stdout.write('{:<18} {:>9.3f}s {:>9.3f}s {:>+7.1f}%{}\n'.format(
+            name, before, after, change, flag))
+    return slower
+
+
+@click.command()
+@click.option('--commits', default=200, help='Commits on main.')
+@click.option('--files', default=50, help='Files the commits change.')
+@click.option('--branches', default=20, help='Feature branches.')
+@click.option('--releases', default=10, help='Release tags on main.')
+@click.option('--test-branches', default=2, help='Open test branches.')
+@click.option('--repeat', default=5, help='Timed runs per benchmark.')
+@click.option('--clone-strategy', default='auto',
+              type=click.Choice(['auto'] + sorted(CLONE_STRATEGIES)),
+              help='How much of each repo to clone. Picked per action by '
+                   'default.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None,
+              help='Save the results as JSON to this file.')
+@click.option('--compare', 'baseline', type=click.File('r'), default=None,
+              help='Compare with results saved by an earlier run.')
+@click.option('--threshold', default=25.0,
+              help='Percent a median may grow before it is a regression.')
+def main(commits, files, branches, releases, test_branches, repeat,
+         clone_strategy, output, baseline, threshold):
+    """ Benchmarks reflex on a synthetic repository.
+    """
+    for variable in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+        os.environ.setdefault(variable, 'bench')
+    for variable in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+        os.environ.setdefault(variable, 'bench@example.com')
+
+    layout = Layout(commits, files, branches, releases, test_branches)
+    workdir = mkdtemp(prefix='reflex-bench-')
+    try:
+        results = Bench(workdir, layout, max(repeat, 1), clone_strategy).run()
+    finally:
+        rmtree(workdir)
+
+    report = {
+        'environment': environment(),
+        'layout': layout.as_dict(),
+        'clone_strategy': clone_strategy,
+        'results': results,
+    }
+    if output:
+        with open(output, 'w') as saved:
+            json.dump(report, saved, indent=2, sort_keys=True)
+
+    if baseline:
+        earlier = json.load(baseline)
+        if earlier.get('layout') != report['layout']:
+            sys.stdout.write('Warning: the baseline used a different '
+                             'layout.\n')
+        if compare(earlier['results'], results, threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
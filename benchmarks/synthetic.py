@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Generates synthetic upstream repositories for the benchmarks. History is
+written with a single `git fast-import` so large repos are quick to build.
+"""
+
+import os
+from subprocess import PIPE, Popen
+
+from reflex.process import run_git
+
+IDENTITY = 'bench <bench@example.com>'
+
+
+class Layout():
+    """
+    The shape of a synthetic repository: how many commits main has, how many
+    files they touch, and how many feature branches, `release-*` tags and
+    open `test-*` branches there are.
+    """
+
+    def __init__(self, commits=200, files=50, branches=20, releases=10,
+                 test_branches=2):
+        self.commits = max(commits, releases, 1)
+        self.files = max(files, 1)
+        self.branches = branches
+        self.releases = max(releases, 1)
+        self.test_branches = test_branches
+
+    def as_dict(self):
+        return {
+            'commits': self.commits,
+            'files': self.files,
+            'branches': self.branches,
+            'releases': self.releases,
+            'test_branches': self.test_branches,
+        }
+
+    @property
+    def latest_release(self):
+        """ The version of the newest release tag.
+        """
+        return '1.{}.0'.format(self.releases - 1)
+
+    @property
+    def next_release(self):
+        """ A version the release action can open.
+        """
+        return '1.{}.0'.format(self.releases)
+
+    @property
+    def next_hotfix(self):
+        """ A version the hotfix action can open.
+        """
+        return '1.{}.1'.format(self.releases - 1)
+
+
+def data(text):
+    encoded = text.encode('utf-8')
+    return b'data ' + str(len(encoded)).encode('ascii') + b'\n' + encoded + \
+        b'\n'
+
+
+def fast_import_stream(layout):
+    """
+    Yields a `git fast-import` stream for a layout, one command at a time.
+
+    Main gets `commits` commits which each change one file. Release tags are
+    spread evenly over main with the newest on its tip, develop is a few
+    commits ahead of main and the feature and test branches point at commits
+    along main.
+    """
+    when = 1500000000
+    mark = 0
+    main = []
+
+    def commit(branch, message, path, parent):
+        lines = [
+            'commit refs/heads/{}'.format(branch),
+            'mark :{}'.format(mark),
+            'committer {} {} +0000'.format(IDENTITY, when + mark),
+        ]
+        stream = '\n'.join(lines).encode('ascii') + b'\n' + data(message)
+        if parent:
+            stream += 'from :{}\n'.format(parent).encode('ascii')
+        stream += 'M 100644 inline {}\n'.format(path).encode('ascii')
+        return stream + data('{} {}\n'.format(path, mark))
+
+    for i in range(layout.commits):
+        mark += 1
+        yield commit('main', 'commit {}'.format(i),
+                     'src/file-{}.txt'.format(i % layout.files),
+                     main[-1] if main else None)
+        main.append(mark)
+
+    def spread(count):
+        """ Picks `count` commits along main, ending on its tip. """
+        return [main[len(main) - 1 - (len(main) - 1) * i // max(count, 1)]
+                for i in reversed(range(count))]
+
+    for minor, tagged in enumerate(spread(layout.releases)):
+        yield ('tag release-1.{}.0\nfrom :{}\ntagger {} {} +0000\n'.format(
+            minor, tagged, IDENTITY, when + tagged).encode('ascii') +
+            data('release-1.{}.0'.format(minor)))
+
+    parent = main[-1]
+    for i in range(3):
+        mark += 1
+        yield commit('develop', 'develop {}'.format(i),
+                     'src/develop-{}.txt'.format(i), parent)
+        parent = mark
+
+    for i, target in enumerate(spread(layout.branches)):
+        yield 'reset refs/heads/feature-{}\nfrom :{}\n\n'.format(
+            i, target).encode('ascii')
+    for i, target in enumerate(spread(layout.test_branches)):
+        yield 'reset refs/heads/test-0.0.{}\nfrom :{}\n\n'.format(
+            i, target).encode('ascii')
+
+
+def make_upstream(path, layout):
+    """
+    Creates a bare repository at path with the history of a layout and
+    returns a file:// uri for it.
+    """
+    run_git(None, 'init', '--bare', path)
+    run_git(path, 'symbolic-ref', 'HEAD', 'refs/heads/main')
+    importer = Popen(['git', 'fast-import', '--quiet'], cwd=path, stdin=PIPE)
+    try:
+        for command in fast_import_stream(layout):
+            importer.stdin.write(command)
+    finally:
+        importer.stdin.close()
+    if importer.wait() != 0:
+        raise RuntimeError('git fast-import failed')
+    run_git(path, 'gc', '--quiet')
+    return copy_upstream(path, path)
+
+
+def copy_upstream(template, path):
+    """
+    Copies a template upstream to path so an action can change it, and
+    returns a file:// uri for the copy. Partial clones are allowed on it.
+    """
+    if template != path:
+        run_git(None, 'clone', '--quiet', '--bare', template, path)
+    run_git(path, 'config', 'uploadpack.allowFilter', 'true')
+    return 'file://{}'.format(os.path.abspath(path))
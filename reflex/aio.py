@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+asyncio counterparts of PrestineRepo and the reflex actions, so many repos
+can be driven from a single event loop. Requires Python 3.6 or later.
+
+The actions run the same plans as reflex.cli, and the repo helpers build
+their git commands with the same functions as PrestineRepo, so only how git
+is run and awaited lives here.
+"""
+
+import asyncio
+import os
+import time
+from asyncio.subprocess import PIPE
+from functools import wraps
+from inspect import isawaitable, isgenerator
+
+from reflex.cli import (
+    ACTION_CLONE_STRATEGIES, action_refs, close_plan, create_release_plan,
+    hotfix_plan, release_plan,
+)
+from reflex.process import (
+    GitResult, Watchdog, decode, environment, failure, git_version, notify,
+    time_left, timed_out,
+)
+from reflex.refs import RefIndex
+from reflex.refstore import read_refs
+from reflex.repo import (
+    MERGE_TREE_VERSION, REF_COMMANDS, PrestineRepo, PushBatch, answer,
+    commit_merge_command, describe_command, latest_release,
+    merge_tree_command, merge_tree_result, merged_releases_command,
+    push_command, raise_conflicts, tag_command,
+)
+from reflex.trace import phase
+
+CHUNK_SIZE = 64 * 1024
+
+
+def in_phase(name):
+    """ Decorator which runs a coroutine function inside a phase.
+    """
+    def decorator(function):
+        @wraps(function)
+        async def wrapper(*args, **kwargs):
+            with phase(name):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def run_git(cwd, *args, check=True, env=None, timeout=None):
+    """ Coroutine version of reflex.process.run_git.
+    """
+    command = ['git'] + list(args)
+    start = time.time()
+    process = await asyncio.create_subprocess_exec(
+        *command, cwd=cwd, stdout=PIPE, stderr=PIPE,
+        **environment({'env': env, 'timeout': timeout}))
+    watchdog = Watchdog(process, timeout)
+    try:
+        stdout, stderr = await process.communicate()
+    finally:
+        watchdog.stop()
+    notify(command, cwd, start, process.returncode, len(stdout), len(stderr))
+    if watchdog.expired:
+        raise timed_out(command, timeout)
+    result = GitResult(command, process.returncode, decode(stdout),
+                       decode(stderr))
+    if result.returncode != 0 and check:
+        raise failure(command, result.stderr)
+    return result
+
+
+async def stream_git(cwd, *args, env=None, timeout=None):
+    """
+    Async generator version of reflex.process.stream_git. Closing it early
+    stops the command.
+    """
+    command = ['git'] + list(args)
+    start = time.time()
+    read = 0
+    process = await asyncio.create_subprocess_exec(
+        *command, cwd=cwd, stdout=PIPE, stderr=PIPE,
+        **environment({'env': env, 'timeout': timeout}))
+    watchdog = Watchdog(process, timeout)
+    # Drain stderr alongside stdout so git never blocks on a full pipe.
+    stderr = asyncio.ensure_future(process.stderr.read())
+    try:
+        # Lines are split by hand as StreamReader limits the length of lines.
+        pending = b''
+        while True:
+            chunk = await process.stdout.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            read += len(chunk)
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield decode(line)
+        if pending:
+            yield decode(pending)
+    finally:
+        if process.returncode is None and not process.stdout.at_eof():
+            process.kill()
+        await process.wait()
+        watchdog.stop()
+        errors = await stderr
+        notify(command, cwd, start, process.returncode, read, len(errors))
+        errors = decode(errors)
+    if watchdog.expired:
+        raise timed_out(command, timeout)
+    if process.returncode != 0:
+        raise failure(command, errors)
+
+
+class AsyncPrestineRepo(PrestineRepo):
+    """
+    An async context with a temporary clone of a given repository.
+
+    It takes the same options as PrestineRepo, except that it always clones
+    into a temporary directory and can not lease a workspace from a pool.
+    Every helper which runs git is a coroutine. The ref index has to be
+    loaded with `load_refs` before `refs` is used directly; the helpers take
+    care of this themselves.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.pool:
+            raise ValueError(
+                "AsyncPrestineRepo can not lease workspaces from a pool.")
+
+    async def __aenter__(self):
+        try:
+            self.start_ssh()
+            await self.setup()
+        except BaseException:
+            # Cancelling a clone cleans up after it too.
+            await self.__aexit__()
+            raise
+        return self
+
+    async def setup(self):
+        """ See PrestineRepo.setup.
+        """
+        if not self.cache:
+            await self.clone(None)
+            return
+
+        def update():
+            with phase('fetch'):
+                return self.cache.update(self.clone_uri, self.env,
+                                         self.timeout, self.deadline)
+
+        loop = asyncio.get_event_loop()
+        lock = await loop.run_in_executor(
+            None, self.cache.lock, self.clone_uri, self.deadline)
+        try:
+            mirror = await loop.run_in_executor(None, update)
+            await self.clone(mirror)
+        finally:
+            lock.close()
+        await loop.run_in_executor(None, self.cache.evict, mirror)
+
+    async def __aexit__(self, *exc):
+        await asyncio.get_event_loop().run_in_executor(None, self.__exit__)
+
+    async def clone(self, mirror):
+        """ See PrestineRepo.clone.
+        """
+        for name, args in self.setup_commands(mirror):
+            with phase(name):
+                await self.git(*args)
+
+    async def git(self, *args):
+        """ See PrestineRepo.git.
+        """
+        result = await self._git(*args)
+        if args and args[0] in REF_COMMANDS:
+            self._refs = None
+            self._last_releases = {}
+        return result
+
+    def _git(self, *args, **options):
+        return run_git(self.dir, *args, env=self.env,
+                       timeout=time_left(self.timeout, self.deadline),
+                       **options)
+
+    def stream(self, *args):
+        """ See PrestineRepo.stream.
+        """
+        return stream_git(self.dir, *args, env=self.env,
+                          timeout=time_left(self.timeout, self.deadline))
+
+    @property
+    def refs(self):
+        """ The RefIndex for the repo, as last loaded by load_refs.
+        """
+        return self._refs
+
+    async def load_refs(self):
+        """
+        Loads the RefIndex for the repo unless it is already loaded, and
+        returns it. See PrestineRepo.refs.
+        """
+        if self._refs is None:
+            lines = read_refs(os.path.join(self.dir, '.git'))
+            if lines is None:
+                lines = [line async for line in self.stream(
+                    'for-each-ref', '--format=%(objectname) %(refname)')]
+            self._refs = RefIndex.parse(lines)
+        return self._refs
+
+    async def branches(self, match=None):
+        """ See PrestineRepo.branches.
+        """
+        await self.load_refs()
+        return PrestineRepo.branches(self, match)
+
+    async def branch_exists(self, full_branch_name):
+        """ See PrestineRepo.branch_exists.
+        """
+        await self.load_refs()
+        return PrestineRepo.branch_exists(self, full_branch_name)
+
+    async def checkout(self, branch_name, reset_sha=None):
+        """ See PrestineRepo.checkout.
+        """
+        if await self.branch_exists('origin/{}'.format(branch_name)):
+            await self._git('checkout', branch_name)
+        else:
+            await self._git('checkout', '-b', branch_name)
+        self.refs.add('refs/heads/{}'.format(branch_name))
+        if reset_sha:
+            await self._git('reset', '--hard', reset_sha)
+
+    async def branch(self, branch_name, sha):
+        """ See PrestineRepo.branch.
+        """
+        await self.load_refs()
+        refname = 'refs/heads/{}'.format(branch_name)
+        result = await self._git('update-ref', refname,
+                                 '{}^{{commit}}'.format(sha))
+        self.refs.add(refname)
+        return result
+
+    async def is_ancestor(self, ancestor, sha):
+        """ See PrestineRepo.is_ancestor.
+        """
+        return answer(await self._git(
+            'merge-base', '--is-ancestor', ancestor, sha, check=False))
+
+    @in_phase('merge')
+    async def merge(self, branch_name, base, other, message):
+        """ See PrestineRepo.merge.
+        """
+        commit = await self.merge_commit(base, other, message)
+        await self.branch(branch_name, commit)
+        return commit
+
+    async def merge_commit(self, base, other, message):
+        """ See PrestineRepo.merge_commit.
+        """
+        if await self.is_ancestor(other, base):
+            return (await self._git(
+                'rev-parse', '{}^{{commit}}'.format(base))).stdout.strip()
+
+        version = git_version(time_left(self.timeout, self.deadline))
+        if version < MERGE_TREE_VERSION:
+            await self._git('checkout', '--detach', base)
+            await self._git('merge', '--no-ff', '--message', message, other)
+            return (await self._git('rev-parse', 'HEAD')).stdout.strip()
+
+        result = await self._merge_tree(base, other)
+        return (await self._git(*commit_merge_command(
+            result, base, other, message))).stdout.strip()
+
+    async def _merge_tree(self, base, other):
+        return merge_tree_result(await self._git(
+            *merge_tree_command(base, other), check=False))
+
+    async def conflicts(self, base, other):
+        """ See PrestineRepo.conflicts.
+        """
+        result = await self._merge_tree(base, other)
+        return result.lines()[1:] if result.returncode == 1 else []
+
+    @in_phase('validate')
+    async def check_merges(self, merges, labels=None):
+        """ See PrestineRepo.check_merges. The merges are checked at once.
+        """
+        if not merges:
+            return
+        version = git_version(time_left(self.timeout, self.deadline))
+        if version < MERGE_TREE_VERSION:
+            return
+        found = await asyncio.gather(
+            *[self.conflicts(base, other) for base, other in merges])
+        raise_conflicts(merges, found, labels)
+
+    @in_phase('tag')
+    async def tag(self, tag, message, sha=None):
+        """ See PrestineRepo.tag.
+        """
+        await self.load_refs()
+        result = await self._git(*tag_command(tag, message, sha))
+        self.refs.add('refs/tags/{}'.format(tag))
+        self._last_releases = {}
+        return result
+
+    @in_phase('push')
+    async def push(self, *refspecs, atomic=False):
+        """ See PrestineRepo.push.
+        """
+        await self.load_refs()
+        result = await self._git(*push_command(refspecs, atomic))
+        for refspec in refspecs:
+            self.refs.pushed(refspec)
+        return result
+
+    def push_batch(self):
+        """ Returns an AsyncPushBatch to collect ref updates for one push.
+        """
+        return AsyncPushBatch(self)
+
+    async def releases(self):
+        """ See PrestineRepo.releases.
+        """
+        return (await self.load_refs()).release_tags()
+
+    @in_phase('validate')
+    async def get_last_release(self, sha):
+        """ See PrestineRepo.get_last_release.
+        """
+        commit = (await self._git('rev-parse', '--verify',
+                                  '{}^{{commit}}'.format(sha))).stdout.strip()
+        if commit not in self._last_releases:
+            merged = (await self._git(
+                *merged_releases_command(commit))).lines()
+            self._last_releases[commit] = latest_release(merged, sha)
+        return self._last_releases[commit]
+
+    async def get_last_tag(self, sha=None, match=None):
+        """ See PrestineRepo.get_last_tag.
+        """
+        return (await self.git(*describe_command(sha, match))).stdout.strip()
+
+
+class AsyncPushBatch(PushBatch):
+    """ A PushBatch for an AsyncPrestineRepo.
+    """
+
+    async def push(self):
+        """ See PushBatch.push.
+        """
+        if self.refspecs:
+            return await self.repo.push(*self.refspecs, atomic=True)
+
+
+async def run_plan(plan):
+    """
+    Runs a plan on an AsyncPrestineRepo, awaiting each coroutine it yields.
+    See reflex.cli.run_plan.
+    """
+    result, error = None, None
+    while True:
+        try:
+            if error is not None:
+                step = plan.throw(error)
+            else:
+                step = plan.send(result)
+        except StopIteration:
+            return
+        result, error = None, None
+        try:
+            if isgenerator(step):
+                result = await run_plan(step)
+            elif isawaitable(step):
+                result = await step
+            else:
+                result = step
+        except BaseException as failed:
+            error = failed
+
+
+async def run_action(action, clone_uri, version, prod_branch=None,
+                     dev_branches=None, cache=None, clone_strategy='auto',
+                     ssh_multiplex=False, timeout=None, deadline=None,
+                     journal=None):
+    """
+    Performs the named action ('release', 'hotfix' or 'close') on a fresh
+    AsyncPrestineRepo of the given clone uri, recording its steps in the
+    journal if one is given.
+    """
+    if clone_strategy == 'auto':
+        clone_strategy = ACTION_CLONE_STRATEGIES[action]
+    async with AsyncPrestineRepo(clone_uri, prod_branch, dev_branches, cache,
+                                 clone_strategy, ssh_multiplex,
+                                 action_refs(action, prod_branch,
+                                             dev_branches),
+                                 timeout=timeout, deadline=deadline) as repo:
+        await get_action(action)(repo, version, journal=journal)
+
+
+def get_action(name):
+    """ Returns the coroutine function which performs the named action.
+    """
+    return {
+        'release': release,
+        'hotfix': hotfix,
+        'close': complete_release,
+    }[name]
+
+
+async def complete_release(repo, version=None, journal=None, **kwargs):
+    """ See reflex.cli.close_plan.
+    """
+    await run_plan(close_plan(repo, version, journal))
+
+
+async def hotfix(repo, version=None, journal=None):
+    """ See reflex.cli.hotfix_plan.
+    """
+    await run_plan(hotfix_plan(repo, version, journal))
+
+
+async def release(repo, version=None, journal=None):
+    """ See reflex.cli.release_plan.
+    """
+    await run_plan(release_plan(repo, version, journal))
+
+
+async def create_release(repo, sha, version, journal=None):
+    """ See reflex.cli.create_release_plan.
+    """
+    await run_plan(create_release_plan(repo, sha, version, journal))
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+import click
+
+from reflex import cli
+from reflex.cache import MirrorCache
+from reflex.repo import CLONE_STRATEGIES, PrestineRepo
+
+ACTIONS = ('release', 'hotfix', 'close')
+
+
+@click.command()
+@click.argument('manifest', type=click.File('r'))
+@click.option('--workers', type=int, default=4,
+              help='How many repos to work on at the same time.')
+@click.option('--cache-dir', envvar='REFLEX_CACHE_DIR', default=None,
+              help='Keep mirrors of repos in this directory between runs.')
+@click.option('--clone-strategy', default='auto',
+              type=click.Choice(['auto'] + sorted(CLONE_STRATEGIES)),
+              help='How much of each repo to clone. Picked per action by '
+                   'default.')
+@click.option('--ssh-multiplex/--no-ssh-multiplex', default=False,
+              envvar='REFLEX_SSH_MULTIPLEX',
+              help='Share one SSH connection between the git commands of '
+                   'each job.')
+def main(manifest, workers, cache_dir, clone_strategy, ssh_multiplex):
+    """ Runs the release actions listed in a JSON manifest across many repos.
+
+    The manifest is a list of jobs such as
+    {"repo": "git@github.com:brightmd/reflex.git", "version": "1.0.1",
+    "action": "release"}, which may also set "production_branch" and
+    "development_branches".
+    """
+    jobs = json.load(manifest)
+    for job in jobs:
+        error = validate_job(job)
+        if error:
+            sys.stderr.write("Invalid job {}.\n{}\n".format(
+                json.dumps(job), error))
+            sys.exit(1)
+
+    cache = MirrorCache(cache_dir) if cache_dir else None
+    results, elapsed = run_batch(jobs, workers, cache, clone_strategy,
+                                 ssh_multiplex)
+
+    failed = [result for result in results if not result.ok]
+    for result in results:
+        sys.stdout.write("{}\n".format(result))
+    sys.stdout.write("Finished {} jobs in {:.1f}s, {} failed.\n".format(
+        len(results), elapsed, len(failed)))
+    if failed:
+        sys.exit(1)
+
+
+def validate_job(job):
+    """ Returns why a manifest job can not be run, or None if it can.
+    """
+    for key in ('repo', 'version', 'action'):
+        if key not in job:
+            return "Missing '{}'.".format(key)
+    if job['action'] not in ACTIONS:
+        return "Unknown action '{}', expected one of {}.".format(
+            job['action'], ', '.join(ACTIONS))
+    return None
+
+
+class JobResult():
+    """ The outcome of running a single manifest job.
+    """
+
+    def __init__(self, job, elapsed, error=None):
+        self.job = job
+        self.elapsed = elapsed
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        status = 'ok' if self.ok else 'FAILED'
+        line = "{:<6} {:<7} {:<10} {} ({:.1f}s)".format(
+            status, self.job['action'], self.job['version'], self.job['repo'],
+            self.elapsed)
+        if not self.ok:
+            line += "\n         {}".format(self.error)
+        return line
+
+
+def run_job(job, cache=None, clone_strategy='auto', ssh_multiplex=False):
+    """
+    Runs one manifest job in its own PrestineRepo. Failures are captured in
+    the returned JobResult rather than raised.
+    """
+    action = job['action']
+    if clone_strategy == 'auto':
+        clone_strategy = cli.ACTION_CLONE_STRATEGIES[action]
+
+    prod_branch = job.get('production_branch')
+    dev_branches = job.get('development_branches')
+    fetch_refs = cli.action_refs(action, prod_branch, dev_branches)
+
+    start = time.time()
+    try:
+        with PrestineRepo(job['repo'], prod_branch, dev_branches, cache,
+                          clone_strategy, ssh_multiplex, fetch_refs) as repo:
+            cli.get_action(action)(repo, job['version'])
+    except Exception as error:
+        return JobResult(job, time.time() - start, '{}: {}'.format(
+            type(error).__name__, error))
+    return JobResult(job, time.time() - start)
+
+
+def run_batch(jobs, workers=4, cache=None, clone_strategy='auto',
+              ssh_multiplex=False):
+    """
+    Runs manifest jobs concurrently on a pool of worker threads. Jobs for the
+    same repo run one after another, in manifest order, on the same worker.
+    Returns the JobResults in manifest order and the total wall time.
+    """
+    groups = []
+    by_repo = {}
+    for job in jobs:
+        if job['repo'] not in by_repo:
+            by_repo[job['repo']] = []
+            groups.append(by_repo[job['repo']])
+        by_repo[job['repo']].append(job)
+
+    def run_group(group):
+        return [run_job(job, cache, clone_strategy, ssh_multiplex)
+                for job in group]
+
+    start = time.time()
+    pool = ThreadPool(max(1, min(workers, len(groups))))
+    try:
+        finished = pool.map(run_group, groups)
+    finally:
+        pool.close()
+        pool.join()
+
+    results = dict((id(result.job), result)
+                   for group in finished for result in group)
+    return [results[id(job)] for job in jobs], time.time() - start
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fcntl
+import os
+import time
+from hashlib import sha1
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from reflex.error import GitTimeout
+from reflex.maintenance import maintain
+from reflex.pool import acquire
+from reflex.process import run_git, time_left
+
+
+class MirrorCache():
+    """
+    An on-disk cache of bare mirrors, one for each clone uri.
+
+    Mirrors live under the given root directory and are updated with an
+    incremental fetch each time they are used, so a PrestineRepo only has to
+    make a local (hardlinked) clone of the mirror instead of cloning the whole
+    remote. Mirrors which have not been used for `max_age` seconds, or the
+    least recently used mirrors once the cache grows past `max_size` bytes,
+    are evicted. The commit-graph and multi-pack-index of a mirror are
+    updated after every fetch.
+
+    A mirror is only updated or cloned from while holding its lock, so runs
+    which share a cache never fetch into the same mirror at once, and
+    eviction skips mirrors which are locked by someone else.
+    """
+
+    def __init__(self, root, max_size=None, max_age=None):
+        self.root = root
+        self.max_size = max_size
+        self.max_age = max_age
+
+    def path(self, clone_uri):
+        """ Returns the location of the mirror for a given clone uri.
+        """
+        key = sha1(clone_uri.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, '{}.git'.format(key))
+
+    def lock(self, clone_uri, deadline=None):
+        """
+        Waits for an exclusive lock on the mirror of a clone uri and returns
+        the open lock file. Closing it, or leaving a `with` block on it,
+        releases the lock, as does the operating system if the process dies.
+        Raises GitTimeout if the lock is still held by someone else when the
+        deadline, a time.time() timestamp, passes.
+        """
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        lock = open('{}.lock'.format(self.path(clone_uri)), 'a')
+        try:
+            if not acquire(lock, time_left(None, deadline)):
+                raise GitTimeout(
+                    "The deadline passed waiting for the mirror of {}."
+                    .format(clone_uri), [])
+        except Exception:
+            lock.close()
+            raise
+        return lock
+
+    def mirrors(self):
+        """ Lists the mirrors in the cache, least recently used first.
+        """
+        if not os.path.isdir(self.root):
+            return []
+        mirrors = [os.path.join(self.root, name)
+                   for name in os.listdir(self.root) if name.endswith('.git')]
+        return sorted(mirrors, key=os.path.getmtime)
+
+    def update(self, clone_uri, env=None, timeout=None, deadline=None):
+        """
+        Creates or incrementally fetches the mirror of a clone uri and returns
+        its location. Git is run with env as its environment if it is given,
+        killed after timeout seconds and not started after the deadline, a
+        time.time() timestamp. Callers hold the mirror's lock until they are
+        done cloning from it.
+        """
+        mirror = self.path(clone_uri)
+        if os.path.isdir(mirror):
+            run_git(mirror, 'fetch', '--prune', 'origin', env=env,
+                    timeout=time_left(timeout, deadline))
+        else:
+            if not os.path.isdir(self.root):
+                os.makedirs(self.root)
+            # Clone next to the final location and move it into place so an
+            # interrupted clone never looks like a usable mirror.
+            staging = mkdtemp(dir=self.root)
+            try:
+                run_git(staging, 'clone', '--mirror', clone_uri, staging,
+                        env=env, timeout=time_left(timeout, deadline))
+            except Exception:
+                rmtree(staging)
+                raise
+            try:
+                os.rename(staging, mirror)
+            except OSError:
+                rmtree(staging)
+                # Someone who did not take the lock moved their clone into
+                # place first, which is just as good.
+                if not os.path.isdir(mirror):
+                    raise
+        maintain(mirror, env, timeout=timeout, deadline=deadline)
+        os.utime(mirror, None)
+        return mirror
+
+    def evict(self, keep=None):
+        """
+        Removes mirrors older than max_age and then the least recently used
+        mirrors until the cache fits in max_size. The mirror given as `keep`
+        is never removed, nor is a mirror which is locked because it is in
+        use. Returns the list of evicted mirrors.
+        """
+        evicted = []
+        mirrors = [mirror for mirror in self.mirrors() if mirror != keep]
+
+        if self.max_age is not None:
+            oldest = time.time() - self.max_age
+            for mirror in list(mirrors):
+                if os.path.getmtime(mirror) < oldest:
+                    mirrors.remove(mirror)
+                    evicted.append(mirror)
+
+        if self.max_size is not None:
+            sizes = dict((mirror, disk_usage(mirror)) for mirror in mirrors)
+            total = sum(sizes.values())
+            if keep:
+                total += disk_usage(keep)
+            while mirrors and total > self.max_size:
+                mirror = mirrors.pop(0)
+                total -= sizes[mirror]
+                evicted.append(mirror)
+
+        return [mirror for mirror in evicted if remove_unlocked(mirror)]
+
+
+def remove_unlocked(mirror):
+    """
+    Removes a mirror unless its lock is held. Returns True if it was removed.
+    """
+    with open('{}.lock'.format(mirror), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            return False
+        if os.path.isdir(mirror):
+            rmtree(mirror)
+        return True
+
+
+def disk_usage(path):
+    """ Returns the number of bytes used by the files under a directory.
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
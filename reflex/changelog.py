@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Release notes built from the commits between two release tags. Every stage
+is a generator over a single streamed `git log`, so notes for releases with
+any number of commits are written in constant memory.
+"""
+
+import json
+import re
+
+from reflex.error import GitCommandError, InvalidGitReference
+
+# Fields of a commit as `git log` writes them, separated by unit separators
+# since subjects may contain anything else.
+LOG_FORMAT = '--format=%H%x1f%P%x1f%an%x1f%s'
+
+FORMATS = ('markdown', 'json')
+
+
+class Commit():
+    """ A commit as listed in release notes.
+    """
+
+    def __init__(self, sha, parents, author, subject, tickets=()):
+        self.sha = sha
+        self.parents = parents
+        self.author = author
+        self.subject = subject
+        self.tickets = list(tickets)
+
+    @property
+    def merge(self):
+        return len(self.parents) > 1
+
+    @classmethod
+    def parse(cls, line):
+        """ Builds a commit from a line written with LOG_FORMAT.
+        """
+        sha, parents, author, subject = line.split('\x1f', 3)
+        return cls(sha, parents.split(), author, subject)
+
+    def as_dict(self):
+        return {
+            'sha': self.sha,
+            'parents': self.parents,
+            'author': self.author,
+            'subject': self.subject,
+            'tickets': self.tickets,
+        }
+
+
+def log(repo, since, until):
+    """
+    Yields the commits which are reachable from `until` but not from
+    `since`, newest first. Topological order keeps the commits a merge
+    brought in right after the merge.
+    """
+    for line in repo.stream('log', '--topo-order', LOG_FORMAT,
+                            '{}..{}'.format(since, until)):
+        if line:
+            yield Commit.parse(line)
+
+
+def grouped(commits):
+    """
+    Yields (commit, merge) pairs where merge is the merge commit which
+    brought the commit in, or None for commits on the first-parent line,
+    which are the merges themselves and commits made directly on the branch.
+    Only the merge being read is remembered.
+    """
+    mainline = None
+    merge = None
+    for commit in commits:
+        if mainline is None or commit.sha == mainline:
+            mainline = commit.parents[0] if commit.parents else ''
+            merge = commit if commit.merge else None
+            yield commit, None
+        else:
+            yield commit, merge
+
+
+def with_tickets(entries, pattern):
+    """
+    Adds the ticket ids which match a pattern, such as r'[A-Z]+-\\d+', in
+    the subject of each commit to its tickets.
+    """
+    pattern = re.compile(pattern)
+    for commit, merge in entries:
+        commit.tickets = [match.group(0)
+                          for match in pattern.finditer(commit.subject)]
+        yield commit, merge
+
+
+def markdown(entries, title, since):
+    """
+    Yields the lines of release notes in Markdown, with the commits a merge
+    brought in listed under it.
+    """
+    yield '# {}\n'.format(title)
+    yield '\nChanges since {}.\n\n'.format(since)
+    for commit, merge in entries:
+        line = '{} ({})'.format(commit.subject, commit.sha[:10])
+        if commit.tickets:
+            line = '[{}] {}'.format(', '.join(commit.tickets), line)
+        yield '{}- {}\n'.format('  ' if merge else '', line)
+
+
+def as_json(entries, title, since):
+    """
+    Yields release notes as a JSON document in pieces, with every commit
+    naming the merge which brought it in.
+    """
+    yield '{{"release": {}, "since": {}, "commits": ['.format(
+        json.dumps(title), json.dumps(since))
+    separator = '\n'
+    for commit, merge in entries:
+        document = commit.as_dict()
+        document['merged_by'] = merge.sha if merge else None
+        yield separator + json.dumps(document, sort_keys=True)
+        separator = ',\n'
+    yield '\n]}\n'
+
+
+def previous_release(repo, release_tag):
+    """
+    Returns the release production was at before a release was merged into
+    it, which is the last release reachable from the first parent of the
+    release tag, or None if there is none.
+    """
+    try:
+        return repo.get_last_release('{}^1'.format(release_tag))
+    except (GitCommandError, InvalidGitReference):
+        return None
+
+
+def write_notes(repo, release_tag, out, format='markdown', since=None,
+                ticket_pattern=None):
+    """
+    Writes the release notes for a release tag to a file object, covering
+    the commits since the previous release, or since a given ref. Returns
+    the ref the notes start from, or None if there is none to start from.
+    """
+    since = since or previous_release(repo, release_tag)
+    if since is None:
+        return None
+    entries = grouped(log(repo, since, release_tag))
+    if ticket_pattern:
+        entries = with_tickets(entries, ticket_pattern)
+    render = markdown if format == 'markdown' else as_json
+    for chunk in render(entries, release_tag, since):
+        out.write(chunk)
+    return since
@@ -1,16 +1,33 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import re
 import sys
+import time
+from inspect import isgenerator
 
 import click
 
-from reflex.repo import PrestineRepo
+from reflex.cache import MirrorCache
+from reflex.changelog import FORMATS, write_notes
+from reflex.journal import Journal
+from reflex.pool import WorkspacePool
+from reflex.process import run_git, time_left
+from reflex.refs import RefIndex
+from reflex.repo import CLONE_STRATEGIES, PrestineRepo
+from reflex.trace import Tracer, in_phase, phase
+from reflex.version import Version
 from reflex.error import (
     DuplicateGitReference, InvalidGitReference, InvalidUpgradePath,
 )
 
+# The cheapest clone strategy each action can run on. Opening a branch only
+# moves refs around existing commits while closing one merges trees.
+ACTION_CLONE_STRATEGIES = {
+    'release': 'treeless',
+    'hotfix': 'treeless',
+    'close': 'blobless',
+}
+
 
 @click.command()
 @click.argument('version')
@@ -25,9 +42,61 @@ from reflex.error import (
 @click.option('--development-branch', 'develop_branch', default=['develop'],
               help='The development branch where new work should live.',
               multiple=True)
-def main(version, git_uri, prod_branch, develop_branch, **kwargs):
+@click.option('--cache-dir', envvar='REFLEX_CACHE_DIR', default=None,
+              help='Keep mirrors of repos in this directory between runs.')
+@click.option('--cache-max-size', type=int, default=None,
+              help='Evict cached mirrors beyond this total size in MB.')
+@click.option('--cache-max-age', type=float, default=None,
+              help='Evict cached mirrors unused for this many days.')
+@click.option('--clone-strategy', default='auto',
+              type=click.Choice(['auto'] + sorted(CLONE_STRATEGIES)),
+              help='How much of the repo to clone. Picked per action by '
+                   'default.')
+@click.option('--preflight/--no-preflight', 'check_remote', default=True,
+              help='Check the remote for problems before cloning it.')
+@click.option('--ssh-multiplex/--no-ssh-multiplex', default=False,
+              envvar='REFLEX_SSH_MULTIPLEX',
+              help='Share one SSH connection between the git commands of a '
+                   'run.')
+@click.option('--profile', type=click.Path(dir_okay=False), default=None,
+              help='Write a Chrome trace of every git command to this file '
+                   'and print the time spent in each phase.')
+@click.option('--journal-dir', envvar='REFLEX_JOURNAL_DIR', default=None,
+              help='Record the finished steps of each run in this directory '
+                   'so an interrupted run can be resumed.')
+@click.option('--resume', is_flag=True,
+              help='Resume an interrupted run from its journal.')
+@click.option('--workspace-dir', envvar='REFLEX_WORKSPACE_DIR', default=None,
+              help='Keep a workspace for each repo in this directory, which '
+                   'is reset instead of cloned and used by one run at a '
+                   'time.')
+@click.option('--workspace-timeout', type=float, default=None,
+              help='Give up after waiting this many seconds for a workspace '
+                   'another run is using.')
+@click.option('--timeout', type=float, envvar='REFLEX_GIT_TIMEOUT',
+              default=None,
+              help='Kill a git command which runs for longer than this many '
+                   'seconds.')
+@click.option('--deadline', type=float, envvar='REFLEX_DEADLINE',
+              default=None,
+              help='Give up on the whole run after this many seconds.')
+@click.option('--release-notes', type=click.File('w'), default=None,
+              help='When closing a release, write notes of the commits since '
+                   'the previous release to this file.')
+@click.option('--notes-format', type=click.Choice(FORMATS),
+              default='markdown', help='The format of the release notes.')
+@click.option('--ticket-pattern', default=None,
+              help='A regular expression for ticket ids, such as '
+                   '"[A-Z]+-[0-9]+", to pick out of commit subjects in the '
+                   'release notes.')
+def main(version, git_uri, prod_branch, develop_branch, cache_dir,
+         cache_max_size, cache_max_age, clone_strategy, check_remote,
+         ssh_multiplex, profile, journal_dir, resume, workspace_dir,
+         workspace_timeout, timeout, deadline, release_notes, notes_format,
+         ticket_pattern, **kwargs):
     """ Tool for the automating the release process in a repository.
     """
+    expires = None if deadline is None else time.time() + deadline
     action = []
     for flag, enabled in kwargs.items():
         if enabled:
@@ -36,128 +105,369 @@ def main(version, git_uri, prod_branch, develop_branch, **kwargs):
         sys.stderr.write("Invalid subcommand.\nSpecify a single action.\n")
         sys.exit(1)
 
-    action = {
+    action_name, = action
+    action = get_action(action_name)
+
+    if resume and not journal_dir:
+        sys.stderr.write("Resuming a run needs a --journal-dir.\n")
+        sys.exit(1)
+    journal = Journal()
+    if journal_dir:
+        journal = Journal.open(journal_dir, git_uri, action_name, version)
+        if not resume:
+            journal.reset()
+
+    if clone_strategy == 'auto':
+        clone_strategy = ACTION_CLONE_STRATEGIES[action_name]
+
+    cache = None
+    if cache_dir:
+        cache = MirrorCache(
+            cache_dir,
+            max_size=cache_max_size and cache_max_size * 1024 * 1024,
+            max_age=cache_max_age and cache_max_age * 24 * 60 * 60)
+
+    pool = None
+    if workspace_dir:
+        pool = WorkspacePool(workspace_dir, workspace_timeout)
+
+    def check(env):
+        """ Checks the remote, returning True if there is nothing to do.
+        """
+        if resume and journal.steps:
+            if finished(journal, git_uri, time_left(timeout, expires), env):
+                sys.stdout.write("Nothing to resume, {} {} has already "
+                                 "finished.\n".format(action_name, version))
+                return True
+        elif check_remote:
+            preflight(action_name, git_uri, version,
+                      time_left(timeout, expires), env)
+        return False
+
+    def run():
+        repo = PrestineRepo(git_uri, prod_branch, develop_branch, cache,
+                            clone_strategy, ssh_multiplex,
+                            action_refs(action_name, prod_branch,
+                                        develop_branch), pool, timeout,
+                            expires and expires - time.time())
+        # Connect before checking the remote so the checks share the
+        # session's SSH connection with the rest of the run.
+        repo.start_ssh()
+        try:
+            done = check(repo.env)
+        except Exception:
+            repo.__exit__()
+            raise
+        if done:
+            repo.__exit__()
+            return
+        with repo:
+            action(repo, version, journal=journal)
+            if release_notes and action_name == 'close':
+                write_notes(repo, 'release-{}'.format(version), release_notes,
+                            notes_format, ticket_pattern=ticket_pattern)
+
+    if not profile:
+        return run()
+    with Tracer() as tracer:
+        try:
+            run()
+        finally:
+            tracer.write(profile)
+            sys.stderr.write(tracer.summary())
+
+
+def get_action(name):
+    """ Returns the function which performs the named action on a repo.
+    """
+    return {
         'release': release,
         'hotfix': hotfix,
         'close': complete_release,
-    }.get(action[0])
+    }[name]
+
+
+def action_refs(action, prod_branch=None, dev_branches=None):
+    """
+    Returns the refs an action reads from the remote: the branches it works
+    on, the test branches and the release tags. Everything else, such as
+    feature branches, can be left out of the fetch.
+    """
+    branches = {
+        'release': list(dev_branches or ['develop']),
+        'hotfix': [prod_branch or 'main'],
+        'close': [prod_branch or 'main'] + list(dev_branches or ['develop']),
+    }[action]
+    return ['refs/heads/{}'.format(branch) for branch in branches] + [
+        'refs/heads/test-*', 'refs/tags/release-*']
+
+
+@in_phase('validate')
+def preflight(action, clone_uri, version, timeout=None, env=None):
+    """ Checks a remote can take an action before anything is cloned.
+
+    All checks are answered from a single `git ls-remote`, so a duplicate or
+    missing test branch or an invalid upgrade path fails in one round trip.
+    The version is checked against the highest release tag on the remote.
+    Returns the RefIndex of the remote. The ls-remote is run with env as its
+    environment if it is given, and killed after timeout seconds.
+    """
+    result = run_git(None, 'ls-remote', '--heads', '--tags', clone_uri,
+                     env=env, timeout=timeout)
+    refs = RefIndex.parse_remote(result.lines())
+
+    testing_branch = 'test-{}'.format(version)
+    exists = 'origin/{}'.format(testing_branch) in refs.remotes
+    if action == 'close' and not exists:
+        raise InvalidGitReference("Unable to find {} to close release".format(
+            testing_branch))
+    if action != 'close' and exists:
+        raise DuplicateGitReference(
+            "Oops! Looks like {} already exists!\n".format(testing_branch))
 
-    with PrestineRepo(git_uri, prod_branch, develop_branch) as repo:
-        action(repo, version)
+    releases = refs.release_tags()
+    if releases:
+        validate_upgrade(releases[-1], version)
+    return refs
+
+
+@in_phase('validate')
+def finished(journal, clone_uri, timeout=None, env=None):
+    """
+    Returns True if the action a journal belongs to has already landed on
+    the remote, which is checked with a single `git ls-remote` against the
+    refs the action was about to push. The journal is updated to match.
+    """
+    if 'push' in journal:
+        return True
+    expected = journal.get('expect')
+    if not expected:
+        return False
+    result = run_git(None, 'ls-remote', clone_uri, *sorted(expected),
+                     env=env, timeout=timeout)
+    remote = dict(reversed(line.split('\t', 1)) for line in result.lines())
+    if any(remote.get(ref) != sha for ref, sha in expected.items()):
+        return False
+    journal.record('push')
+    return True
 
 
 def validate_upgrade(_from, to):
     """ Returns True if two versions can be upgraded with regard to semver.
-    """
-    ver_from_parts = _from.split('-')[-1].split('.')
-    ver_to_parts = to.split('-')[-1].split('.')
-    ver_parts = zip(ver_from_parts, ver_to_parts)
 
-    for ver_part in ver_parts:
-        if int(ver_part[0]) < int(ver_part[-1]):
-            return True
-        elif int(ver_part[0]) > int(ver_part[-1]):
-            break
+    Either version may be given as a tag name such as 'release-1.2.3'. Raises
+    InvalidVersion if one of them is not a semantic version.
+    """
+    if Version.parse(_from) < Version.parse(to):
+        return True
     raise InvalidUpgradePath(
         "Unable to upgrade from '{}' to '{}'.".format(_from, to))
 
 
-def complete_release(repo, version=None, **kwargs):
-    """ Closes a release branch.
+def complete_release(repo, version=None, journal=None, **kwargs):
+    """ Closes a release branch. See close_plan.
+    """
+    run_plan(close_plan(repo, version, journal))
+
+
+def hotfix(repo, version=None, journal=None):
+    """ Create a hotfix release branch.
+    """
+    run_plan(hotfix_plan(repo, version, journal))
+
+
+def release(repo, version=None, journal=None):
+    """ Create a normal release branch.
+    """
+    run_plan(release_plan(repo, version, journal))
+
 
-    This function performs a few tasks useful for closing a release branch.
+def create_release(repo, sha, version, journal=None):
+    """ Create a release branch for running tests.
+    """
+    run_plan(create_release_plan(repo, sha, version, journal))
+
+
+def run_plan(plan):
+    """
+    Runs a plan on a PrestineRepo.
+
+    Plans are generators which make an action's calls to a repo's helpers as
+    `result = yield repo.helper(...)`, so one plan drives both a PrestineRepo,
+    whose helpers return their result which is sent straight back, and an
+    AsyncPrestineRepo, whose coroutines reflex.aio.run_plan awaits. A plan may
+    also yield another plan to run it in its place. Errors are raised into
+    the plan so its phases are left in order.
+    """
+    result, error = None, None
+    while True:
+        try:
+            if error is not None:
+                step = plan.throw(error)
+            else:
+                step = plan.send(result)
+        except StopIteration:
+            return
+        result, error = None, None
+        try:
+            result = run_plan(step) if isgenerator(step) else step
+        except BaseException as failed:
+            error = failed
+
+
+def close_plan(repo, version=None, journal=None):
+    """ Plans closing a release branch.
+
+    This plan performs a few tasks useful for closing a release branch.
       - It first makes sure that the release branch can be closed with the
         given version by running through the validate_upgrade test.
-      - The function then creates a merge commit on the 'production' branch of
-        the repo and generates a release tag on the merge commit.
+      - The plan then writes a merge commit of the release branch into the
+        'production' branch as an object and makes sure it merges into every
+        'development' branch without conflicts, before any ref is changed.
+      - It points the 'production' branch at the merge commit and generates a
+        release tag on it.
       - Then merges the 'production' branch down to the 'development' branch.
       - Once all of the above complete successfully we push the local copy of
-        the repo up to the main repo.
-      - After the release branch has been merged successfully into 'production'
-        and 'development' we can delete the release branch from upstream.
+        the repo up to the main repo and delete the release branch from
+        upstream in a single atomic push, so either all of it lands or none.
+
+    Every step is recorded in the journal. Steps of an earlier run whose
+    result is already on origin are skipped, so only what is left is pushed.
     """
+    journal = journal or Journal()
     testing_branch = 'test-{}'.format(version)
     release_tag = 'release-{}'.format(version)
 
     sys.stdout.write("Closing {}.\n".format(testing_branch))
 
-    repo.checkout(repo.production_branch)
-    latest_release = repo.get_last_release(repo.production_branch)
-    validate_upgrade(latest_release, release_tag)
-
-    test_branches = [x for x in repo.branches('origin/test-*') if re.match(
-        r'origin/test-\d+(\.\d+){2}', x)]
-
-    if "origin/{}".format(testing_branch) not in test_branches:
-        raise InvalidGitReference("Unable to find {} to close release".format(
-            testing_branch))
-
-    # First we merge the release branch into branches locally.
-    repo.checkout(repo.production_branch, 'origin/{}'.format(
-        repo.production_branch))
-    repo.git('merge', '--no-ff', 'origin/{}'.format(testing_branch))
-    repo.tag(release_tag, 'Release tag for {}'.format(version))
+    production = 'origin/{}'.format(repo.production_branch)
+    production_step = 'merge:{}'.format(repo.production_branch)
+    batch = repo.push_batch()
+    refs = yield repo.load_refs()
+    if journal.landed(production_step, refs.remotes.get(production)):
+        merged = journal.get(production_step)
+        sys.stdout.write("Resuming, {} is already merged into {}.\n".format(
+            testing_branch, repo.production_branch))
+    else:
+        with phase('validate'):
+            latest_release = yield repo.get_last_release(production)
+            validate_upgrade(latest_release, release_tag)
+
+            if not (yield repo.branch_exists(
+                    "origin/{}".format(testing_branch))):
+                raise InvalidGitReference(
+                    "Unable to find {} to close release".format(
+                        testing_branch))
+
+        # The merge into production only writes objects, nothing is checked
+        # out, so every conflict is found before any ref is changed.
+        with phase('merge'):
+            merged = yield repo.merge_commit(
+                production, 'origin/{}'.format(testing_branch),
+                "Merge remote-tracking branch 'origin/{}' into {}".format(
+                    testing_branch, repo.production_branch))
+        yield repo.check_merges(release_merges(repo, merged),
+                                {merged: repo.production_branch})
+        yield repo.branch(repo.production_branch, merged)
+        journal.record(production_step, merged)
+        batch.update(repo.production_branch)
+
+    refs = yield repo.load_refs()
+    if not journal.landed('tag', refs.tags.get(release_tag)):
+        yield repo.tag(release_tag, 'Release tag for {}'.format(version),
+                       merged)
+        tagged = yield repo.git('rev-parse', release_tag)
+        journal.record('tag', tagged.stdout.strip())
+        batch.update(release_tag)
 
     # Merge production to development to absorb any release bugfixes.
     for branch in repo.development_branches:
-        repo.checkout(branch, 'origin/{}'.format(branch))
-        repo.git('merge', '--no-ff', repo.production_branch)
-
-    # Push all local changes in the end if all else works properly.
-    repo.git('push', 'origin', repo.production_branch)
-    repo.git('push', 'origin', release_tag)
-    for branch in repo.development_branches:
-        repo.git('push', 'origin', branch)
-
-    # Finally delete the release branch
-    repo.git('push', 'origin', ':{}'.format(testing_branch))
+        step = 'merge:{}'.format(branch)
+        refs = yield repo.load_refs()
+        if journal.landed(step, refs.remotes.get('origin/{}'.format(branch))):
+            continue
+        journal.record(step, (yield repo.merge(
+            branch, 'origin/{}'.format(branch), merged,
+            "Merge branch '{}' into {}".format(
+                repo.production_branch, branch))))
+        batch.update(branch)
+
+    # Push all local changes in the end if all else works properly and delete
+    # the release branch, all in one atomic push.
+    if (yield repo.branch_exists('origin/{}'.format(testing_branch))):
+        batch.delete(testing_branch)
+    expected = {'refs/tags/{}'.format(release_tag): journal.get('tag'),
+                'refs/heads/{}'.format(testing_branch): None}
+    for branch in [repo.production_branch] + list(repo.development_branches):
+        expected['refs/heads/{}'.format(branch)] = journal.get(
+            'merge:{}'.format(branch))
+    journal.record('expect', expected)
+    yield batch.push()
+    journal.record('push')
 
     sys.stdout.write("Successfully closed release branch '{}' as '{}' on "
                      "{}.\n".format(
                          testing_branch, release_tag, repo.production_branch))
 
 
-def hotfix(repo, version=None):
-    """ Create a hotfix release branch.
+def release_merges(repo, merged):
+    """
+    Returns the merges closing a release branch makes into the development
+    branches, as (base, other) pairs to check before making them. Each
+    development branch gets the merged commit of the release branch into
+    production.
+    """
+    return [('origin/{}'.format(branch), merged)
+            for branch in repo.development_branches]
+
+
+def hotfix_plan(repo, version=None, journal=None):
+    """ Plans creating a hotfix release branch off the last release.
     """
-    sha = repo.get_last_release('origin/{}'.format(repo.production_branch))
+    sha = yield repo.get_last_release(
+        'origin/{}'.format(repo.production_branch))
     sys.stdout.write("Creating new hotfix branch off of {}.\n".format(sha))
-    repo.checkout(repo.production_branch, sha)
-    create_release(repo, sha, version)
+    yield repo.branch(repo.production_branch, sha)
+    yield create_release_plan(repo, sha, version, journal)
 
 
-def release(repo, version=None):
-    """ Create a normal release branch.
+def release_plan(repo, version=None, journal=None):
+    """ Plans creating a normal release branch off the development branch.
     """
     sha, = repo.development_branches
     sys.stdout.write("Creating new release branch off of {}.\n".format(sha))
-    repo.checkout(sha, 'origin/{}'.format(sha))
-    create_release(repo, sha, version)
+    yield repo.branch(sha, 'origin/{}'.format(sha))
+    yield create_release_plan(repo, sha, version, journal)
 
 
-def create_release(repo, sha, version):
-    """ Create a release branch for running tests.
+def create_release_plan(repo, sha, version, journal=None):
+    """ Plans creating a release branch for running tests.
     """
-    last_version = repo.get_last_release(sha)
-    validate_upgrade(last_version, version)
-
-    test_branches = [x for x in repo.branches('origin/test-*') if re.match(
-        r'origin/test-\d+(\.\d+){2}', x)]
-
-    if test_branches:
-        sys.stderr.write("!! Warning, the following sprint testing branches "
-                         "are open:\n")
-        for branch in test_branches:
-            sys.stderr.write("!!\t* {}\n".format(branch))
-
-    testing_branch = 'test-{}'.format(version)
-    if repo.branch_exists('origin/{}'.format(testing_branch)):
-        raise DuplicateGitReference(
-            "Oops! Looks like {} already exists!\n".format(testing_branch))
-
-    repo.checkout(testing_branch, sha)
-
-    repo.git('push', 'origin', testing_branch)
+    journal = journal or Journal()
+    with phase('validate'):
+        last_version = yield repo.get_last_release(sha)
+        validate_upgrade(last_version, version)
+
+        test_branches = (yield repo.load_refs()).test_branches()
+
+        if test_branches:
+            sys.stderr.write("!! Warning, the following sprint testing "
+                             "branches are open:\n")
+            for branch in test_branches:
+                sys.stderr.write("!!\t* {}\n".format(branch))
+
+        testing_branch = 'test-{}'.format(version)
+        if (yield repo.branch_exists('origin/{}'.format(testing_branch))):
+            raise DuplicateGitReference(
+                "Oops! Looks like {} already exists!\n".format(testing_branch))
+
+    yield repo.branch(testing_branch, sha)
+    head = yield repo.git('rev-parse', testing_branch)
+    journal.record('expect', {
+        'refs/heads/{}'.format(testing_branch): head.stdout.strip()})
+
+    yield repo.push(testing_branch)
+    journal.record('push')
 
     sys.stdout.write("Successfully opened release branch '{}' for "
                      "testing.\n".format(testing_branch))
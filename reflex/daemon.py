@@ -0,0 +1,440 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import click
+
+from reflex import cli
+from reflex.batch import validate_job
+from reflex.cache import MirrorCache
+from reflex.error import (
+    DuplicateGitReference, GitCommandError, GitTimeout, InvalidGitReference,
+    InvalidUpgradePath, InvalidVersion, MergeConflict,
+)
+from reflex.repo import PrestineRepo
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import TCPServer, ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import TCPServer, ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+# Warm repos serve every action, so they are cloned with the cheapest
+# strategy that can still merge.
+CLONE_STRATEGY = cli.ACTION_CLONE_STRATEGIES['close']
+
+# The HTTP status each error, and the errors derived from it, is reported
+# with.
+ERROR_STATUS = {
+    InvalidVersion: 400,
+    InvalidGitReference: 404,
+    DuplicateGitReference: 409,
+    InvalidUpgradePath: 409,
+    MergeConflict: 409,
+    GitCommandError: 502,
+    GitTimeout: 504,
+}
+
+
+def error_status(error):
+    """
+    Returns the HTTP status for an error, that of the most specific error
+    class in ERROR_STATUS it is an instance of, or 500.
+    """
+    for kind in type(error).__mro__:
+        if kind in ERROR_STATUS:
+            return ERROR_STATUS[kind]
+    return 500
+
+
+class ReadWriteLock():
+    """
+    Lets any number of readers or a single writer hold the lock at once.
+    Writers which are waiting keep new readers out so they are not starved.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writing or self._waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+class WarmRepo():
+    """
+    A PrestineRepo which is kept open between requests.
+
+    Queries share the clone and its ref index and only fetch once it is
+    older than `refresh_interval` seconds. Actions take the repo for
+    themselves and always fetch first. A clone an action failed on may be
+    left half changed, so it is thrown away and cloned again when next used.
+    The commit-graph and multi-pack-index are updated on a background thread
+    after every fetch, so queries never wait for them.
+    """
+
+    def __init__(self, clone_uri, prod_branch=None, dev_branches=None,
+                 cache=None, refresh_interval=30, ssh_multiplex=False):
+        self.clone_uri = clone_uri
+        self.production_branch = prod_branch
+        self.development_branches = dev_branches
+        self.cache = cache
+        self.refresh_interval = refresh_interval
+        self.ssh_multiplex = ssh_multiplex
+        self.lock = ReadWriteLock()
+        self.repo = None
+        self.fetched = None
+        self._maintenance = None
+
+    def stale(self):
+        return self.repo is None or \
+            time.time() - self.fetched >= self.refresh_interval
+
+    def refresh(self):
+        """ Clones the repo, or fetches it if it is already cloned.
+        """
+        if self.repo is None:
+            repo = PrestineRepo(self.clone_uri, self.production_branch,
+                                self.development_branches, self.cache,
+                                CLONE_STRATEGY, self.ssh_multiplex)
+            # A repo which fails to clone cleans up after itself.
+            self.repo = repo.__enter__()
+        else:
+            self.repo.git('fetch', '--prune', '--prune-tags', 'origin')
+        self.fetched = time.time()
+        self.maintain()
+
+    def maintain(self):
+        """
+        Starts updating the lookup structures of the clone in the background,
+        unless an earlier update is still running.
+        """
+        if self._maintenance is not None and self._maintenance.is_alive():
+            return
+        repo = self.repo
+
+        def run():
+            try:
+                repo.maintain()
+            except Exception:
+                pass  # Maintenance only makes lookups faster.
+
+        self._maintenance = threading.Thread(target=run)
+        self._maintenance.daemon = True
+        self._maintenance.start()
+
+    def discard(self):
+        if self._maintenance is not None:
+            self._maintenance.join()
+            self._maintenance = None
+        if self.repo is not None:
+            self.repo.__exit__()
+            self.repo = None
+
+    @contextmanager
+    def reading(self):
+        """ Shares the repo with other queries, fetching it if it is stale.
+        """
+        while True:
+            if self.stale():
+                with self.lock.write():
+                    if self.stale():
+                        self.refresh()
+            with self.lock.read():
+                # An action may have thrown the clone away in between.
+                if self.repo is not None:
+                    yield self.repo
+                    return
+
+    @contextmanager
+    def writing(self):
+        """ Takes the repo for an action, fetching it first.
+        """
+        with self.lock.write():
+            self.refresh()
+            try:
+                yield self.repo
+            except Exception:
+                self.discard()
+                raise
+
+    def close(self):
+        with self.lock.write():
+            self.discard()
+
+
+class Daemon():
+    """
+    Keeps a WarmRepo for each repo it is asked about and answers queries and
+    runs actions on them. Queries on a repo run concurrently while actions on
+    it run one at a time.
+    """
+
+    def __init__(self, cache=None, refresh_interval=30, ssh_multiplex=False):
+        self.cache = cache
+        self.refresh_interval = refresh_interval
+        self.ssh_multiplex = ssh_multiplex
+        self.repos = {}
+        self._lock = threading.Lock()
+
+    def repo(self, clone_uri, prod_branch=None, dev_branches=None):
+        """ Returns the WarmRepo for a repo and its branches.
+        """
+        key = (clone_uri, prod_branch, tuple(dev_branches or ()))
+        with self._lock:
+            if key not in self.repos:
+                self.repos[key] = WarmRepo(
+                    clone_uri, prod_branch, dev_branches, self.cache,
+                    self.refresh_interval, self.ssh_multiplex)
+            return self.repos[key]
+
+    def clone_uris(self):
+        """ Lists the clone uris of the warm repos.
+        """
+        with self._lock:
+            keys = list(self.repos)
+        return sorted(clone_uri for clone_uri, _, _ in keys)
+
+    def last_release(self, clone_uri, branch=None, prod_branch=None,
+                     dev_branches=None):
+        """
+        Returns the latest release on a branch of a repo, the production
+        branch by default.
+        """
+        with self.repo(clone_uri, prod_branch,
+                       dev_branches).reading() as repo:
+            return repo.get_last_release('origin/{}'.format(
+                branch or repo.production_branch))
+
+    def releases(self, clone_uri, prod_branch=None, dev_branches=None):
+        """ Lists the release tags of a repo, oldest version first.
+        """
+        with self.repo(clone_uri, prod_branch,
+                       dev_branches).reading() as repo:
+            return repo.releases()
+
+    def test_branches(self, clone_uri, prod_branch=None, dev_branches=None):
+        """ Lists the open test branches of a repo.
+        """
+        with self.repo(clone_uri, prod_branch,
+                       dev_branches).reading() as repo:
+            return repo.refs.test_branches()
+
+    def run(self, job):
+        """ Runs a job, as found in a reflex-batch manifest, on its repo.
+        """
+        warm = self.repo(job['repo'], job.get('production_branch'),
+                         job.get('development_branches'))
+        with warm.writing() as repo:
+            cli.get_action(job['action'])(repo, job['version'])
+
+    def close(self):
+        """ Removes the clones of all warm repos.
+        """
+        with self._lock:
+            repos, self.repos = list(self.repos.values()), {}
+        for warm in repos:
+            warm.close()
+
+
+class BadRequest(Exception):
+    """ Raised by the request handler when a request can not be understood.
+    """
+    pass
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves the daemon as a JSON API.
+
+        GET  /last-release?repo=<uri>[&branch=<name>]
+        GET  /releases?repo=<uri>
+        GET  /test-branches?repo=<uri>
+        GET  /repos
+        POST /release, /hotfix or /close with a reflex-batch manifest job,
+             such as {"repo": "<uri>", "version": "1.2.0"}
+
+    Queries also take `production_branch` and `development_branch` (which
+    may be repeated) to pick the branches of the repo.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        def repo_options():
+            if 'repo' not in query:
+                raise BadRequest("Missing 'repo'.")
+            return {
+                'clone_uri': query['repo'][0],
+                'prod_branch': query.get('production_branch', [None])[0],
+                'dev_branches': query.get('development_branch'),
+            }
+
+        daemon = self.server.daemon
+        if url.path == '/last-release':
+            return self.reply(lambda: {'release': daemon.last_release(
+                branch=query.get('branch', [None])[0], **repo_options())})
+        if url.path == '/releases':
+            return self.reply(lambda: {
+                'releases': daemon.releases(**repo_options())})
+        if url.path == '/test-branches':
+            return self.reply(lambda: {
+                'test_branches': daemon.test_branches(**repo_options())})
+        if url.path == '/repos':
+            return self.reply(lambda: {'repos': daemon.clone_uris()})
+        self.respond(404, {'error': 'NotFound',
+                           'message': 'No such path {}.'.format(url.path)})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+
+        def run():
+            try:
+                job = json.loads(body or '{}')
+            except ValueError as error:
+                raise BadRequest('Invalid JSON: {}'.format(error))
+            if not isinstance(job, dict):
+                raise BadRequest('Expected a JSON object.')
+            job['action'] = urlparse(self.path).path.strip('/')
+            error = validate_job(job)
+            if error:
+                raise BadRequest(error)
+            start = time.time()
+            self.server.daemon.run(job)
+            return {'action': job['action'], 'repo': job['repo'],
+                    'version': job['version'],
+                    'elapsed': time.time() - start}
+
+        self.reply(run)
+
+    def reply(self, answer):
+        """ Responds with what a callable returns, or the error it raises.
+        """
+        try:
+            result = answer()
+        except BadRequest as error:
+            return self.respond(400, {'error': 'BadRequest',
+                                      'message': str(error)})
+        except Exception as error:
+            return self.respond(error_status(error), {
+                'error': type(error).__name__,
+                'message': str(error)})
+        self.respond(200, result)
+
+    def respond(self, status, document):
+        body = json.dumps(document).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address.
+        if not self.client_address:
+            return 'unix'
+        return BaseHTTPRequestHandler.address_string(self)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+    def server_close(self):
+        ThreadingHTTPServer.server_close(self)
+        os.remove(self.server_address)
+
+
+def make_server(daemon, host='127.0.0.1', port=0, socket_path=None):
+    """
+    Returns an HTTP server for a daemon, listening on a Unix socket if a path
+    is given and on a TCP host and port otherwise.
+    """
+    if socket_path:
+        server = UnixHTTPServer(socket_path, Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon = daemon
+    return server
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', help='Address to listen on.')
+@click.option('--port', type=int, default=8734, help='Port to listen on.')
+@click.option('--socket', 'socket_path', default=None,
+              help='Listen on this Unix socket instead of a TCP port.')
+@click.option('--cache-dir', envvar='REFLEX_CACHE_DIR', default=None,
+              help='Keep mirrors of repos in this directory between runs.')
+@click.option('--refresh-interval', type=float, default=30,
+              help='Seconds queries are answered from a repo before it is '
+                   'fetched again.')
+@click.option('--ssh-multiplex/--no-ssh-multiplex', default=False,
+              envvar='REFLEX_SSH_MULTIPLEX',
+              help='Share one SSH connection between the git commands on '
+                   'each warm repo.')
+def main(host, port, socket_path, cache_dir, refresh_interval, ssh_multiplex):
+    """ Serves reflex queries and actions over HTTP from warm repos.
+    """
+    cache = MirrorCache(cache_dir) if cache_dir else None
+    daemon = Daemon(cache, refresh_interval, ssh_multiplex)
+    server = make_server(daemon, host, port, socket_path)
+    click.echo('Listening on {}.'.format(
+        socket_path or '{}:{}'.format(*server.server_address[:2])))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.close()
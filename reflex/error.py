@@ -8,6 +8,14 @@ class GitCommandError(Exception):
     pass
 
 
+class GitTimeout(GitCommandError):
+    """
+    Exception which is raised when a git command is killed for running past
+    its timeout, or is not started because the operation's deadline passed.
+    """
+    pass
+
+
 class InvalidUpgradePath(Exception):
     """
     Exception which is thrown if an invalid upgrade path is detected. This
@@ -31,3 +39,27 @@ class InvalidGitReference(Exception):
     repo.
     """
     pass
+
+
+class MergeConflict(Exception):
+    """
+    Exception which is thrown when branches can not be merged without
+    conflicts. The conflicting paths are passed as the second argument.
+    """
+    pass
+
+
+class InvalidVersion(Exception):
+    """
+    Exception which is thrown when a version or release tag is not a valid
+    semantic version.
+    """
+    pass
+
+
+class WorkspaceBusy(Exception):
+    """
+    Exception which is thrown when the pooled workspace of a repo stays
+    leased by another run for longer than the pool waits.
+    """
+    pass
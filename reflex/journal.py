@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from hashlib import sha1
+from tempfile import NamedTemporaryFile
+
+
+class Journal():
+    """
+    A record of the steps of an action which have finished, along with the
+    sha each of them produced, so an interrupted action can be resumed.
+
+    Journals opened from a directory are written to a JSON file there, one
+    for each repo, action and version, after every step. A Journal without a
+    path only keeps its steps in memory.
+    """
+
+    def __init__(self, path=None, steps=None):
+        self.path = path
+        self.steps = steps or {}
+
+    @classmethod
+    def open(cls, root, clone_uri, action, version):
+        """
+        Opens the journal of an action on a repo under the given directory,
+        with the steps recorded by an earlier run if there was one.
+        """
+        key = sha1('{} {} {}'.format(clone_uri, action, version)
+                   .encode('utf-8')).hexdigest()
+        path = os.path.join(root, '{}.json'.format(key))
+        steps = None
+        if os.path.isfile(path):
+            with open(path) as saved:
+                steps = json.load(saved)['steps']
+        return cls(path, steps)
+
+    def __contains__(self, step):
+        return step in self.steps
+
+    def get(self, step):
+        """ Returns what a step recorded, or None if it has not finished.
+        """
+        return self.steps.get(step)
+
+    def landed(self, step, sha):
+        """
+        Returns True if a step has finished and recorded the given sha, e.g.
+        the sha a branch on origin points at now.
+        """
+        return sha is not None and self.steps.get(step) == sha
+
+    def record(self, step, value=None):
+        """ Records a finished step and saves the journal.
+        """
+        self.steps[step] = value
+        self.save()
+
+    def reset(self):
+        """ Forgets all steps, for an action which is started over.
+        """
+        self.steps = {}
+        self.save()
+
+    def save(self):
+        """
+        Writes the journal to its file, if it has one. The file is replaced
+        in one go so a crash never leaves half a journal behind.
+        """
+        if self.path is None:
+            return
+        root = os.path.dirname(self.path)
+        if not os.path.isdir(root):
+            os.makedirs(root)
+        with NamedTemporaryFile('w', dir=root, delete=False) as saved:
+            json.dump({'steps': self.steps}, saved, indent=2, sort_keys=True)
+        os.rename(saved.name, self.path)
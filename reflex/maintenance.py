@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Keeps the lookup structures of long-lived repositories, such as mirrors,
+pooled workspaces and warm repos, up to date so history walks stay fast.
+"""
+
+import os
+
+from reflex.error import GitTimeout
+from reflex.process import git_version, run_git, time_left
+
+# The first git release which writes reachability bitmaps for a
+# multi-pack-index.
+MIDX_BITMAP_VERSION = (2, 34)
+
+# Writes the commit-graph of new commits as a layer on top of the existing
+# ones, merging small layers, with corrected commit dates as generation
+# numbers.
+COMMIT_GRAPH_COMMAND = [
+    '-c', 'commitGraph.generationVersion=2', 'commit-graph', 'write',
+    '--reachable', '--split', '--size-multiple=2',
+]
+
+# Where the packs the multi-pack-index was last written for are recorded,
+# relative to the objects directory.
+MIDX_PACKS_FILE = os.path.join('info', 'reflex-midx-packs')
+
+
+def maintain(path, env=None, bitmaps=True, timeout=None, deadline=None):
+    """
+    Updates the commit-graph and multi-pack-index of a repository after a
+    fetch. The commit-graph only gets a layer for the new commits. The
+    multi-pack-index, and the reachability bitmaps written with it when
+    bitmaps is True, have to be rewritten as a whole, so that only happens
+    when the repository's packs changed since they were last written.
+    Bitmaps should be left out for partial clones as they need every
+    object. Each git command is killed after timeout seconds and none is
+    started after the deadline, a time.time() timestamp. Maintenance is an
+    optimization, so steps which fail or run out of time are skipped.
+    Returns the names of the structures which were written.
+    """
+    written = []
+
+    def git(*args):
+        return run_git(path, *args, env=env, check=False,
+                       timeout=time_left(timeout, deadline))
+
+    try:
+        if git(*COMMIT_GRAPH_COMMAND).returncode == 0:
+            written.append('commit-graph')
+
+        objects = objects_dir(path)
+        # A repo without packs can not have a multi-pack-index yet.
+        packs = list_packs(objects)
+        if not packs:
+            return written
+        bitmaps = bitmaps and \
+            git_version(time_left(timeout, deadline)) >= MIDX_BITMAP_VERSION
+        state = '\n'.join(packs + (['bitmap'] if bitmaps else []))
+        packs_file = os.path.join(objects, MIDX_PACKS_FILE)
+        midx = os.path.join(objects, 'pack', 'multi-pack-index')
+        if os.path.isfile(midx) and read_file(packs_file) == state:
+            return written
+
+        if bitmaps:
+            if git('multi-pack-index', 'write', '--bitmap').returncode == 0:
+                write_file(packs_file, state)
+                written.extend(['multi-pack-index', 'bitmap'])
+                return written
+            # Writing without bitmaps is left unrecorded so they are tried
+            # again.
+            state = None
+        if git('multi-pack-index', 'write').returncode == 0:
+            if state:
+                write_file(packs_file, state)
+            written.append('multi-pack-index')
+    except GitTimeout:
+        pass
+    return written
+
+
+def objects_dir(path):
+    """ Returns the objects directory of a bare or non-bare repository.
+    """
+    git_dir = os.path.join(path, '.git')
+    return os.path.join(git_dir if os.path.isdir(git_dir) else path,
+                        'objects')
+
+
+def list_packs(objects):
+    """ Returns the names of the indexed packs in an objects directory.
+    """
+    pack_dir = os.path.join(objects, 'pack')
+    if not os.path.isdir(pack_dir):
+        return []
+    return sorted(name for name in os.listdir(pack_dir)
+                  if name.endswith('.idx') and os.path.isfile(
+                      os.path.join(pack_dir, name[:-4] + '.pack')))
+
+
+def read_file(path):
+    try:
+        with open(path) as saved:
+            return saved.read()
+    except (IOError, OSError):
+        return None
+
+
+def write_file(path, content):
+    try:
+        with open(path, 'w') as saved:
+            saved.write(content)
+    except (IOError, OSError):
+        pass
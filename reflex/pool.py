@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fcntl
+import os
+import time
+from hashlib import sha1
+
+from reflex.error import GitTimeout, WorkspaceBusy
+from reflex.process import time_left
+
+# How often a lock which is waited for with a timeout is checked, in
+# seconds.
+POLL_INTERVAL = 0.1
+
+
+class WorkspacePool():
+    """
+    Scratch clones kept under a directory between runs, one for each clone
+    uri and object filter, which a PrestineRepo leases instead of cloning
+    into a temporary directory. Partial clones made with different filters
+    are kept apart, as one would have to fetch lazily, object by object,
+    what the other left out.
+
+    A lease holds an exclusive lock on the workspace's lock file, so only one
+    reflex process at a time works on a repo through the pool. The lock is
+    released by the operating system if the process dies. Leases wait for the
+    workspace to be free, or raise WorkspaceBusy after `timeout` seconds, or
+    GitTimeout once the deadline of the run leasing it passes.
+    """
+
+    def __init__(self, root, timeout=None):
+        self.root = root
+        self.timeout = timeout
+
+    def path(self, clone_uri, object_filter=None):
+        """
+        Returns the location of the workspace for a given clone uri and
+        object filter, such as 'blob:none', or None for a full clone.
+        """
+        key = clone_uri if object_filter is None else '{} {}'.format(
+            clone_uri, object_filter)
+        return os.path.join(self.root, sha1(key.encode('utf-8')).hexdigest())
+
+    def lease(self, clone_uri, object_filter=None, deadline=None):
+        """
+        Locks the workspace of a clone uri and object filter and returns a
+        Lease for it, waiting no longer than the deadline, a time.time()
+        timestamp. The workspace directory is created if needed and is empty
+        if the repo has not been cloned into it yet.
+        """
+        workspace = self.path(clone_uri, object_filter)
+        if not os.path.isdir(workspace):
+            os.makedirs(workspace)
+        lock = open('{}.lock'.format(workspace), 'a')
+        try:
+            if not acquire(lock, time_left(self.timeout, deadline)):
+                if deadline is not None and time.time() >= deadline:
+                    raise GitTimeout(
+                        "The deadline passed waiting for the workspace of "
+                        "{}.".format(clone_uri), [])
+                raise WorkspaceBusy(
+                    "The workspace of {} is still in use after {}s."
+                    .format(clone_uri, self.timeout))
+        except Exception:
+            lock.close()
+            raise
+        return Lease(workspace, lock)
+
+
+def acquire(lock, timeout=None):
+    """
+    Takes an exclusive lock on an open file, waiting for as long as it takes
+    or at most timeout seconds. Returns False if the lock could not be taken
+    in time.
+    """
+    if timeout is None:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return True
+    give_up = time.time() + timeout
+    while True:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except (IOError, OSError):
+            if time.time() >= give_up:
+                return False
+            time.sleep(min(POLL_INTERVAL, max(0, give_up - time.time())))
+
+
+class Lease():
+    """ A locked workspace, which stays locked until it is released.
+    """
+
+    def __init__(self, dir, lock):
+        self.dir = dir
+        self._lock = lock
+
+    @property
+    def cloned(self):
+        """ True if the repo has already been cloned into the workspace.
+        """
+        return os.path.isdir(os.path.join(self.dir, '.git'))
+
+    def release(self):
+        """ Unlocks the workspace.
+        """
+        fcntl.flock(self._lock, fcntl.LOCK_UN)
+        self._lock.close()
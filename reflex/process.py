@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import signal
+import sys
+import threading
+import time
+from subprocess import Popen, PIPE
+from tempfile import TemporaryFile
+
+from reflex.error import GitCommandError, GitTimeout
+
+
+class GitResult():
+    """
+    The captured outcome of a finished git command.
+
+    Output is read from both pipes at once while the command runs, so git can
+    never block on a full pipe, and is decoded a single time.
+    """
+
+    def __init__(self, command, returncode, stdout, stderr):
+        self.command = command
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def lines(self):
+        """ Returns the lines git wrote to stdout.
+        """
+        return self.stdout.splitlines()
+
+
+class GitCall():
+    """
+    What a finished git command did, as passed to the callables in git_hooks.
+    Start is a wall clock timestamp and elapsed is in seconds.
+    """
+
+    def __init__(self, command, cwd, start, elapsed, returncode, stdout_bytes,
+                 stderr_bytes):
+        self.command = command
+        self.cwd = cwd
+        self.start = start
+        self.elapsed = elapsed
+        self.returncode = returncode
+        self.stdout_bytes = stdout_bytes
+        self.stderr_bytes = stderr_bytes
+
+
+# Callables which are passed a GitCall each time a git command finishes, on
+# the thread which ran it.
+git_hooks = []
+
+
+def notify(command, cwd, start, returncode, stdout_bytes, stderr_bytes):
+    """ Tells the git_hooks about a finished git command.
+    """
+    if git_hooks:
+        call = GitCall(command, cwd, start, time.time() - start, returncode,
+                       stdout_bytes, stderr_bytes)
+        for hook in list(git_hooks):
+            hook(call)
+
+
+def decode(output):
+    """ Decodes raw git output.
+    """
+    return output.decode('utf-8', 'replace')
+
+
+def failure(command, stderr):
+    """ Builds the error raised when a git command exits with an error.
+    """
+    return GitCommandError(
+        "Failed to run '{}'.".format(' '.join(command)),
+        stderr.splitlines()
+    )
+
+
+def environment(options):
+    """
+    Returns the Popen arguments for the `env` and `timeout` options, if they
+    were given. Commands with a timeout run in a process group of their own
+    so the programs git starts, such as ssh, can be killed along with it.
+    """
+    arguments = {}
+    if options.get('env') is not None:
+        arguments['env'] = options['env']
+    if options.get('timeout') is not None:
+        if sys.version_info >= (3, 2):
+            arguments['start_new_session'] = True
+        else:  # Python 2
+            arguments['preexec_fn'] = os.setsid
+    return arguments
+
+
+def time_left(timeout=None, deadline=None):
+    """
+    Returns how many seconds a git command may run for, given a timeout per
+    command and a deadline as a time.time() timestamp, or None if there is
+    no limit. Raises GitTimeout if the deadline has already passed.
+    """
+    if deadline is None:
+        return timeout
+    left = deadline - time.time()
+    if left <= 0:
+        raise GitTimeout("The deadline passed before git could be run.", [])
+    return left if timeout is None else min(timeout, left)
+
+
+class Watchdog():
+    """
+    Kills the process group of a git command which runs for longer than its
+    timeout. Does nothing without a timeout.
+    """
+
+    def __init__(self, process, timeout):
+        self.process = process
+        self.expired = False
+        self._timer = None
+        if timeout is not None:
+            self._timer = threading.Timer(timeout, self.kill)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def kill(self):
+        self.expired = True
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+def timed_out(command, timeout):
+    """ Builds the error raised when a git command is killed for taking long.
+    """
+    return GitTimeout(
+        "Killed '{}' after {:.1f}s.".format(' '.join(command), timeout), [])
+
+
+def run_git(cwd, *args, **options):
+    """
+    Runs a git command in the given directory and captures its output. Pass
+    check=False to get the result of a failed command instead of an error
+    and env to run it with a different environment. Given a timeout in
+    seconds, git and everything it started are killed once it passes and a
+    GitTimeout is raised.
+    """
+    command = ['git'] + list(args)
+    start = time.time()
+    process = Popen(command, cwd=cwd, stdout=PIPE, stderr=PIPE,
+                    **environment(options))
+    watchdog = Watchdog(process, options.get('timeout'))
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        watchdog.stop()
+    notify(command, cwd, start, process.returncode, len(stdout), len(stderr))
+    if watchdog.expired:
+        raise timed_out(command, options['timeout'])
+    result = GitResult(command, process.returncode, decode(stdout),
+                       decode(stderr))
+    if result.returncode != 0 and options.get('check', True):
+        raise failure(command, result.stderr)
+    return result
+
+
+_git_version = None
+
+
+def git_version(timeout=None):
+    """
+    Returns the version of the installed git as a tuple of numbers. It is
+    looked up once, with `git version` killed after timeout seconds.
+    """
+    global _git_version
+    if _git_version is None:
+        version = run_git(None, 'version', timeout=timeout).stdout.split()[2]
+        _git_version = tuple(
+            int(part) for part in version.split('.')[:3] if part.isdigit())
+    return _git_version
+
+
+def stream_git(cwd, *args, **options):
+    """
+    Runs a git command in the given directory and yields the lines it writes
+    to stdout as they arrive, so large listings never have to be held in
+    memory. Stderr is spooled to a temporary file until the command finishes.
+    Closing the generator early stops the command. Takes the same env and
+    timeout options as run_git.
+    """
+    command = ['git'] + list(args)
+    start = time.time()
+    read = 0
+    with TemporaryFile() as stderr:
+        process = Popen(command, cwd=cwd, stdout=PIPE, stderr=stderr,
+                        **environment(options))
+        watchdog = Watchdog(process, options.get('timeout'))
+        try:
+            for line in iter(process.stdout.readline, b''):
+                read += len(line)
+                yield decode(line).rstrip('\n')
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            watchdog.stop()
+            notify(command, cwd, start, process.returncode, read,
+                   os.fstat(stderr.fileno()).st_size)
+        if watchdog.expired:
+            raise timed_out(command, options['timeout'])
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise failure(command, decode(stderr.read()))
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+from fnmatch import translate
+
+from reflex.version import sort_versions
+
+TEST_BRANCH_PATTERN = re.compile(r'test-\d+(\.\d+){2}')
+RELEASE_TAG_PREFIX = 'release-'
+
+HEADS = 'refs/heads/'
+REMOTES = 'refs/remotes/'
+TAGS = 'refs/tags/'
+
+
+def compile_pattern(match):
+    """
+    Compiles a shell-style pattern such as 'origin/test-*' so it can be
+    matched against many ref names without translating it each time.
+    """
+    return re.compile(translate(match))
+
+
+class RefIndex():
+    """
+    An in-memory snapshot of the refs in a repo.
+
+    Refs are indexed by kind under their short names, e.g. 'main' in heads,
+    'origin/main' in remotes and 'release-1.0.0' in tags, and map to the sha
+    they pointed at when the snapshot was loaded. Refs which are changed
+    through the index afterwards map to None as their new sha is not known.
+    Annotated tags whose commit is known also map to it in peeled.
+    """
+
+    def __init__(self):
+        self.heads = {}
+        self.remotes = {}
+        self.tags = {}
+        self.peeled = {}
+
+    @classmethod
+    def parse(cls, lines):
+        """
+        Builds an index from lines of '<sha> <refname>', as written by
+        `git for-each-ref --format='%(objectname) %(refname)'`.
+        """
+        index = cls()
+        for line in lines:
+            sha, refname = line.split(' ', 1)
+            index.add(refname, sha)
+        return index
+
+    @classmethod
+    def parse_remote(cls, lines, remote='origin'):
+        """
+        Builds an index from the '<sha>\t<refname>' lines written by
+        `git ls-remote`, filing the remote's branches under remotes the same
+        way a clone of it would.
+        """
+        index = cls()
+        for line in lines:
+            sha, refname = line.split('\t', 1)
+            if refname.startswith(TAGS) and refname.endswith('^{}'):
+                index.peeled[refname[len(TAGS):-len('^{}')]] = sha
+            elif refname.startswith(HEADS):
+                index.add('{}{}/{}'.format(
+                    REMOTES, remote, refname[len(HEADS):]), sha)
+            else:
+                index.add(refname, sha)
+        return index
+
+    def _kind(self, refname):
+        for prefix, refs in ((HEADS, self.heads), (REMOTES, self.remotes),
+                             (TAGS, self.tags)):
+            if refname.startswith(prefix):
+                return refs, refname[len(prefix):]
+        return None, refname
+
+    def add(self, refname, sha=None):
+        """ Adds or updates a full refname, e.g. 'refs/heads/main'.
+        """
+        refs, name = self._kind(refname)
+        if refs is not None:
+            refs[name] = sha
+
+    def remove(self, refname):
+        """ Removes a full refname if it is in the index.
+        """
+        refs, name = self._kind(refname)
+        if refs is not None:
+            refs.pop(name, None)
+
+    def pushed(self, refspec, remote='origin'):
+        """
+        Updates the index after a successful `git push <remote> <refspec>`
+        the same way git updates its remote-tracking branches.
+        """
+        source, separator, destination = refspec.lstrip('+').rpartition(':')
+        if not separator:
+            source = destination
+        for prefix in (HEADS, TAGS):
+            if destination.startswith(prefix):
+                destination = destination[len(prefix):]
+        if destination in self.tags:
+            return
+        tracking = '{}{}/{}'.format(REMOTES, remote, destination)
+        if source:
+            self.add(tracking, self.heads.get(source))
+        else:
+            self.remove(tracking)
+
+    def iter_remotes(self, match=None):
+        """
+        Yields the remote branches matching an optional shell-style pattern,
+        in no particular order. Nothing is copied, so a caller can stop as
+        soon as it has what it needs, but the index must not change while
+        the iteration runs.
+        """
+        if match is None:
+            for name in self.remotes:
+                yield name
+            return
+        pattern = compile_pattern(match)
+        for name in self.remotes:
+            if pattern.match(name):
+                yield name
+
+    def iter_test_branches(self, remote='origin'):
+        """
+        Yields the remote's test-<version> branches, in no particular order.
+        """
+        prefix = '{}/'.format(remote)
+        for name in self.remotes:
+            if name.startswith(prefix) and \
+                    TEST_BRANCH_PATTERN.match(name, len(prefix)):
+                yield name
+
+    def test_branches(self, remote='origin'):
+        """ Lists the remote's test-<version> branches.
+        """
+        return sorted(self.iter_test_branches(remote))
+
+    def release_tags(self):
+        """ Lists the release-<version> tags, oldest version first.
+        """
+        return sort_versions(name for name in self.tags
+                             if name.startswith(RELEASE_TAG_PREFIX))
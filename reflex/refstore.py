@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Reads refs straight from the files git keeps them in, so listing the refs of
+a repo does not need a git process.
+"""
+
+import mmap
+import os
+import re
+
+from reflex.process import decode
+
+# Object names of SHA-1 and SHA-256 repositories.
+OBJECT_NAME_PATTERN = re.compile(r'^[0-9a-f]{40}([0-9a-f]{24})?$')
+SYMREF_PREFIX = 'ref: '
+
+# Git gives up following symbolic refs after this many hops.
+MAX_SYMREF_DEPTH = 5
+
+
+def ref_storage(git_dir):
+    """
+    Returns the ref storage format a repository is configured for, 'files'
+    unless its config sets extensions.refStorage.
+    """
+    path = os.path.join(git_dir, 'config')
+    if not os.path.isfile(path):
+        return 'files'
+    section = None
+    with open(path) as config:
+        for line in config:
+            line = line.strip()
+            if line.startswith('['):
+                section = line.strip('[]').strip().lower()
+            elif section == 'extensions' and '=' in line:
+                key, _, value = line.partition('=')
+                if key.strip().lower() == 'refstorage':
+                    return value.strip().lower()
+    return 'files'
+
+
+def supported(git_dir):
+    """
+    Returns True if a git directory keeps its refs in loose ref files and
+    packed-refs, the only format read_refs understands.
+    """
+    return os.path.isdir(os.path.join(git_dir, 'refs')) and \
+        not os.path.exists(os.path.join(git_dir, 'reftable')) and \
+        ref_storage(git_dir) == 'files'
+
+
+def read_packed_refs(git_dir):
+    """
+    Returns the refs in a repository's packed-refs file by refname. The file
+    is memory-mapped rather than read into memory.
+    """
+    refs = {}
+    path = os.path.join(git_dir, 'packed-refs')
+    if not os.path.isfile(path):
+        return refs
+    with open(path, 'rb') as packed:
+        # Empty files can not be mapped.
+        if not os.fstat(packed.fileno()).st_size:
+            return refs
+        data = mmap.mmap(packed.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for line in iter(data.readline, b''):
+                # Skip the header and the peeled commits of annotated tags.
+                if line.startswith((b'#', b'^')):
+                    continue
+                sha, _, refname = line.rstrip(b'\n').partition(b' ')
+                refs[decode(refname)] = decode(sha)
+        finally:
+            data.close()
+    return refs
+
+
+def read_loose_refs(git_dir):
+    """
+    Returns the refs stored as files under a repository's refs directory by
+    refname. Symbolic refs map to 'ref: <target>'.
+    """
+    refs = {}
+    root = os.path.join(git_dir, 'refs')
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if name.endswith('.lock'):
+                continue
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as loose:
+                value = decode(loose.read()).strip()
+            if value.startswith(SYMREF_PREFIX) or \
+                    OBJECT_NAME_PATTERN.match(value):
+                refname = os.path.relpath(path, git_dir)
+                refs[refname.replace(os.sep, '/')] = value
+    return refs
+
+
+def resolve(refs, refname):
+    """
+    Returns the sha a ref points at, following symbolic refs, or None if it
+    does not point at anything.
+    """
+    value = refs.get(refname)
+    for _ in range(MAX_SYMREF_DEPTH):
+        if value is None or not value.startswith(SYMREF_PREFIX):
+            return value
+        value = refs.get(value[len(SYMREF_PREFIX):])
+    return None
+
+
+def read_refs(git_dir):
+    """
+    Reads every ref of a repository from its git directory. Returns an
+    iterator of lines of '<sha> <refname>', sorted by refname like the output
+    of `git for-each-ref --format='%(objectname) %(refname)'`, or None if the
+    refs are kept in a format which is not supported, such as reftable.
+    Loose refs win over packed ones and dangling symbolic refs are left out.
+    Lines are only formatted as they are consumed.
+    """
+    if not supported(git_dir):
+        return None
+    refs = read_packed_refs(git_dir)
+    refs.update(read_loose_refs(git_dir))
+    return format_refs(refs)
+
+
+def format_refs(refs):
+    for refname in sorted(refs):
+        sha = resolve(refs, refname)
+        if sha is not None:
+            yield '{} {}'.format(sha, refname)
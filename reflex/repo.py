@@ -1,11 +1,62 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
+import re
+import time
+from multiprocessing.pool import ThreadPool
 from shutil import rmtree
-from subprocess import Popen, PIPE
+from subprocess import Popen
 from tempfile import mkdtemp
 
-from reflex.error import GitCommandError
+from reflex.error import (
+    GitCommandError, InvalidGitReference, MergeConflict,
+)
+from reflex.maintenance import maintain
+from reflex.process import (
+    Watchdog, environment, failure, git_version, run_git, stream_git,
+    time_left,
+)
+from reflex.refs import RELEASE_TAG_PREFIX, RefIndex
+from reflex.refstore import read_refs
+from reflex.trace import in_phase, phase
+from reflex.version import latest_version
+
+try:
+    from shlex import quote
+except ImportError:  # Python 2
+    from pipes import quote
+
+# How a PrestineRepo clones its remote, as (checkout, object filter). Partial
+# clones leave out blobs or trees which git fetches lazily if they are needed.
+CLONE_STRATEGIES = {
+    'full': (True, None),
+    'no-checkout': (False, None),
+    'blobless': (False, 'blob:none'),
+    'treeless': (False, 'tree:0'),
+}
+
+# The first git release whose merge-tree can merge without a working tree.
+MERGE_TREE_VERSION = (2, 38)
+
+# How many merges check_merges tests at the same time.
+MERGE_CHECK_WORKERS = 8
+
+# How long an idle shared SSH connection is kept open, in seconds. It is
+# closed when the PrestineRepo exits, so this only matters if it never does.
+SSH_CONTROL_PERSIST = 300
+
+# How long closing the shared SSH connection may take, in seconds.
+SSH_EXIT_TIMEOUT = 10
+
+# Clone uris git reaches over SSH: ssh:// urls and scp-like user@host:path.
+SSH_URI_PATTERN = re.compile(r'^((git\+)?ssh(\+git)?://|[^/:]+:(?!//))')
+
+# Git commands which may create or delete refs behind the ref index's back.
+REF_COMMANDS = frozenset([
+    'branch', 'checkout', 'clone', 'fetch', 'pull', 'push', 'remote', 'tag',
+    'update-ref',
+])
 
 
 class PrestineRepo():
@@ -17,90 +68,640 @@ class PrestineRepo():
     configured for the clone uri which is passed in during initialization. It
     also provides some useful helper methods that can be preformed on the repo
     itself.
+
+    When a MirrorCache is given the clone is made from a local mirror of the
+    repository, which is fetched incrementally, instead of from the remote.
+    The clone_strategy picks one of CLONE_STRATEGIES to limit how much of the
+    remote is transferred and checked out. Given fetch_refs, a list of ref
+    patterns such as 'refs/heads/main' or 'refs/tags/release-*', only those
+    refs are fetched from the remote rather than all of its branches and
+    tags. With ssh_multiplex every git command which talks to an SSH remote
+    shares a single SSH connection, which is set up on entry and closed on
+    exit.
+
+    Given a WorkspacePool the repo leases the pool's workspace for the clone
+    uri and the object filter of its clone_strategy instead of cloning into
+    a temporary directory. A workspace which was cloned before is reset to
+    match origin, which only fetches what changed, and is kept for the next
+    lease on exit. Its commit-graph and multi-pack-index are kept up to date
+    after each fetch.
+
+    A git command which runs for longer than `timeout` seconds is killed, as
+    is one still running `deadline` seconds after the repo was created, and
+    a GitTimeout is raised. No git command is started after the deadline.
+    The temporary clone is removed either way.
+
+    Ref lookups are answered from a RefIndex snapshot which is read straight
+    from the ref files in the git directory, or loaded with a single
+    `git for-each-ref` if git keeps refs in a format reflex can not read, and
+    kept up to date by the helper methods. The latest release reachable from
+    a commit is cached the same way.
     """
 
-    def __init__(self, clone_uri, prod_branch=None, dev_branches=None):
+    def __init__(self, clone_uri, prod_branch=None, dev_branches=None,
+                 cache=None, clone_strategy='full', ssh_multiplex=False,
+                 fetch_refs=None, pool=None, timeout=None, deadline=None):
         if not prod_branch:
             prod_branch = 'main'
         if not dev_branches:
             dev_branches = ['develop']
 
-        self.dir = mkdtemp()
+        self.dir = None if pool else mkdtemp()
         self.clone_uri = clone_uri
         self.production_branch = prod_branch
         self.development_branches = dev_branches
+        self.cache = cache
+        self.clone_strategy = clone_strategy
+        self.ssh_multiplex = ssh_multiplex
+        self.fetch_refs = fetch_refs
+        self.pool = pool
+        self.timeout = timeout
+        self.deadline = None if deadline is None else time.time() + deadline
+        self.env = None
+        self._lease = None
+        self._ssh_dir = None
+        self._refs = None
+        self._last_releases = {}
 
     def __enter__(self):
-        self.git('clone', self.clone_uri, self.dir)
-        self.git('fetch', 'origin')
+        if not self.pool:
+            try:
+                self.start_ssh()
+                self.setup()
+            except Exception:
+                self.__exit__()
+                raise
+            return self
+        # Lease before connecting so waiting for, or failing to get, the
+        # workspace leaves no SSH session behind.
+        _, object_filter = CLONE_STRATEGIES[self.clone_strategy]
+        self._lease = self.pool.lease(self.clone_uri, object_filter,
+                                      self.deadline)
+        self.dir = self._lease.dir
+        try:
+            self.start_ssh()
+            if not self.reset_workspace():
+                self.setup()
+            self.maintain()
+        except Exception:
+            # Leave no half made clone behind for the next lease.
+            self.clear_workspace()
+            self.__exit__()
+            raise
         return self
 
     def __exit__(self, *exc):
-        rmtree(self.dir)
+        self.stop_ssh()
+        if self._lease:
+            self._lease.release()
+            self._lease = None
+        elif not self.pool:
+            rmtree(self.dir)
+
+    def setup(self):
+        """ Fills the repo from its remote, or from a mirror of it.
+        """
+        if not self.cache:
+            self.clone(None)
+            return
+        with self.cache.lock(self.clone_uri, self.deadline):
+            with phase('fetch'):
+                mirror = self.cache.update(
+                    self.clone_uri, self.env, self.timeout, self.deadline)
+            self.clone(mirror)
+        self.cache.evict(keep=mirror)
+
+    def clone(self, mirror):
+        """ Runs the setup commands, cloning from a mirror if one is given.
+        """
+        for name, args in self.setup_commands(mirror):
+            with phase(name):
+                self.git(*args)
+
+    def reset_workspace(self):
+        """
+        Returns a leased workspace which was cloned before to the state of a
+        fresh clone: local branches are deleted, origin is fetched, pruning
+        refs and tags which are gone, and the working tree is cleaned.
+        Returns False if there is no clone to reset or it is broken, in which
+        case the workspace is emptied to be cloned into.
+        """
+        if not self._lease.cloned:
+            return False
+        try:
+            with phase('fetch'):
+                head = self._git('rev-parse', '--verify', '--quiet', 'HEAD',
+                                 check=False).stdout.strip()
+                if head:
+                    self._git('update-ref', '--no-deref', 'HEAD', head)
+                branches = self._git(
+                    'for-each-ref', '--format=%(refname:short)',
+                    'refs/heads').lines()
+                if branches:
+                    self.git('branch', '--delete', '--force', *branches)
+                self.git(*self.refresh_command())
+                if head and CLONE_STRATEGIES[self.clone_strategy][0]:
+                    self._git('reset', '--hard', '--quiet')
+                self._git('clean', '-ffdxq')
+        except GitCommandError:
+            self.clear_workspace()
+            return False
+        return True
+
+    def maintain(self):
+        """
+        Updates the commit-graph and multi-pack-index of a repo which is kept
+        after exit, such as a pooled workspace. Partial clones get no bitmaps.
+        """
+        _, object_filter = CLONE_STRATEGIES[self.clone_strategy]
+        with phase('fetch'):
+            return maintain(self.dir, self.env, not object_filter,
+                            self.timeout, self.deadline)
+
+    def refresh_command(self):
+        """ Returns the `git fetch` which brings a workspace up to date.
+        """
+        fetch = ['fetch', '--prune', '--force']
+        if self.fetch_refs is None:
+            return fetch + ['--prune-tags', 'origin']
+        return fetch + ['--no-tags', 'origin'] + [
+            fetch_refspec(ref) for ref in self.fetch_refs]
+
+    def clear_workspace(self):
+        """ Removes everything from a leased workspace.
+        """
+        for name in os.listdir(self.dir):
+            path = os.path.join(self.dir, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                rmtree(path)
+            else:
+                os.remove(path)
+
+    def start_ssh(self):
+        """
+        Points GIT_SSH_COMMAND at a control socket of the session when SSH
+        multiplexing is enabled for an SSH remote. The first git command to
+        connect becomes the master which later commands share. The session
+        may be started before entering the repo, so commands run against the
+        remote beforehand can share it too.
+        """
+        if self._ssh_dir is not None:
+            return
+        if not self.ssh_multiplex or not is_ssh_uri(self.clone_uri):
+            return
+        self._ssh_dir = mkdtemp(prefix='reflex-ssh-')
+        self.env = dict(os.environ, GIT_SSH_COMMAND=self.ssh_command(
+            '-o', 'ControlMaster=auto',
+            '-o', 'ControlPersist={}'.format(SSH_CONTROL_PERSIST)))
+
+    def stop_ssh(self):
+        """
+        Closes the shared SSH connection, if one was started. This cleans up
+        after the session, so it runs even once the deadline has passed, but
+        ssh is killed after SSH_EXIT_TIMEOUT seconds.
+        """
+        if self._ssh_dir is None:
+            return
+        with open(os.devnull, 'w') as devnull:
+            process = Popen(self.ssh_command('-O', 'exit', 'reflex'),
+                            shell=True, stdout=devnull, stderr=devnull,
+                            **environment({'timeout': SSH_EXIT_TIMEOUT}))
+            watchdog = Watchdog(process, SSH_EXIT_TIMEOUT)
+            try:
+                process.wait()
+            finally:
+                watchdog.stop()
+        rmtree(self._ssh_dir)
+        self._ssh_dir = None
+        self.env = None
+
+    def ssh_command(self, *args):
+        """
+        Returns the SSH command, with the session's control socket, that git
+        should run. Builds on a GIT_SSH_COMMAND already in the environment.
+        """
+        path = os.path.join(self._ssh_dir, 'master')
+        return ' '.join([os.environ.get('GIT_SSH_COMMAND') or 'ssh'] + [
+            quote(arg) for arg in ('-o', 'ControlPath={}'.format(path)) +
+            args])
 
     def git(self, *args):
-        """ Git command helper.
-        """
-        command = ['git'] + list(args)
-        result = Popen(command, cwd=self.dir, stdout=PIPE, stderr=PIPE)
-        result.wait()
-        if result.returncode != 0:
-            err = result.stderr.readlines()
-            raise GitCommandError(
-                "Failed to run '{}'.".format(' '.join(command)),
-                err
-            )
+        """
+        Git command helper. Returns the captured GitResult. Commands which may
+        change refs drop the ref index so it is reloaded when next needed.
+        """
+        result = self._git(*args)
+        if args and args[0] in REF_COMMANDS:
+            self._refs = None
+            self._last_releases = {}
         return result
 
+    def _git(self, *args, **options):
+        return run_git(self.dir, *args, env=self.env,
+                       timeout=time_left(self.timeout, self.deadline),
+                       **options)
+
+    def stream(self, *args):
+        """ Git command helper which yields output lines as they are written.
+        """
+        return stream_git(self.dir, *args, env=self.env,
+                          timeout=time_left(self.timeout, self.deadline))
+
+    def clone_options(self, local=False):
+        """ Returns the options to `git clone` for the repo's clone strategy.
+        """
+        checkout, object_filter = CLONE_STRATEGIES[self.clone_strategy]
+        options = []
+        if not checkout:
+            options.append('--no-checkout')
+        if object_filter and not local:
+            options.append('--filter={}'.format(object_filter))
+        return options
+
+    def setup_commands(self, mirror=None):
+        """
+        Returns the git commands which fill the repo from its remote, or from
+        a local mirror of it, as (phase, args) pairs.
+
+        A mirror is cloned whole since local clones only hardlink objects.
+        Otherwise a repo with fetch_refs is initialized and fetches just
+        those refs in a single `git fetch`, and any other repo is cloned.
+        """
+        if mirror:
+            # Filters are ignored by local clones, which hardlink everything.
+            return [
+                ('clone', ['clone'] + self.clone_options(local=True) +
+                 [mirror, self.dir]),
+                ('clone', ['remote', 'set-url', 'origin', self.clone_uri]),
+            ]
+        if self.fetch_refs is None:
+            return [('clone', ['clone'] + self.clone_options() +
+                     [self.clone_uri, self.dir])]
+
+        checkout, object_filter = CLONE_STRATEGIES[self.clone_strategy]
+        fetch = ['fetch', '--no-tags']
+        if object_filter:
+            fetch.append('--filter={}'.format(object_filter))
+        commands = [
+            ('clone', ['init', '--quiet']),
+            ('clone', ['remote', 'add', 'origin', self.clone_uri]),
+            ('fetch', fetch + ['origin'] +
+             [fetch_refspec(ref) for ref in self.fetch_refs]),
+        ]
+        branches = [ref[len('refs/heads/'):] for ref in self.fetch_refs
+                    if ref.startswith('refs/heads/') and '*' not in ref]
+        if checkout and branches:
+            commands.append(('clone', [
+                'checkout', '--quiet', '--detach',
+                'origin/{}'.format(branches[0])]))
+        return commands
+
+    @property
+    def refs(self):
+        """
+        The RefIndex for the repo, loaded on first use. Refs are read from the
+        git directory without running git when its ref format is supported.
+        """
+        if self._refs is None:
+            lines = read_refs(os.path.join(self.dir, '.git'))
+            if lines is None:
+                lines = self.stream(
+                    'for-each-ref', '--format=%(objectname) %(refname)')
+            self._refs = RefIndex.parse(lines)
+        return self._refs
+
+    def load_refs(self):
+        """
+        Returns the RefIndex for the repo, like `refs`. Plans load refs with it
+        since an AsyncPrestineRepo can only load them in a coroutine.
+        """
+        return self.refs
+
+    def iter_branches(self, match=None):
+        """
+        Yields the remote branches matching an optional pattern in a repo, in
+        no particular order, so callers can stop early.
+        """
+        return self.refs.iter_remotes(match)
+
     def branches(self, match=None):
-        """ List all branches matching an optional pattern in a repo.
+        """ List all remote branches matching an optional pattern in a repo.
         """
-        args = ['--list', '--remote']
-        if match:
-            args.append(match)
-        result = self.git('branch', *args)
-        branches = [branch.strip() for branch in result.stdout.readlines()]
-        return [branch.decode() for branch in branches]
+        return sorted(self.iter_branches(match))
 
     def branch_exists(self, full_branch_name):
         """ Returns True or False depending on if a branch exists or not.
         """
-        return full_branch_name in self.branches()
+        return full_branch_name in self.refs.remotes
 
     def checkout(self, branch_name, reset_sha=None):
         """ Checks out a git reference in a repo with the option to hard reset.
         """
         if self.branch_exists('origin/{}'.format(branch_name)):
-            self.git('checkout', branch_name)
+            self._git('checkout', branch_name)
         else:
-            self.git('checkout', '-b', branch_name)
+            self._git('checkout', '-b', branch_name)
+        self.refs.add('refs/heads/{}'.format(branch_name))
         if reset_sha:
-            self.git('reset', '--hard', reset_sha)
+            self._git('reset', '--hard', reset_sha)
+
+    def branch(self, branch_name, sha):
+        """
+        Points a local branch at the commit for a given sha without touching
+        the working tree, creating the branch if needed.
+        """
+        refname = 'refs/heads/{}'.format(branch_name)
+        result = self._git('update-ref', refname, '{}^{{commit}}'.format(sha))
+        self.refs.add(refname)
+        return result
+
+    def is_ancestor(self, ancestor, sha):
+        """ Returns True if the first commit is reachable from the second.
+        """
+        return answer(self._git('merge-base', '--is-ancestor', ancestor, sha,
+                                check=False))
+
+    @in_phase('merge')
+    def merge(self, branch_name, base, other, message):
+        """
+        Merges `other` into `base` with a merge commit (like `merge --no-ff`)
+        and points the local branch at the result, which is returned as a sha.
+        See merge_commit for how the merge is made.
+        """
+        commit = self.merge_commit(base, other, message)
+        self.branch(branch_name, commit)
+        return commit
+
+    def merge_commit(self, base, other, message):
+        """
+        Returns the sha of the merge commit of `other` into `base`, or of
+        `base` if it already contains `other`, without pointing any branch
+        at it.
+
+        The merge is built with `git merge-tree` and `commit-tree` so nothing
+        is checked out and a bare repository is enough. A MergeConflict is
+        raised if the merge does not apply cleanly. Git releases before
+        MERGE_TREE_VERSION fall back to merging on a detached HEAD in the
+        working tree.
+        """
+        if self.is_ancestor(other, base):
+            return self._git('rev-parse', '{}^{{commit}}'.format(base)) \
+                .stdout.strip()
 
+        version = git_version(time_left(self.timeout, self.deadline))
+        if version < MERGE_TREE_VERSION:
+            self._git('checkout', '--detach', base)
+            self._git('merge', '--no-ff', '--message', message, other)
+            return self._git('rev-parse', 'HEAD').stdout.strip()
+
+        result = self._merge_tree(base, other)
+        return self._git(*commit_merge_command(result, base, other, message)) \
+            .stdout.strip()
+
+    def _merge_tree(self, base, other):
+        return merge_tree_result(self._git(
+            *merge_tree_command(base, other), check=False))
+
+    def conflicts(self, base, other):
+        """
+        Returns the paths which conflict when merging `other` into `base`, or
+        an empty list if they merge cleanly. The merge is only computed with
+        `git merge-tree`, so no ref or working tree file changes.
+        """
+        result = self._merge_tree(base, other)
+        return result.lines()[1:] if result.returncode == 1 else []
+
+    @in_phase('validate')
+    def check_merges(self, merges, labels=None):
+        """
+        Checks that every (base, other) pair in merges merges cleanly before
+        any of them is made. The checks run concurrently and a MergeConflict
+        naming every conflict found is raised, with the revisions in labels
+        named by their label. Git releases before MERGE_TREE_VERSION can not
+        merge without a working tree, so they skip the check and leave
+        conflicts to merge.
+        """
+        if not merges:
+            return
+        version = git_version(time_left(self.timeout, self.deadline))
+        if version < MERGE_TREE_VERSION:
+            return
+
+        def check(merge):
+            with phase('validate'):
+                return self.conflicts(*merge)
+
+        pool = ThreadPool(min(len(merges), MERGE_CHECK_WORKERS))
+        try:
+            found = pool.map(check, merges)
+        finally:
+            pool.close()
+            pool.join()
+        raise_conflicts(merges, found, labels)
+
+    @in_phase('tag')
     def tag(self, tag, message, sha=None):
         """ Creates an annotated tag on the repo at the provided sha (Or HEAD).
         """
-        args = []
-        if sha:
-            args.append(sha)
-        return self.git('tag', '--annotate', '--message', message, tag, *args)
+        result = self._git(*tag_command(tag, message, sha))
+        self.refs.add('refs/tags/{}'.format(tag))
+        self._last_releases = {}
+        return result
+
+    @in_phase('push')
+    def push(self, *refspecs, **options):
+        """
+        Pushes refspecs to origin and records them in the ref index. With
+        atomic=True either every ref is updated on origin or none are.
+        """
+        result = self._git(*push_command(refspecs, options.get('atomic')))
+        for refspec in refspecs:
+            self.refs.pushed(refspec)
+        return result
+
+    def push_batch(self):
+        """ Returns a PushBatch to collect ref updates for a single push.
+        """
+        return PushBatch(self)
 
+    def releases(self):
+        """ Lists all release tags in the repo, oldest version first.
+        """
+        return self.refs.release_tags()
+
+    @in_phase('validate')
     def get_last_release(self, sha):
         """
-        Returns the latest release tag on a given tree by calling get_last_tag
-        with the match argument specified in order to filter non-release tags.
+        Returns the release tag with the highest version which is reachable
+        from a given sha. Results are cached per commit for the session.
         """
-        return self.get_last_tag(sha, 'release-*')
+        commit = self._git('rev-parse', '--verify',
+                           '{}^{{commit}}'.format(sha)).stdout.strip()
+        if commit not in self._last_releases:
+            merged = self._git(*merged_releases_command(commit)).lines()
+            self._last_releases[commit] = latest_release(merged, sha)
+        return self._last_releases[commit]
 
     def get_last_tag(self, sha=None, match=None):
         """
         Returns the latest tag on a given tree. Can also filter by tags
         matching the match argument.
         """
-        options = ['--abbrev=0']
-        if match:
-            options += ['--match', match]
-        if sha:
-            options.append(sha)
-        tag = self.git('describe', *options).stdout.read()
-        return tag.decode().strip()
+        return self.git(*describe_command(sha, match)).stdout.strip()
+
+
+def answer(result):
+    """
+    Returns True if a git command which answers with its exit code, such as
+    `merge-base --is-ancestor`, exited with 0 and False if it exited with 1.
+    Other exit codes raise the failure of the command.
+    """
+    if result.returncode not in (0, 1):
+        raise failure(result.command, result.stderr)
+    return result.returncode == 0
+
+
+def merge_tree_command(base, other):
+    """
+    Returns the `git merge-tree` which merges two commits without a working
+    tree.
+    """
+    return ['merge-tree', '--write-tree', '--name-only', '--no-messages',
+            base, other]
+
+
+def merge_tree_result(result):
+    """
+    Returns the result of a merge_tree_command, which exits with 1 and lists
+    the conflicting paths if the merge conflicts. Raises the failure of the
+    command if it did not merge at all.
+    """
+    conflicted = result.returncode == 1 and result.stdout
+    if result.returncode != 0 and not conflicted:
+        raise failure(result.command, result.stderr)
+    return result
+
+
+def commit_merge_command(result, base, other, message):
+    """
+    Returns the `git commit-tree` which commits the tree a merge_tree_result
+    merged, or raises a MergeConflict naming the paths which conflict.
+    """
+    if result.returncode == 1:
+        raise MergeConflict(
+            "Unable to merge {} into {}.".format(other, base),
+            result.lines()[1:])
+    return ['commit-tree', result.lines()[0], '-p', base, '-p', other,
+            '-m', message]
+
+
+def tag_command(tag, message, sha=None):
+    """ Returns the `git tag` which creates an annotated tag at sha (Or HEAD).
+    """
+    return ['tag', '--annotate', '--message', message, tag] + (
+        [sha] if sha else [])
+
+
+def push_command(refspecs, atomic=False):
+    """ Returns the `git push` which pushes refspecs to origin.
+    """
+    return ['push'] + (['--atomic'] if atomic else []) + ['origin'] + list(
+        refspecs)
+
+
+def merged_releases_command(commit):
+    """
+    Returns the `git for-each-ref` which lists the release tags a commit
+    contains.
+    """
+    return ['for-each-ref', '--merged', commit, '--format=%(refname:short)',
+            'refs/tags/release-*']
+
+
+def describe_command(sha=None, match=None):
+    """
+    Returns the `git describe` which finds the latest tag on a tree,
+    optionally only among tags matching match.
+    """
+    options = ['--abbrev=0']
+    if match:
+        options += ['--match', match]
+    if sha:
+        options.append(sha)
+    return ['describe'] + options
+
+
+def fetch_refspec(ref):
+    """
+    Returns the refspec which fetches a ref pattern from origin the way a
+    clone would, with branches as remote-tracking branches.
+    """
+    if ref.startswith('refs/heads/'):
+        return '+{}:refs/remotes/origin/{}'.format(
+            ref, ref[len('refs/heads/'):])
+    return '+{}:{}'.format(ref, ref)
+
+
+def raise_conflicts(merges, found, labels=None):
+    """
+    Raises a MergeConflict for all (base, other) merges whose list of
+    conflicting paths in found is not empty. Paths are named as
+    '<other> into <base>: <path>', where revisions in labels are replaced by
+    their label.
+    """
+    labels = labels or {}
+    failed = [(tuple(labels.get(name, name) for name in merge), paths)
+              for merge, paths in zip(merges, found) if paths]
+    if failed:
+        raise MergeConflict(
+            "Unable to merge {}.".format(', '.join(
+                '{} into {}'.format(other, base)
+                for (base, other), _ in failed)),
+            ['{} into {}: {}'.format(other, base, path)
+             for (base, other), paths in failed for path in paths])
+
+
+def is_ssh_uri(clone_uri):
+    """ Returns True if git reaches a clone uri over SSH.
+    """
+    return bool(SSH_URI_PATTERN.match(clone_uri))
+
+
+def latest_release(tags, sha):
+    """
+    Returns the release tag with the highest version out of the tags which
+    are reachable from a sha.
+    """
+    latest = latest_version(
+        tag for tag in tags if tag.startswith(RELEASE_TAG_PREFIX))
+    if latest is None:
+        raise InvalidGitReference("No release tag found on {}".format(sha))
+    return latest
+
+
+class PushBatch():
+    """
+    Collects the ref updates and deletions of an operation so they are sent
+    to origin in one atomic push, which takes a single round trip and leaves
+    origin untouched if any of them is rejected.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.refspecs = []
+
+    def update(self, ref):
+        """ Adds a local branch or tag to update on origin.
+        """
+        self.refspecs.append(ref)
+
+    def delete(self, ref):
+        """ Adds a branch or tag to delete from origin.
+        """
+        self.refspecs.append(':{}'.format(ref))
+
+    def push(self):
+        """ Sends all collected updates to origin at once.
+        """
+        if self.refspecs:
+            return self.repo.push(*self.refspecs, atomic=True)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+from tempfile import NamedTemporaryFile
+
+import click
+
+from reflex.cache import MirrorCache
+from reflex.process import run_git
+from reflex.refs import RefIndex
+
+
+@click.command()
+@click.argument('repos', nargs=-1, required=True)
+@click.option('--production-branch', 'prod_branch', default='main',
+              help='The production branch where release tags live.')
+@click.option('--development-branch', 'dev_branches', default=['develop'],
+              multiple=True,
+              help='A development branch to count waiting commits on.')
+@click.option('--workers', type=int, default=8,
+              help='How many repos to scan at the same time.')
+@click.option('--cache-dir', envvar='REFLEX_CACHE_DIR', default=None,
+              help='Keep scan results, and count waiting commits in the '
+                   'mirrors, in this directory.')
+@click.option('--ttl', type=float, default=60,
+              help='How many seconds cached scan results are used for.')
+@click.option('--json', 'as_json', is_flag=True,
+              help='Print the status of each repo as JSON.')
+def main(repos, prod_branch, dev_branches, workers, cache_dir, ttl, as_json):
+    """ Shows the open release branches and last release of many repos.
+
+    Every repo is scanned with a single `git ls-remote`, nothing is cloned.
+    Commits waiting on the development branches are counted in the mirror
+    of a repo in the cache directory, when there is one which has them.
+    """
+    cache = StatusCache(cache_dir, ttl) if cache_dir else None
+    statuses = scan_all(repos, prod_branch, list(dev_branches), workers,
+                        cache)
+
+    if as_json:
+        sys.stdout.write(json.dumps(
+            [status.as_dict() for status in statuses], indent=2,
+            sort_keys=True))
+        sys.stdout.write('\n')
+    else:
+        sys.stdout.write(table(statuses))
+    if any(not status.ok for status in statuses):
+        sys.exit(1)
+
+
+class RepoStatus():
+    """
+    What a scan found in a repo: its open test branches, its last release
+    tag and how many commits each development branch has which production
+    does not, or None if they could not be counted.
+    """
+
+    def __init__(self, repo, test_branches=None, last_release=None,
+                 waiting=None, error=None):
+        self.repo = repo
+        self.test_branches = test_branches or []
+        self.last_release = last_release
+        self.waiting = waiting or {}
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def as_dict(self):
+        """ Returns the status as a dict which can be written as JSON.
+        """
+        return {
+            'repo': self.repo,
+            'test_branches': self.test_branches,
+            'last_release': self.last_release,
+            'waiting': self.waiting,
+            'error': self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, status):
+        """ Builds a status from the dict written by as_dict.
+        """
+        return cls(**status)
+
+
+def scan(clone_uri, prod_branch='main', dev_branches=None, mirror=None):
+    """
+    Returns the RepoStatus of a remote, read from a single `git ls-remote`.
+    Waiting commits are counted in the given mirror if it has the commits.
+    """
+    result = run_git(None, 'ls-remote', '--heads', '--tags', clone_uri)
+    refs = RefIndex.parse_remote(result.lines())
+
+    releases = refs.release_tags()
+    production = refs.remotes.get('origin/{}'.format(prod_branch))
+    waiting = {}
+    for branch in dev_branches or ['develop']:
+        waiting[branch] = count_waiting(
+            mirror, production, refs.remotes.get('origin/{}'.format(branch)))
+    return RepoStatus(clone_uri, refs.test_branches(),
+                      releases[-1] if releases else None, waiting)
+
+
+def count_waiting(mirror, production, development):
+    """
+    Returns the number of commits, leaving out merges, which a development
+    branch has and production does not. Returns None if either branch is
+    missing or the commits can not be counted without fetching them.
+    """
+    if production is None or development is None:
+        return None
+    if production == development:
+        return 0
+    if mirror is None or not os.path.isdir(mirror):
+        return None
+    result = run_git(mirror, 'rev-list', '--count', '--no-merges',
+                     '{}..{}'.format(production, development), check=False)
+    if result.returncode != 0:
+        return None
+    return int(result.stdout)
+
+
+def scan_all(repos, prod_branch='main', dev_branches=None, workers=8,
+             cache=None):
+    """
+    Scans repos concurrently on a pool of worker threads, reusing the cached
+    status of repos which were scanned within the cache's ttl. Failures are
+    captured in the returned RepoStatus rather than raised. Returns the
+    statuses in the order the repos were given.
+    """
+    dev_branches = dev_branches or ['develop']
+    mirrors = MirrorCache(cache.root) if cache else None
+
+    def key(repo):
+        return ' '.join([repo, prod_branch] + dev_branches)
+
+    def scan_repo(repo):
+        cached = cache and cache.get(key(repo))
+        if cached:
+            return RepoStatus.from_dict(cached)
+        try:
+            status = scan(repo, prod_branch, dev_branches,
+                          mirrors and mirrors.path(repo))
+        except Exception as error:
+            return RepoStatus(repo, error='{}: {}'.format(
+                type(error).__name__, error))
+        if cache:
+            cache.put(key(repo), status.as_dict())
+        return status
+
+    if not repos:
+        return []
+    pool = ThreadPool(max(1, min(workers, len(repos))))
+    try:
+        statuses = pool.map(scan_repo, repos)
+    finally:
+        pool.close()
+        pool.join()
+    if cache:
+        cache.save()
+    return statuses
+
+
+class StatusCache():
+    """
+    Scan results kept in a JSON file under a directory, which are used for
+    `ttl` seconds after they were scanned.
+    """
+
+    def __init__(self, root, ttl):
+        self.root = root
+        self.ttl = ttl
+        self.path = os.path.join(root, 'status.json')
+        self.entries = {}
+        if os.path.isfile(self.path):
+            with open(self.path) as saved:
+                self.entries = json.load(saved)
+
+    def get(self, key):
+        """ Returns the cached status for a key if it is still fresh.
+        """
+        entry = self.entries.get(key)
+        if entry and time.time() - entry['scanned'] < self.ttl:
+            return entry['status']
+        return None
+
+    def put(self, key, status):
+        """ Caches the status for a key as scanned now.
+        """
+        self.entries[key] = {'scanned': time.time(), 'status': status}
+
+    def save(self):
+        """ Writes the fresh entries to the cache file in one go.
+        """
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        oldest = time.time() - self.ttl
+        entries = dict((key, entry) for key, entry in self.entries.items()
+                       if entry['scanned'] >= oldest)
+        with NamedTemporaryFile('w', dir=self.root, delete=False) as saved:
+            json.dump(entries, saved)
+        os.rename(saved.name, self.path)
+
+
+def table(statuses):
+    """ Formats statuses as a table with a row for each repo.
+    """
+    rows = [('REPO', 'LAST RELEASE', 'OPEN TEST BRANCHES', 'WAITING')]
+    for status in statuses:
+        if not status.ok:
+            rows.append((status.repo, 'FAILED', status.error, ''))
+            continue
+        rows.append((
+            status.repo,
+            status.last_release or '-',
+            ', '.join(status.test_branches) or '-',
+            ', '.join('{}: {}'.format(
+                branch, '?' if count is None else count)
+                for branch, count in sorted(status.waiting.items())),
+        ))
+    widths = [max(len(row[column]) for row in rows)
+              for column in range(len(rows[0]) - 1)]
+    return ''.join('{}\n'.format('  '.join(
+        [cell.ljust(width) for cell, width in zip(row, widths)] +
+        [row[-1]]).rstrip()) for row in rows)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+
+from reflex.process import run_git
+from reflex.repo import PrestineRepo
+
+# The asyncio variant of PrestineRepo uses syntax only Python 3 understands.
+collect_ignore = []
+if sys.version_info < (3, 6):
+    collect_ignore.append('test_aio.py')
+
+
+@pytest.fixture
+def identity(monkeypatch):
+    """
+    Fixture which sets the identity git commits and tags with in new clones.
+    """
+    for variable in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+        monkeypatch.setenv(variable, 'ci')
+    for variable in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+        monkeypatch.setenv(variable, 'ci@test.com')
+
+
+@pytest.fixture
+def merge_upstream(tmpdir, identity):
+    """
+    Fixture which sets up a bare upstream repo whose 'feature' branch merges
+    cleanly into main and whose 'clash' branch conflicts with main in 'f'.
+    """
+    upstream = str(tmpdir.mkdir('reflex-merge'))
+    run_git(upstream, 'init', '--bare', '.')
+    with PrestineRepo(upstream) as repo:
+        def commit(branch, name, content):
+            repo.git('checkout', branch)
+            with open(os.path.join(repo.dir, name), 'w') as changed:
+                changed.write(content)
+            repo.git('add', name)
+            repo.git('commit', '-m', '{} is {}'.format(name, content))
+
+        repo.git('checkout', '-b', 'main')
+        with open(os.path.join(repo.dir, 'f'), 'w') as changed:
+            changed.write('a')
+        repo.git('add', 'f')
+        repo.git('commit', '-m', 'f is a')
+        repo.git('branch', 'feature')
+        repo.git('branch', 'clash')
+        commit('feature', 'g', 'g')
+        commit('clash', 'f', 'c')
+        commit('main', 'f', 'b')
+        repo.git('push', 'origin', 'main', 'feature', 'clash')
+    return upstream
+
+
+@pytest.fixture
+def make_released_upstream(tmpdir, identity):
+    """
+    Fixture which returns a function that sets up a bare upstream repo, in a
+    directory of the given name, with a released main branch and a develop
+    branch which is ready for the next release.
+    """
+    def make(name='reflex-released'):
+        upstream = str(tmpdir.mkdir(name))
+        run_git(upstream, 'init', '--bare', '.')
+        with PrestineRepo(upstream) as repo:
+            repo.git('checkout', '-b', 'main')
+            repo.git('commit', '--allow-empty', '-m', 'initial commit')
+            repo.git('tag', '-a', 'release-1.0.0', '-m', 'release-1.0.0')
+            repo.git('checkout', '-b', 'develop')
+            repo.git('commit', '--allow-empty', '-m', 'feature')
+            repo.git('push', 'origin', 'main', 'develop', 'release-1.0.0')
+        return upstream
+    return make
+
+
+@pytest.fixture
+def released_upstream(make_released_upstream):
+    """ Fixture which sets up a single released upstream repo.
+    """
+    return make_released_upstream()
+
+
+@pytest.fixture
+def fake_ssh(tmpdir, monkeypatch):
+    """
+    Fixture which points GIT_SSH_COMMAND at a script that logs how it was
+    called and runs the remote command locally, so SSH remotes can be used
+    without an SSH server. Returns the path of the log.
+    """
+    log = str(tmpdir.join('ssh.log'))
+    script = str(tmpdir.join('fake-ssh'))
+    with open(script, 'w') as fake:
+        fake.write("""#!/bin/sh
+echo "$@" >> {}
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -O) exit 0;;
+        -o|-p) shift 2;;
+        -*) shift;;
+        *) break;;
+    esac
+done
+shift
+exec sh -c "$*"
+""".format(log))
+    os.chmod(script, 0o755)
+    monkeypatch.setenv('GIT_SSH_COMMAND', script)
+    monkeypatch.setenv('GIT_SSH_VARIANT', 'ssh')
+    return log
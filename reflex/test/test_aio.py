@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import sys
+import time
+from subprocess import Popen
+
+import pytest
+from mock import patch
+
+import reflex.aio as aio
+from reflex.cache import MirrorCache
+from reflex.error import (
+    DuplicateGitReference, GitCommandError, GitTimeout, InvalidGitReference,
+    InvalidUpgradePath, MergeConflict,
+)
+from reflex.journal import Journal
+from reflex.pool import WorkspacePool
+from reflex.trace import Tracer, current_phase, phase
+
+
+def run(coroutine):
+    """ Runs a coroutine to completion on a fresh event loop.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_run_git(tmpdir):
+    """
+    Ensure the async git runner captures output and raises GitCommandError
+    when git fails.
+    """
+    result = run(aio.run_git(str(tmpdir), 'init', '.'))
+    assert result.returncode == 0
+    assert 'Initialized' in result.stdout
+
+    with pytest.raises(GitCommandError) as error:
+        run(aio.run_git(str(tmpdir), 'rev-parse', '--verify', 'nothing'))
+    assert error.value.args[1] == ['fatal: Needed a single revision']
+
+
+def test_stream_git(tmpdir):
+    """
+    Ensure the async git stream yields lines, raises GitCommandError when git
+    fails and stops git when it is closed early.
+    """
+    cwd = str(tmpdir)
+    Popen(['git', 'init', '.'], cwd=cwd).wait()
+    for i in range(5):
+        Popen(['git', 'config', 'chatty.value{}'.format(i), 'x' * 100000],
+              cwd=cwd).wait()
+    tmpdir.join('.gitignore').write('')
+
+    async def collect(*args):
+        return [line async for line in aio.stream_git(cwd, *args)]
+
+    async def first(*args):
+        lines = aio.stream_git(cwd, *args)
+        line = await lines.__anext__()
+        await lines.aclose()
+        return line
+
+    assert len(run(collect('config', '--get-regexp', 'chatty'))) == 5
+    assert run(collect('ls-files', '-z', '--others')) == ['.gitignore\0']
+    assert run(first('config', '--get-regexp', 'chatty')).startswith(
+        'chatty.value0 ')
+    with pytest.raises(GitCommandError):
+        run(collect('rev-parse', '--verify', 'nothing'))
+
+
+def test_timeout(tmpdir):
+    """
+    Ensure async git commands which run past their timeout are killed and
+    raise GitTimeout.
+    """
+    hang = ['-c', 'alias.hang=!sleep 30', 'hang']
+
+    async def collect(*args, **options):
+        return [line async for line in aio.stream_git(
+            str(tmpdir), *args, **options)]
+
+    start = time.time()
+    with pytest.raises(GitTimeout):
+        run(aio.run_git(str(tmpdir), *hang, timeout=0.2))
+    with pytest.raises(GitTimeout):
+        run(collect(*hang, timeout=0.2))
+    assert time.time() - start < 5
+    assert run(aio.run_git(str(tmpdir), 'version', timeout=10)).returncode \
+        == 0
+
+
+def test_failed_setup(released_upstream, tmpdir):
+    """
+    Ensure a repo which fails to clone, or whose deadline passes, removes
+    its clone, and that pools are refused.
+    """
+    async def enter(repo):
+        async with repo:
+            pass
+
+    for repo, error in [
+            (aio.AsyncPrestineRepo(str(tmpdir.join('missing'))),
+             GitCommandError),
+            (aio.AsyncPrestineRepo(released_upstream, deadline=0),
+             GitTimeout)]:
+        with pytest.raises(error):
+            run(enter(repo))
+        assert not os.path.exists(repo.dir)
+
+    with pytest.raises(ValueError):
+        aio.AsyncPrestineRepo(released_upstream,
+                              pool=WorkspacePool(str(tmpdir)))
+
+
+def test_release_cycle(released_upstream, capsys):
+    """
+    Ensure a release can be opened, refused a second time and closed through
+    the async actions.
+    """
+    run(aio.run_action('release', released_upstream, '1.1.0'))
+    with pytest.raises(DuplicateGitReference):
+        run(aio.run_action('release', released_upstream, '1.1.0'))
+    with pytest.raises(InvalidGitReference):
+        run(aio.run_action('close', released_upstream, '1.2.0'))
+    run(aio.run_action('close', released_upstream, '1.1.0',
+                       clone_strategy='full'))
+
+    async def check():
+        async with aio.AsyncPrestineRepo(released_upstream) as repo:
+            assert await repo.get_last_release('origin/main') == \
+                'release-1.1.0'
+            assert await repo.get_last_release('origin/develop') == \
+                'release-1.1.0'
+            assert await repo.branches('origin/test-*') == []
+            assert await repo.releases() == ['release-1.0.0', 'release-1.1.0']
+            assert await repo.get_last_tag('origin/develop~1', 'release-*') \
+                == 'release-1.0.0'
+    run(check())
+
+    out, err = capsys.readouterr()
+    assert "Successfully opened release branch 'test-1.1.0'" in out
+    assert "Successfully closed release branch 'test-1.1.0'" in out
+
+
+def test_close_journal_and_phases(released_upstream, capsys, tmpdir):
+    """
+    Ensure the async actions trace their phases and journal their steps like
+    the sync ones, so a finished close run again has nothing left to push.
+    """
+    journal_dir = str(tmpdir.join('journal'))
+    run(aio.run_action('release', released_upstream, '1.1.0'))
+    with Tracer() as tracer:
+        run(aio.run_action('close', released_upstream, '1.1.0',
+                           journal=Journal.open(journal_dir, released_upstream,
+                                                'close', '1.1.0')))
+    assert {'clone', 'validate', 'merge', 'tag', 'push'} <= set(
+        name for _, name, _ in tracer.calls)
+
+    journal = Journal.open(journal_dir, released_upstream, 'close', '1.1.0')
+    assert 'push' in journal
+    with Tracer() as tracer:
+        run(aio.run_action('close', released_upstream, '1.1.0',
+                           journal=journal))
+    assert 'push' not in set(name for _, name, _ in tracer.calls)
+
+    out, err = capsys.readouterr()
+    assert 'Resuming, test-1.1.0 is already merged into main.' in out
+
+
+def test_hotfix(released_upstream, capsys, tmpdir):
+    """
+    Ensure hotfix branches are opened off of the last release and that open
+    test branches are warned about, also when cloning through a cache.
+    """
+    cache = MirrorCache(str(tmpdir.join('cache')))
+    run(aio.run_action('hotfix', released_upstream, '1.0.1', cache=cache))
+    with pytest.raises(InvalidUpgradePath):
+        run(aio.run_action('hotfix', released_upstream, '0.9.0', cache=cache))
+    run(aio.run_action('release', released_upstream, '1.1.0', cache=cache))
+
+    out, err = capsys.readouterr()
+    assert 'Creating new hotfix branch off of release-1.0.0' in out
+    assert 'origin/test-1.0.1' in err
+
+
+def test_checkout(released_upstream):
+    """
+    Ensure checkout switches to existing branches, creates missing ones and
+    tags land in the ref index.
+    """
+    async def check():
+        async with aio.AsyncPrestineRepo(released_upstream) as repo:
+            await repo.checkout('develop')
+            await repo.checkout('feature', 'origin/main')
+            await repo.tag('feature-tag', 'A tag', 'origin/develop')
+            assert 'feature' in repo.refs.heads
+            assert 'feature-tag' in repo.refs.tags
+            assert (await repo.git('rev-parse', '--abbrev-ref', 'HEAD')) \
+                .stdout.strip() == 'feature'
+            await repo.git('fetch', 'origin')
+            assert repo.refs is None
+            await repo.push_batch().push()
+
+            # Ref formats reflex can not read are loaded with git.
+            with patch('reflex.aio.read_refs', return_value=None):
+                assert 'origin/develop' in await repo.branches()
+    run(check())
+
+
+def test_create_release(released_upstream, capsys):
+    """
+    Ensure a release branch can be opened off a given local branch.
+    """
+    async def check():
+        async with aio.AsyncPrestineRepo(released_upstream) as repo:
+            await repo.branch('develop', 'origin/develop')
+            await aio.create_release(repo, 'develop', '1.1.0')
+    run(check())
+
+    out, err = capsys.readouterr()
+    assert "Successfully opened release branch 'test-1.1.0'" in out
+
+
+def test_run_plan():
+    """
+    Ensure a plan is sent the results of the coroutines, values and plans it
+    yields, and that errors are raised into it.
+    """
+    seen = []
+
+    async def double(number):
+        return number * 2
+
+    def sub_plan():
+        seen.append((yield double(1)))
+
+    def failing():
+        yield sub_plan()
+        raise ValueError('failed')
+
+    def plan():
+        seen.append((yield double(2)))
+        seen.append((yield 'value'))
+        seen.append((yield sub_plan()))
+        try:
+            yield double(None)
+        except TypeError:
+            seen.append('raised')
+        try:
+            yield failing()
+        except ValueError as error:
+            seen.append(str(error))
+
+    run(aio.run_plan(plan()))
+    assert seen == [4, 'value', 2, None, 'raised', 2, 'failed']
+
+
+def test_merge(merge_upstream):
+    """
+    Ensure the async merge engine merges cleanly, skips merged commits,
+    reports conflicts and falls back to the working tree on old git releases.
+    """
+    async def check():
+        async with aio.AsyncPrestineRepo(merge_upstream) as repo:
+            commit = await repo.merge('main', 'origin/main', 'origin/feature',
+                                      'Merge feature')
+            assert (await repo.git('show', commit + ':g')).stdout == 'g'
+
+            base = (await repo.git('rev-parse', 'origin/main')).stdout.strip()
+            assert await repo.merge('main', 'origin/main', 'origin/main~1',
+                                    'Nothing to merge') == base
+
+            with pytest.raises(MergeConflict):
+                await repo.merge('main', 'origin/main', 'origin/clash',
+                                 'Clash')
+            with pytest.raises(GitCommandError):
+                await repo.is_ancestor('origin/missing', 'origin/main')
+
+            async def not_merged(ancestor, sha):
+                return False
+
+            with patch.object(repo, 'is_ancestor', new=not_merged):
+                with pytest.raises(GitCommandError):
+                    await repo.merge('main', 'origin/main', 'origin/missing',
+                                     'Oops')
+
+            with patch('reflex.aio.git_version', return_value=(2, 30, 0)):
+                commit = await repo.merge('main', 'origin/main',
+                                          'origin/feature', 'Merge feature')
+                # Conflicts are left to the merge on old git releases.
+                await repo.check_merges([('origin/main', 'origin/clash')])
+            assert (await repo.git('rev-parse', 'HEAD')).stdout.strip() == \
+                commit
+            await repo.check_merges([])
+    run(check())
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='Tasks share their phases without contextvars.')
+def test_phase_per_task():
+    """
+    Ensure asyncio tasks running at the same time each keep their own phase.
+    """
+    seen = []
+
+    async def in_phase(name):
+        with phase(name):
+            await asyncio.sleep(0.01)
+            seen.append((name, current_phase()))
+
+    async def both():
+        await asyncio.gather(in_phase('merge'), in_phase('tag'))
+    run(both())
+
+    assert sorted(seen) == [('merge', 'merge'), ('tag', 'tag')]
+    assert current_phase() == 'other'
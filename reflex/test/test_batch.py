@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+from click.testing import CliRunner
+
+import reflex.batch as batch
+from reflex.repo import PrestineRepo
+
+
+@pytest.fixture
+def upstreams(make_released_upstream):
+    """
+    Fixture which sets up two bare upstream repos with a 'release-1.0.0' tag
+    on main and unreleased commits on develop.
+    """
+    return [make_released_upstream(name)
+            for name in ('service-a', 'service-b')]
+
+
+def test_run_batch(upstreams):
+    """
+    Ensure every job runs, a failing job does not stop the others and jobs for
+    the same repo run in manifest order.
+    """
+    service_a, service_b = upstreams
+    jobs = [
+        {'repo': service_a, 'version': '1.1.0', 'action': 'release'},
+        {'repo': service_b, 'version': '0.9.0', 'action': 'release'},
+        {'repo': service_a, 'version': '1.1.0', 'action': 'close'},
+    ]
+
+    results, elapsed = batch.run_batch(jobs, workers=2)
+
+    assert [result.job for result in results] == jobs
+    assert [result.ok for result in results] == [True, False, True]
+    assert 'InvalidUpgradePath' in results[1].error
+    assert elapsed >= max(result.elapsed for result in results)
+
+    with PrestineRepo(service_a) as repo:
+        assert repo.get_last_release('origin/main') == 'release-1.1.0'
+
+
+def test_job_result():
+    """
+    Ensure job results print a line per job with the error on failures.
+    """
+    job = {'repo': 'uri', 'version': '1.0.0', 'action': 'close'}
+
+    assert str(batch.JobResult(job, 1.25)) == \
+        'ok     close   1.0.0      uri (1.2s)'
+    assert str(batch.JobResult(job, 2, 'Oops')) == \
+        'FAILED close   1.0.0      uri (2.0s)\n         Oops'
+
+
+def test_validate_job():
+    """
+    Ensure manifest jobs need a repo, version and known action.
+    """
+    assert batch.validate_job(
+        {'repo': 'uri', 'version': '1.0.0', 'action': 'hotfix'}) is None
+    assert batch.validate_job({'repo': 'uri', 'action': 'hotfix'}) == \
+        "Missing 'version'."
+    assert 'Unknown action' in batch.validate_job(
+        {'repo': 'uri', 'version': '1.0.0', 'action': 'deploy'})
+
+
+def test_main(upstreams, tmpdir):
+    """
+    Ensure the batch command reports each job and fails if any job failed.
+    """
+    service_a, service_b = upstreams
+    manifest = tmpdir.join('manifest.json')
+    manifest.write(json.dumps([
+        {'repo': service_a, 'version': '1.1.0', 'action': 'release'},
+        {'repo': service_b, 'version': '1.1.0', 'action': 'hotfix',
+         'production_branch': 'main'},
+    ]))
+
+    runner = CliRunner()
+    result = runner.invoke(batch.main, [
+        str(manifest), '--cache-dir', str(tmpdir.join('cache'))])
+
+    assert result.exit_code == 0
+    assert 'Finished 2 jobs' in result.output
+    assert '0 failed' in result.output
+
+    result = runner.invoke(batch.main, [str(manifest)])
+
+    assert result.exit_code == 1
+    assert '2 failed' in result.output
+    assert 'DuplicateGitReference' in result.output
+
+
+def test_main_invalid_manifest(tmpdir):
+    """
+    Ensure the batch command runs nothing when a job is invalid.
+    """
+    manifest = tmpdir.join('manifest.json')
+    manifest.write(json.dumps([{'repo': 'uri', 'action': 'close'}]))
+
+    result = CliRunner().invoke(batch.main, [str(manifest)])
+
+    assert result.exit_code == 1
+    assert 'Invalid job' in result.output
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fcntl
+import os
+import time
+from subprocess import Popen
+
+import pytest
+from mock import patch
+
+from reflex.cache import MirrorCache, disk_usage
+from reflex.error import GitCommandError, GitTimeout
+from reflex.process import run_git
+from reflex.repo import PrestineRepo
+
+
+@pytest.fixture
+def upstream(tmpdir):
+    """
+    Fixture which sets up a bare upstream repo with a single commit on main.
+    """
+    tempdir = str(tmpdir.mkdir('reflex-upstream'))
+
+    result = Popen(['git', 'init', '--bare', '.'], cwd=tempdir)
+    result.wait()
+    with PrestineRepo(tempdir) as repo:
+        repo.git('checkout', '-b', 'main')
+        repo.git('config', 'user.email', 'ci@test.com')
+        repo.git('config', 'user.name', 'ci')
+        repo.git('commit', '--allow-empty', '-m', 'initial commit')
+        repo.git('push', 'origin', 'main:main')
+    return tempdir
+
+
+def test_mirror_is_created_and_updated(upstream, tmpdir):
+    """
+    Ensure a mirror is cloned on first use and fetched on later uses.
+    """
+    cache = MirrorCache(str(tmpdir.join('cache')))
+    mirror = cache.update(upstream)
+
+    assert mirror == cache.path(upstream)
+    assert cache.mirrors() == [mirror]
+
+    with PrestineRepo(upstream) as repo:
+        repo.git('config', 'user.email', 'ci@test.com')
+        repo.git('config', 'user.name', 'ci')
+        repo.git('checkout', 'main')
+        repo.git('commit', '--allow-empty', '-m', 'second commit')
+        repo.git('push', 'origin', 'main')
+        head = repo.git('rev-parse', 'HEAD').stdout.strip()
+
+    assert cache.update(upstream) == mirror
+    assert run_git(mirror, 'rev-parse', 'main').stdout.strip() == head
+
+
+def test_failed_mirror_clone_is_cleaned_up(tmpdir):
+    """
+    Ensure an interrupted mirror clone does not leave anything in the cache.
+    """
+    cache = MirrorCache(str(tmpdir.join('cache')))
+
+    with pytest.raises(GitCommandError):
+        cache.update(str(tmpdir.join('missing')))
+
+    assert os.listdir(cache.root) == []
+
+
+def test_failed_mirror_move_is_cleaned_up(upstream, tmpdir):
+    """
+    Ensure a mirror clone which can not be moved into place, with no other
+    mirror there instead, fails without leaving anything in the cache.
+    """
+    cache = MirrorCache(str(tmpdir.join('cache')))
+
+    with patch('reflex.cache.os.rename', side_effect=OSError):
+        with pytest.raises(OSError):
+            cache.update(upstream)
+
+    assert os.listdir(cache.root) == []
+
+
+def test_prestinerepo_clones_from_mirror(upstream, tmpdir):
+    """
+    Ensure a PrestineRepo made with a cache clones the mirror but keeps
+    pointing 'origin' at the real remote.
+    """
+    cache = MirrorCache(str(tmpdir.join('cache')))
+
+    with PrestineRepo(upstream, cache=cache) as repo:
+        url = repo.git('remote', 'get-url', 'origin').stdout.strip()
+        assert url == upstream
+        assert 'origin/main' in repo.branches()
+
+    assert cache.mirrors() == [cache.path(upstream)]
+
+
+def test_evict_by_age(tmpdir):
+    """
+    Ensure mirrors unused for longer than max_age are evicted.
+    """
+    cache = MirrorCache(str(tmpdir), max_age=60)
+    old = str(tmpdir.mkdir('old.git'))
+    new = str(tmpdir.mkdir('new.git'))
+    kept = str(tmpdir.mkdir('kept.git'))
+    long_ago = time.time() - 120
+    os.utime(old, (long_ago, long_ago))
+    os.utime(kept, (long_ago, long_ago))
+
+    assert cache.evict(keep=kept) == [old]
+    assert cache.mirrors() == [kept, new]
+
+
+def test_evict_by_size(tmpdir):
+    """
+    Ensure the least recently used mirrors are evicted once the cache grows
+    past max_size.
+    """
+    cache = MirrorCache(str(tmpdir), max_size=150)
+    for age, name in enumerate(['c.git', 'b.git', 'a.git']):
+        mirror = tmpdir.mkdir(name)
+        mirror.join('objects').write('x' * 100)
+        stamp = time.time() - age * 60
+        os.utime(str(mirror), (stamp, stamp))
+
+    assert disk_usage(str(tmpdir)) == 300
+    assert cache.evict(keep=str(tmpdir.join('a.git'))) == [
+        str(tmpdir.join('b.git')),
+        str(tmpdir.join('c.git')),
+    ]
+    assert cache.mirrors() == [str(tmpdir.join('a.git'))]
+
+
+def test_evict_skips_locked_mirrors(tmpdir):
+    """
+    Ensure a mirror which another run holds the lock of is not evicted.
+    """
+    cache = MirrorCache(str(tmpdir), max_age=0)
+    busy = str(tmpdir.mkdir('busy.git'))
+    idle = str(tmpdir.mkdir('idle.git'))
+    long_ago = time.time() - 120
+    os.utime(busy, (long_ago, long_ago))
+    os.utime(idle, (long_ago, long_ago))
+
+    with open('{}.lock'.format(busy), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        assert cache.evict() == [idle]
+    assert cache.mirrors() == [busy]
+    assert cache.evict() == [busy]
+
+
+def test_lock_stops_waiting_at_the_deadline(tmpdir):
+    """
+    Ensure waiting for the lock of a mirror another run holds raises
+    GitTimeout once the deadline passes, and that the lock is taken at once
+    when it is free.
+    """
+    cache = MirrorCache(str(tmpdir))
+    uri = 'ssh://git@example.com/reflex.git'
+    with cache.lock(uri):
+        with pytest.raises(GitTimeout):
+            cache.lock(uri, time.time() + 0.3)
+        with pytest.raises(GitTimeout):
+            PrestineRepo(uri, cache=cache, deadline=0.3).setup()
+    cache.lock(uri, time.time() + 0.3).close()
+
+
+def test_mirror_cloned_twice_at_once(upstream, tmpdir):
+    """
+    Ensure a mirror clone which loses the race to move into place uses the
+    mirror which won instead of failing.
+    """
+    cache = MirrorCache(str(tmpdir.join('cache')))
+    rename = os.rename
+
+    def race(staging, mirror):
+        run_git(None, 'clone', '--mirror', upstream, mirror)
+        rename(staging, mirror)
+
+    with patch('reflex.cache.os.rename', side_effect=race):
+        mirror = cache.update(upstream)
+
+    assert mirror == cache.path(upstream)
+    assert sorted(os.listdir(cache.root)) == [
+        os.path.basename(mirror)]
+    assert run_git(mirror, 'rev-parse', 'main').returncode == 0
+
+
+def test_empty_cache(tmpdir):
+    """
+    Ensure a cache whose root does not exist yet has no mirrors to evict.
+    """
+    cache = MirrorCache(str(tmpdir.join('nothing')), max_size=0, max_age=0)
+
+    assert cache.mirrors() == []
+    assert cache.evict() == []
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+from click.testing import CliRunner
+
+import reflex.cli as cli
+from reflex.changelog import (
+    Commit, as_json, grouped, markdown, with_tickets, write_notes,
+)
+from reflex.process import run_git
+from reflex.repo import PrestineRepo
+
+
+def history():
+    """
+    Returns commits in the order `git log --topo-order` lists two merged
+    feature branches and commits made directly on main.
+    """
+    return [
+        Commit('m2', ['y', 'f2a'], 'ci', 'Merge f2'),
+        Commit('f2a', ['y'], 'ci', 'SVC-2 f2 a'),
+        Commit('y', ['m1'], 'ci', 'main y'),
+        Commit('m1', ['x', 'f1b'], 'ci', 'Merge f1'),
+        Commit('f1b', ['f1a'], 'ci', 'f1 b for SVC-1 and SVC-3'),
+        Commit('f1a', ['base'], 'ci', 'f1 a'),
+        Commit('x', ['base'], 'ci', 'main x'),
+    ]
+
+
+def test_grouped():
+    """
+    Ensure commits are grouped under the merge which brought them in while
+    first-parent commits stand on their own.
+    """
+    assert [(commit.sha, merge and merge.sha)
+            for commit, merge in grouped(iter(history()))] == [
+        ('m2', None), ('f2a', 'm2'), ('y', None), ('m1', None),
+        ('f1b', 'm1'), ('f1a', 'm1'), ('x', None),
+    ]
+
+
+def test_markdown():
+    """
+    Ensure Markdown notes nest merged commits and lead with ticket ids.
+    """
+    entries = with_tickets(grouped(iter(history())), r'SVC-\d+')
+    lines = list(markdown(entries, 'release-1.1.0', 'release-1.0.0'))
+
+    assert lines[0] == '# release-1.1.0\n'
+    assert lines[2:5] == [
+        '- Merge f2 (m2)\n',
+        '  - [SVC-2] SVC-2 f2 a (f2a)\n',
+        '- main y (y)\n',
+    ]
+    assert lines[6] == '  - [SVC-1, SVC-3] f1 b for SVC-1 and SVC-3 (f1b)\n'
+
+
+def test_json():
+    """
+    Ensure JSON notes are a valid document naming each commit's merge.
+    """
+    document = json.loads(''.join(as_json(
+        grouped(iter(history())), 'release-1.1.0', 'release-1.0.0')))
+
+    assert document['release'] == 'release-1.1.0'
+    assert [commit['merged_by'] for commit in document['commits']] == [
+        None, 'm2', None, None, 'm1', 'm1', None]
+    assert json.loads(''.join(as_json(iter([]), 'a', 'b')))['commits'] == []
+
+
+def test_release_notes_option(released_upstream, tmpdir):
+    """
+    Ensure closing a release with --release-notes writes the commits since
+    the release production was at in the same run.
+    """
+    notes = str(tmpdir.join('notes.md'))
+    # A release tag which is not on production does not start the notes.
+    stray = run_git(released_upstream, '-c', 'user.name=ci', '-c',
+                    'user.email=ci@test.com', 'commit-tree', 'develop^{tree}',
+                    '-p', 'main', '-m', 'stray').stdout.strip()
+    run_git(released_upstream, 'tag', 'release-1.0.5', stray)
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [
+        '1.1.0', '--repo', released_upstream, '--release'])
+    assert result.exit_code == 0
+    result = runner.invoke(cli.main, [
+        '1.1.0', '--repo', released_upstream, '--close',
+        '--release-notes', notes])
+    assert result.exit_code == 0
+
+    with open(notes) as written:
+        lines = written.read().splitlines()
+    assert lines[0] == '# release-1.1.0'
+    assert lines[2] == 'Changes since release-1.0.0.'
+    assert lines[4].startswith(
+        "- Merge remote-tracking branch 'origin/test-1.1.0' into main (")
+    assert lines[5].startswith('  - feature (')
+    assert len(lines) == 6
+
+
+def test_write_notes(released_upstream, tmpdir):
+    """
+    Ensure no notes are written for the first release, which has no release
+    before it, and that ticket ids are picked out of notes from a given ref.
+    """
+    notes = str(tmpdir.join('notes.md'))
+    run_git(released_upstream, 'tag', '-a', 'release-1.1.0', '-m', 'next',
+            'develop')
+    with PrestineRepo(released_upstream) as repo, open(notes, 'w') as out:
+        assert write_notes(repo, 'release-1.0.0', out) is None
+        assert out.tell() == 0
+
+        assert write_notes(repo, 'release-1.1.0', out, since='release-1.0.0',
+                           ticket_pattern='feat[a-z]*') == 'release-1.0.0'
+
+    with open(notes) as written:
+        assert written.read().splitlines()[-1].startswith(
+            '- [feature] feature (')
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 from subprocess import Popen
 
 import pytest
@@ -9,9 +10,12 @@ from mock import Mock, patch, ANY
 
 import reflex.cli as cli
 from reflex.error import (
-    DuplicateGitReference, InvalidGitReference, InvalidUpgradePath,
+    DuplicateGitReference, GitCommandError, InvalidGitReference,
+    InvalidUpgradePath, InvalidVersion, MergeConflict,
 )
-from reflex.repo import PrestineRepo
+from reflex.journal import Journal
+from reflex.process import run_git, stream_git
+from reflex.repo import PrestineRepo, PushBatch
 
 
 @pytest.fixture
@@ -45,6 +49,20 @@ def releaseable_repo(tmpdir):
         yield repo
 
 
+@pytest.fixture
+def partial_clone_uri(releaseable_repo):
+    """
+    Fixture which allows partial clones of the releaseable repo's upstream and
+    returns a file:// uri for it, since local path clones ignore filters.
+    """
+    releaseable_repo.git('push', 'origin', 'release-1.0.0')
+    upstream = releaseable_repo.git(
+        'remote', 'get-url', 'origin').stdout.strip()
+    Popen(['git', 'config', 'uploadpack.allowFilter', 'true'],
+          cwd=upstream).wait()
+    return 'file://{}'.format(upstream)
+
+
 def test_validate_upgrade():
     """
     Ensure upgrades upgrade from only valid upgrade paths.
@@ -58,6 +76,10 @@ def test_validate_upgrade():
         ('1.2.5', '1.9.1'),
         ('1.11.1', '1.12.3'),
         ('1.11.1', '2.0.0'),
+        ('1.0.0', '1.0.1-rc.1'),
+        ('1.0.1-rc.1', '1.0.1'),
+        ('1.0.1-alpha', '1.0.1-beta'),
+        ('release-1.0.0', 'release-1.0.1'),
     ]
     fails_upgrade = [
         ('1.0.0', '1.0.0'),
@@ -69,6 +91,13 @@ def test_validate_upgrade():
         ('1.9.5', '1.8.9'),
         ('1.19.3', '1.13.1'),
         ('2.0.0', '1.13.1'),
+        ('1.0.1', '1.0.1-rc.1'),
+        ('1.0.0+build.1', '1.0.0+build.2'),
+    ]
+    malformed = [
+        ('1.0', '1.0.1'),
+        ('1.0.0', 'latest'),
+        ('1.0.0', '01.2.3'),
     ]
 
     for path in can_upgrade:
@@ -78,6 +107,10 @@ def test_validate_upgrade():
         with pytest.raises(InvalidUpgradePath):
             cli.validate_upgrade(*path)
 
+    for path in malformed:
+        with pytest.raises(InvalidVersion):
+            cli.validate_upgrade(*path)
+
 
 def test_create_new_release(releaseable_repo, capsys):
     """
@@ -145,22 +178,22 @@ def test_hotfix(releaseable_repo):
     """
     Ensure hotfix release branches are forked from the production branch.
     """
-    mockCreateRelease = patch('reflex.cli.create_release', Mock())
+    mockCreateRelease = patch('reflex.cli.create_release_plan', Mock())
     with mockCreateRelease as pCreateRelease:
         cli.hotfix(releaseable_repo)
         pCreateRelease.assert_called_with(
-            releaseable_repo, 'release-1.0.0', None)
+            releaseable_repo, 'release-1.0.0', None, None)
 
 
 def test_release(releaseable_repo):
     """
     Ensure release branches are forked from the development branch.
     """
-    mockCreateRelease = patch('reflex.cli.create_release')
+    mockCreateRelease = patch('reflex.cli.create_release_plan')
     with mockCreateRelease as pCreateRelease:
         cli.release(releaseable_repo)
         pCreateRelease.assert_called_with(
-            releaseable_repo, 'develop', None)
+            releaseable_repo, 'develop', None, None)
 
 
 def test_cannot_complete_re_release(releaseable_repo):
@@ -205,6 +238,34 @@ def test_merges_into_multiple_dev_branches(releaseable_repo):
     assert dev_2_release == 'release-1.1.0'
 
 
+def test_close_checks_merges_first(releaseable_repo):
+    """
+    Ensure a release branch which conflicts with a development branch is
+    reported before anything is merged or tagged.
+    """
+    def commit(branch, content):
+        releaseable_repo.git('checkout', branch)
+        with open(os.path.join(releaseable_repo.dir, 'f'), 'w') as changed:
+            changed.write(content)
+        releaseable_repo.git('add', 'f')
+        releaseable_repo.git('commit', '-m', 'f is {}'.format(content))
+        releaseable_repo.git('push', 'origin', branch)
+
+    releaseable_repo.git('checkout', '-b', 'develop-2')
+    commit('develop-2', 'x')
+    cli.create_release(releaseable_repo, 'develop', '1.1.0')
+    commit('test-1.1.0', 'y')
+    releaseable_repo.git('fetch', 'origin')
+    before = releaseable_repo.git('for-each-ref').stdout
+
+    releaseable_repo.development_branches = ['develop', 'develop-2']
+    with pytest.raises(MergeConflict) as error:
+        cli.complete_release(releaseable_repo, '1.1.0')
+
+    assert error.value.args[1] == ['main into origin/develop-2: f']
+    assert releaseable_repo.git('for-each-ref').stdout == before
+
+
 def test_deletes_release_branch_after_release(releaseable_repo):
     """
     Ensure that a release branch is automatically cleaned up after closing a
@@ -301,3 +362,367 @@ def test_reflex_with_multiple_action(releaseable_repo):
 
     assert 'Invalid' in result.output
     assert result.exit_code == 1
+
+
+def test_cache_options(tmpdir):
+    """
+    Ensure the cache options on the command line configure a MirrorCache.
+    """
+    with patch('reflex.cli.PrestineRepo') as pRepo, \
+            patch('reflex.cli.release'):
+        runner = CliRunner()
+        runner.invoke(cli.main, [
+            '1.1.0',
+            '--repo', 'nowhere',
+            '--release',
+            '--no-preflight',
+            '--cache-dir', str(tmpdir),
+            '--cache-max-size', '2',
+            '--cache-max-age', '1',
+        ])
+        cache = pRepo.call_args[0][3]
+
+    assert cache.root == str(tmpdir)
+    assert cache.max_size == 2 * 1024 * 1024
+    assert cache.max_age == 24 * 60 * 60
+
+
+def test_workspace_options(tmpdir):
+    """
+    Ensure the workspace options on the command line configure a
+    WorkspacePool.
+    """
+    with patch('reflex.cli.PrestineRepo') as pRepo, \
+            patch('reflex.cli.release'):
+        runner = CliRunner()
+        runner.invoke(cli.main, [
+            '1.1.0',
+            '--repo', 'nowhere',
+            '--release',
+            '--no-preflight',
+            '--workspace-dir', str(tmpdir),
+            '--workspace-timeout', '30',
+        ])
+        pool = pRepo.call_args[0][7]
+
+    assert pool.root == str(tmpdir)
+    assert pool.timeout == 30
+
+
+def test_clone_strategy_per_action(releaseable_repo):
+    """
+    Ensure the cheapest clone strategy for an action is picked unless one is
+    given on the command line.
+    """
+    for action, strategy in [('--release', 'treeless'),
+                             ('--hotfix', 'treeless'),
+                             ('--close', 'blobless')]:
+        with patch('reflex.cli.PrestineRepo') as pRepo, \
+                patch('reflex.cli.release'), patch('reflex.cli.hotfix'), \
+                patch('reflex.cli.complete_release'):
+            runner = CliRunner()
+            runner.invoke(cli.main, ['1.1.0', '--repo', 'nowhere', action,
+                                     '--no-preflight'])
+            assert pRepo.call_args[0][4] == strategy
+
+    with patch('reflex.cli.PrestineRepo') as pRepo, \
+            patch('reflex.cli.release'):
+        runner = CliRunner()
+        runner.invoke(cli.main, ['1.1.0', '--repo', 'nowhere', '--release',
+                                 '--no-preflight', '--clone-strategy', 'full'])
+        assert pRepo.call_args[0][4] == 'full'
+
+
+def test_action_refs():
+    """
+    Ensure each action fetches the branches it works on, the test branches
+    and the release tags.
+    """
+    assert cli.action_refs('release', 'stable', ['dev', 'next']) == [
+        'refs/heads/dev', 'refs/heads/next', 'refs/heads/test-*',
+        'refs/tags/release-*']
+    assert cli.action_refs('hotfix')[0] == 'refs/heads/main'
+    assert cli.action_refs('close')[:2] == [
+        'refs/heads/main', 'refs/heads/develop']
+
+    with patch('reflex.cli.PrestineRepo') as pRepo, \
+            patch('reflex.cli.complete_release'):
+        runner = CliRunner()
+        runner.invoke(cli.main, ['1.1.0', '--repo', 'nowhere', '--close',
+                                 '--no-preflight', '--production-branch',
+                                 'stable'])
+        assert pRepo.call_args[0][6] == cli.action_refs(
+            'close', 'stable', ['develop'])
+
+
+def test_ssh_multiplex_option():
+    """
+    Ensure SSH multiplexing is only asked for when it is turned on.
+    """
+    for args, multiplex in [([], False), (['--ssh-multiplex'], True)]:
+        with patch('reflex.cli.PrestineRepo') as pRepo, \
+                patch('reflex.cli.release'):
+            runner = CliRunner()
+            runner.invoke(cli.main, ['1.1.0', '--repo', 'nowhere',
+                                     '--release', '--no-preflight'] + args)
+            assert pRepo.call_args[0][5] is multiplex
+
+
+def test_release_cycle_on_partial_clones(partial_clone_uri):
+    """
+    Ensure a release can be opened and closed on the partial clones picked for
+    each action.
+    """
+    with PrestineRepo(partial_clone_uri, clone_strategy='treeless') as repo:
+        assert repo.git('config', 'remote.origin.partialclonefilter') \
+            .stdout.strip() == 'tree:0'
+        cli.release(repo, '1.1.0')
+
+    with PrestineRepo(partial_clone_uri, clone_strategy='blobless') as repo:
+        repo.git('config', 'user.email', 'ci@test.com')
+        repo.git('config', 'user.name', 'ci')
+        cli.complete_release(repo, '1.1.0')
+        assert repo.get_last_release('origin/develop') == 'release-1.1.0'
+
+
+def test_constant_ref_listings(releaseable_repo):
+    """
+    Ensure opening and closing a release never lists the repo's refs with
+    git, as they are read from the ref files instead.
+    """
+    with patch('reflex.repo.stream_git', side_effect=stream_git) as pStream:
+        cli.create_release(releaseable_repo, 'develop', '1.1.0')
+        cli.complete_release(releaseable_repo, '1.1.0')
+
+    listings = [args for args in pStream.call_args_list
+                if args[0][1] == 'for-each-ref']
+    assert not listings
+
+
+def test_close_is_all_or_nothing(releaseable_repo):
+    """
+    Ensure closing a release leaves upstream untouched when any part of the
+    final push is rejected.
+    """
+    upstream = releaseable_repo.git(
+        'remote', 'get-url', 'origin').stdout.strip()
+    cli.create_release(releaseable_repo, 'develop', '1.1.0')
+    before = releaseable_repo.git('ls-remote', 'origin').stdout
+
+    hook = os.path.join(upstream, 'hooks', 'update')
+    with open(hook, 'w') as script:
+        script.write('#!/bin/sh\ntest "$1" != refs/heads/test-1.1.0\n')
+    os.chmod(hook, 0o755)
+
+    with pytest.raises(GitCommandError):
+        cli.complete_release(releaseable_repo, '1.1.0')
+
+    assert releaseable_repo.git('ls-remote', 'origin').stdout == before
+
+
+def test_resume_landed_close(releaseable_repo, identity, tmpdir):
+    """
+    Ensure resuming a close whose push landed before the run died only
+    checks the remote instead of cloning and merging again.
+    """
+    upstream = releaseable_repo.git(
+        'remote', 'get-url', 'origin').stdout.strip()
+    releaseable_repo.git('push', 'origin', 'release-1.0.0')
+    cli.create_release(releaseable_repo, 'develop', '1.1.0')
+    args = ['1.1.0', '--repo', upstream, '--close',
+            '--journal-dir', str(tmpdir.join('journal'))]
+
+    push = PushBatch.push
+
+    def push_and_die(batch):
+        push(batch)
+        raise IOError('Connection reset by peer')
+
+    runner = CliRunner()
+    with patch('reflex.repo.PushBatch.push', push_and_die):
+        result = runner.invoke(cli.main, args)
+    assert isinstance(result.exception, IOError)
+
+    with patch('reflex.repo.PrestineRepo.setup') as pSetup:
+        result = runner.invoke(cli.main, args + ['--resume'])
+    assert result.exit_code == 0
+    assert 'Nothing to resume' in result.output
+    assert not pSetup.called
+
+
+def test_resume_partial_close(releaseable_repo, identity):
+    """
+    Ensure resuming a close skips the merge and tag which are already on
+    origin and only pushes the rest.
+    """
+    upstream = releaseable_repo.git(
+        'remote', 'get-url', 'origin').stdout.strip()
+    cli.create_release(releaseable_repo, 'develop', '1.1.0')
+    journal = Journal()
+    with patch('reflex.repo.PushBatch.push', side_effect=IOError):
+        with pytest.raises(IOError):
+            cli.complete_release(releaseable_repo, '1.1.0', journal=journal)
+    assert 'push' not in journal
+    releaseable_repo.git('push', 'origin', 'main', 'release-1.1.0')
+
+    with PrestineRepo(upstream) as repo:
+        with patch.object(repo, 'merge', wraps=repo.merge) as pMerge:
+            cli.complete_release(repo, '1.1.0', journal=journal)
+        assert [args[0][0] for args in pMerge.call_args_list] == ['develop']
+
+    refs = dict(reversed(line.split('\t')) for line in run_git(
+        upstream, 'ls-remote', '.').lines())
+    assert refs['refs/heads/main'] == journal.get('merge:main')
+    assert refs['refs/heads/develop'] == journal.get('merge:develop')
+    assert 'refs/heads/test-1.1.0' not in refs
+    assert 'push' in journal
+
+
+def test_resume_landed_merges(releaseable_repo, identity):
+    """
+    Ensure resuming a close whose merges all landed merges nothing and only
+    deletes the release branch.
+    """
+    upstream = releaseable_repo.git(
+        'remote', 'get-url', 'origin').stdout.strip()
+    cli.create_release(releaseable_repo, 'develop', '1.1.0')
+    journal = Journal()
+    with patch('reflex.repo.PushBatch.push', side_effect=IOError):
+        with pytest.raises(IOError):
+            cli.complete_release(releaseable_repo, '1.1.0', journal=journal)
+    releaseable_repo.git('push', 'origin', 'main', 'develop', 'release-1.1.0')
+
+    with PrestineRepo(upstream) as repo:
+        with patch.object(repo, 'merge', wraps=repo.merge) as pMerge:
+            cli.complete_release(repo, '1.1.0', journal=journal)
+        assert not pMerge.called
+
+    refs = run_git(upstream, 'ls-remote', '.').stdout
+    assert 'refs/heads/test-1.1.0' not in refs
+    assert 'push' in journal
+
+
+def test_resume_needs_journal_dir(releaseable_repo):
+    """
+    Ensure reflex refuses to resume a run without a journal to resume from.
+    """
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [
+        '1.1.0', '--repo', releaseable_repo.dir, '--close', '--resume'])
+
+    assert 'needs a --journal-dir' in result.output
+    assert result.exit_code == 1
+
+
+def test_finished(releaseable_repo):
+    """
+    Ensure a journal only counts as finished once its push is recorded or
+    every ref it expected to push is on the remote.
+    """
+    uri = releaseable_repo.git('remote', 'get-url', 'origin').stdout.strip()
+    main = releaseable_repo.git('rev-parse', 'origin/main').stdout.strip()
+    journal = Journal()
+    assert not cli.finished(journal, uri)
+
+    journal.record('expect', {'refs/heads/main': main,
+                              'refs/heads/test-1.1.0': None})
+    assert cli.finished(journal, uri)
+    assert 'push' in journal
+    assert cli.finished(journal, uri)
+
+    journal = Journal()
+    journal.record('expect', {'refs/heads/main': 'f' * 40})
+    assert not cli.finished(journal, uri)
+    assert 'push' not in journal
+
+
+def test_run_plan():
+    """
+    Ensure a plan is sent the results it yields back, runs the plans it
+    yields and has their errors raised into it.
+    """
+    seen = []
+
+    def sub_plan():
+        seen.append((yield 'sub'))
+
+    def failing():
+        yield sub_plan()
+        raise ValueError('failed')
+
+    def plan():
+        seen.append((yield 'value'))
+        seen.append((yield sub_plan()))
+        try:
+            yield failing()
+        except ValueError as error:
+            seen.append(str(error))
+
+    cli.run_plan(plan())
+    assert seen == ['value', 'sub', None, 'sub', 'failed']
+
+
+def test_preflight(releaseable_repo):
+    """
+    Ensure the remote is checked for the test branch and the upgrade path
+    with a single `git ls-remote`.
+    """
+    uri = releaseable_repo.git('remote', 'get-url', 'origin').stdout.strip()
+    releaseable_repo.git('push', 'origin', 'release-1.0.0')
+    releaseable_repo.git('tag', '-a', 'release-1.9.0', '-m', 'newer')
+    releaseable_repo.git('tag', '-a', 'release-1.10.0', '-m', 'newest')
+    releaseable_repo.git('push', 'origin', 'release-1.9.0', 'release-1.10.0')
+    cli.create_release(releaseable_repo, 'develop', '1.11.0')
+
+    with patch('reflex.cli.run_git', side_effect=run_git) as pRunGit:
+        refs = cli.preflight('close', uri, '1.11.0')
+        assert pRunGit.call_count == 1
+    assert 'origin/test-1.11.0' in refs.remotes
+    assert refs.peeled['release-1.0.0'] == refs.remotes['origin/main']
+
+    cli.preflight('release', uri, '1.12.0')
+    with pytest.raises(DuplicateGitReference):
+        cli.preflight('release', uri, '1.11.0')
+    with pytest.raises(InvalidGitReference):
+        cli.preflight('close', uri, '1.12.0')
+    with pytest.raises(InvalidUpgradePath):
+        cli.preflight('hotfix', uri, '1.9.5')
+
+
+def test_preflight_before_clone(releaseable_repo, tmpdir):
+    """
+    Ensure main stops before cloning when the preflight checks fail, and
+    removes the directory it would have cloned into.
+    """
+    uri = releaseable_repo.git('remote', 'get-url', 'origin').stdout.strip()
+
+    with patch('reflex.repo.PrestineRepo.setup') as pSetup, \
+            patch('reflex.repo.mkdtemp', return_value=str(tmpdir)), \
+            patch('reflex.repo.rmtree') as pRmtree:
+        runner = CliRunner()
+        result = runner.invoke(cli.main, ['1.1.0', '--repo', uri, '--close'])
+
+    assert isinstance(result.exception, InvalidGitReference)
+    assert not pSetup.called
+    pRmtree.assert_called_once_with(str(tmpdir))
+
+
+def test_preflight_shares_ssh(released_upstream, fake_ssh):
+    """
+    Ensure the preflight check goes through the same SSH connection as the
+    rest of a multiplexed run.
+    """
+    uri = 'fakehost:{}'.format(released_upstream)
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [
+        '1.1.0', '--repo', uri, '--release', '--ssh-multiplex'])
+    assert result.exit_code == 0
+
+    with open(fake_ssh) as log:
+        calls = log.read().splitlines()
+    paths = set(arg for arg in ' '.join(calls).split()
+                if arg.startswith('ControlPath='))
+    assert len(paths) == 1
+    assert all('ControlMaster=auto' in line for line in calls[:-1])
+    assert "git-upload-pack" in calls[0]
+    assert calls[-1].endswith('-O exit reflex')
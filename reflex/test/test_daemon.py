@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+from click.testing import CliRunner
+from mock import patch
+
+import reflex.daemon as daemon
+from reflex.cache import MirrorCache
+from reflex.daemon import Daemon, ReadWriteLock, make_server
+from reflex.error import (
+    DuplicateGitReference, GitCommandError, GitTimeout,
+)
+from reflex.process import run_git
+from reflex.trace import Tracer
+
+try:
+    from http.client import HTTPConnection
+except ImportError:  # Python 2
+    from httplib import HTTPConnection
+
+
+def commands(tracer, name):
+    return [call for call, _, _ in tracer.calls if call.command[1] == name]
+
+
+@pytest.fixture
+def server(released_upstream):
+    """
+    Fixture which serves a daemon on a free local port for the length of a
+    test and returns a function to make requests to it.
+    """
+    served = make_server(Daemon())
+    thread = threading.Thread(target=served.serve_forever)
+    thread.start()
+
+    def request(method, path, body=None):
+        connection = HTTPConnection(*served.server_address[:2])
+        connection.request(method, path, body)
+        response = connection.getresponse()
+        document = json.loads(response.read().decode('utf-8'))
+        connection.close()
+        return response.status, document
+
+    yield request
+    served.shutdown()
+    served.server_close()
+    served.daemon.close()
+    thread.join()
+
+
+def test_error_status():
+    """
+    Ensure errors get the status of their most specific class, whatever the
+    order of ERROR_STATUS.
+    """
+    backwards = dict(reversed(list(daemon.ERROR_STATUS.items())))
+    with patch('reflex.daemon.ERROR_STATUS', backwards):
+        assert daemon.error_status(GitTimeout('slow', [])) == 504
+        assert daemon.error_status(GitCommandError('failed', [])) == 502
+        assert daemon.error_status(ValueError('bug')) == 500
+
+
+def test_read_write_lock():
+    """
+    Ensure readers share the lock while a writer has it to itself.
+    """
+    lock = ReadWriteLock()
+    events = []
+    reading = threading.Event()
+
+    def write():
+        with lock.write():
+            events.append('write')
+
+    with lock.read():
+        with lock.read():
+            reading.set()
+        writer = threading.Thread(target=write)
+        writer.start()
+        time.sleep(0.05)
+        events.append('read')
+    writer.join()
+
+    assert reading.is_set()
+    assert events == ['read', 'write']
+
+    with lock.write():
+        reader = threading.Thread(target=lambda: lock.read().__enter__())
+        reader.start()
+        time.sleep(0.05)
+        assert reader.is_alive()
+    reader.join()
+
+
+def test_queries_stay_warm(released_upstream):
+    """
+    Ensure queries are answered from one clone which is only fetched again
+    once the refresh interval has passed.
+    """
+    warm = Daemon(refresh_interval=60)
+    try:
+        with Tracer() as tracer:
+            assert warm.last_release(released_upstream) == 'release-1.0.0'
+            assert warm.releases(released_upstream) == ['release-1.0.0']
+            assert warm.test_branches(released_upstream) == []
+        assert len(commands(tracer, 'clone')) == 1
+        assert not commands(tracer, 'fetch')
+        assert len(commands(tracer, 'for-each-ref')) == 1
+
+        warm.repo(released_upstream).fetched -= 60
+        with Tracer() as tracer:
+            warm.last_release(released_upstream, 'develop')
+        assert len(commands(tracer, 'fetch')) == 1
+        assert not commands(tracer, 'clone')
+    finally:
+        warm.close()
+    assert not warm.repos
+
+
+def test_maintenance_in_background(released_upstream):
+    """
+    Ensure queries which refresh a warm repo do not wait for its
+    maintenance, and that one maintenance run at a time is started.
+    """
+    started = threading.Event()
+    finish = threading.Event()
+    runs = []
+
+    def slow_maintain(repo):
+        runs.append(repo)
+        started.set()
+        finish.wait(10)
+
+    warm = Daemon(refresh_interval=60)
+    try:
+        with patch('reflex.repo.PrestineRepo.maintain', slow_maintain):
+            assert warm.releases(released_upstream) == ['release-1.0.0']
+            assert started.wait(10)
+            warm.repo(released_upstream).fetched -= 60
+            assert warm.releases(released_upstream) == ['release-1.0.0']
+            assert len(runs) == 1
+            finish.set()
+    finally:
+        finish.set()
+        warm.close()
+
+
+def test_failed_maintenance(released_upstream):
+    """
+    Ensure a maintenance run which fails does not affect queries.
+    """
+    warm = Daemon(refresh_interval=60)
+    try:
+        with patch('reflex.repo.PrestineRepo.maintain',
+                   side_effect=RuntimeError):
+            assert warm.releases(released_upstream) == ['release-1.0.0']
+            warm.repo(released_upstream)._maintenance.join(10)
+            assert warm.releases(released_upstream) == ['release-1.0.0']
+    finally:
+        warm.close()
+
+
+def test_actions(released_upstream):
+    """
+    Ensure actions fetch the warm repo first, show up in later queries and
+    that a repo an action failed on is cloned again.
+    """
+    warm = Daemon(refresh_interval=60)
+    try:
+        assert warm.test_branches(released_upstream) == []
+
+        # Changes made behind the daemon's back are picked up by actions.
+        run_git(released_upstream, 'tag', 'release-1.0.5', 'main')
+        warm.run({'repo': released_upstream, 'version': '1.1.0',
+                  'action': 'release'})
+        assert warm.test_branches(released_upstream) == [
+            'origin/test-1.1.0']
+
+        with Tracer() as tracer:
+            with pytest.raises(DuplicateGitReference):
+                warm.run({'repo': released_upstream, 'version': '1.1.0',
+                          'action': 'release'})
+        assert not commands(tracer, 'clone')
+        assert warm.repo(released_upstream).repo is None
+
+        warm.run({'repo': released_upstream, 'version': '1.1.0',
+                  'action': 'close'})
+        assert warm.last_release(released_upstream) == 'release-1.1.0'
+        assert warm.test_branches(released_upstream) == []
+
+        # Tags deleted from the remote disappear from the warm repo.
+        run_git(released_upstream, 'tag', '--delete', 'release-1.1.0')
+        warm.run({'repo': released_upstream, 'version': '1.1.1',
+                  'action': 'hotfix'})
+        assert 'release-1.1.0' not in warm.releases(released_upstream)
+    finally:
+        warm.close()
+
+
+def test_queries_wait_for_actions(released_upstream):
+    """
+    Ensure a query waits for an action on its repo to finish and sees what
+    the action did.
+    """
+    warm = Daemon(refresh_interval=60)
+    started = threading.Event()
+    results = []
+
+    def slow_release(repo, version):
+        started.set()
+        time.sleep(0.1)
+        repo.tag('release-1.0.1', 'slow', 'origin/main')
+        repo.push('release-1.0.1')
+
+    try:
+        with patch('reflex.cli.release', side_effect=slow_release):
+            action = threading.Thread(target=warm.run, args=({
+                'repo': released_upstream, 'version': '1.0.1',
+                'action': 'release'},))
+            action.start()
+            started.wait()
+            results.append(warm.last_release(released_upstream))
+            action.join()
+    finally:
+        warm.close()
+
+    assert results == ['release-1.0.1']
+
+
+def test_failed_clone(tmpdir):
+    """
+    Ensure a repo which can not be cloned leaves nothing behind.
+    """
+    warm = Daemon()
+    clone = str(tmpdir.mkdir('c'))
+    with patch('reflex.repo.mkdtemp', return_value=clone):
+        with pytest.raises(GitCommandError):
+            warm.releases(str(tmpdir.join('nowhere')))
+    assert not tmpdir.join('c').exists()
+    assert warm.repo(str(tmpdir.join('nowhere'))).repo is None
+
+
+def test_http_api(server, released_upstream):
+    """
+    Ensure queries and actions are served as JSON with errors mapped to
+    status codes.
+    """
+    query = '?repo={}'.format(released_upstream)
+
+    assert server('GET', '/last-release' + query) == (
+        200, {'release': 'release-1.0.0'})
+    assert server('GET', '/releases' + query) == (
+        200, {'releases': ['release-1.0.0']})
+    assert server('GET', '/repos') == (200, {'repos': [released_upstream]})
+
+    status, result = server('POST', '/release', json.dumps(
+        {'repo': released_upstream, 'version': '1.1.0'}))
+    assert status == 200
+    assert result['action'] == 'release'
+    assert result['version'] == '1.1.0'
+    assert server('GET', '/test-branches' + query) == (
+        200, {'test_branches': ['origin/test-1.1.0']})
+
+    status, result = server('POST', '/release', json.dumps(
+        {'repo': released_upstream, 'version': '1.1.0'}))
+    assert (status, result['error']) == (409, 'DuplicateGitReference')
+    status, result = server('POST', '/close', json.dumps(
+        {'repo': released_upstream, 'version': '1.2.0'}))
+    assert (status, result['error']) == (404, 'InvalidGitReference')
+    status, result = server(
+        'GET', '/last-release{}&production_branch=nowhere'.format(query))
+    assert (status, result['error']) == (502, 'GitCommandError')
+    status, result = server('POST', '/release', json.dumps(
+        {'repo': released_upstream, 'version': '1.1'}))
+    assert (status, result['error']) == (400, 'InvalidVersion')
+
+    with patch('reflex.cli.hotfix', side_effect=RuntimeError('boom')):
+        status, result = server('POST', '/hotfix', json.dumps(
+            {'repo': released_upstream, 'version': '1.0.1'}))
+    assert (status, result) == (500, {'error': 'RuntimeError',
+                                      'message': 'boom'})
+
+
+def test_http_bad_requests(server):
+    """
+    Ensure requests which can not be understood are turned away.
+    """
+    assert server('GET', '/nowhere')[0] == 404
+    assert server('GET', '/releases')[1]['message'] == "Missing 'repo'."
+    assert server('POST', '/release', '{')[0] == 400
+    assert server('POST', '/release', '[]')[1]['message'] == \
+        'Expected a JSON object.'
+    status, result = server('POST', '/merge', json.dumps(
+        {'repo': 'nowhere', 'version': '1.0.0'}))
+    assert status == 400
+    assert 'Unknown action' in result['message']
+    assert server('POST', '/release')[1]['message'] == "Missing 'repo'."
+
+
+def test_unix_socket(released_upstream, tmpdir):
+    """
+    Ensure the daemon can be served on a Unix socket.
+    """
+    path = str(tmpdir.join('reflex.sock'))
+    open(path, 'w').close()
+    served = make_server(Daemon(), socket_path=path)
+    thread = threading.Thread(target=served.serve_forever)
+    thread.start()
+    try:
+        client = socket.socket(socket.AF_UNIX)
+        client.connect(path)
+        client.sendall('GET /releases?repo={} HTTP/1.0\r\n\r\n'.format(
+            released_upstream).encode('utf-8'))
+        response = b''
+        while True:
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            response += chunk
+        client.close()
+    finally:
+        served.shutdown()
+        served.server_close()
+        served.daemon.close()
+        thread.join()
+
+    assert response.startswith(b'HTTP/1.1 200')
+    assert json.loads(response.split(b'\r\n\r\n', 1)[1].decode('utf-8')) == \
+        {'releases': ['release-1.0.0']}
+    assert not os.path.exists(path)
+
+
+def test_main(tmpdir):
+    """
+    Ensure the command line serves until interrupted and then cleans up.
+    """
+    with patch('reflex.daemon.make_server') as pMakeServer:
+        served = pMakeServer.return_value
+        served.server_address = ('127.0.0.1', 8734)
+        served.serve_forever.side_effect = KeyboardInterrupt
+        runner = CliRunner()
+        result = runner.invoke(daemon.main, [
+            '--cache-dir', str(tmpdir), '--refresh-interval', '5',
+            '--ssh-multiplex'])
+
+    assert result.exit_code == 0
+    assert 'Listening on 127.0.0.1:8734.' in result.output
+    reflex, host, port, socket_path = pMakeServer.call_args[0]
+    assert isinstance(reflex.cache, MirrorCache)
+    assert reflex.refresh_interval == 5
+    assert reflex.ssh_multiplex
+    assert (host, port, socket_path) == ('127.0.0.1', 8734, None)
+    assert served.server_close.called
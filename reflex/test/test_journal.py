@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from reflex.journal import Journal
+
+
+def test_journal_is_saved(tmpdir):
+    """
+    Ensure recorded steps are saved after each step and found again by a
+    later run of the same action, but not by other actions.
+    """
+    root = str(tmpdir.join('journal'))
+    journal = Journal.open(root, 'repo', 'close', '1.1.0')
+    journal.record('merge:main', 'a1')
+
+    reopened = Journal.open(root, 'repo', 'close', '1.1.0')
+    assert reopened.get('merge:main') == 'a1'
+    assert 'merge:main' in reopened
+    assert reopened.landed('merge:main', 'a1')
+    assert not reopened.landed('merge:main', 'b2')
+    assert not reopened.landed('tag', None)
+    assert not Journal.open(root, 'repo', 'close', '1.2.0').steps
+
+    reopened.reset()
+    assert not Journal.open(root, 'repo', 'close', '1.1.0').steps
+    assert os.listdir(root) == [os.path.basename(journal.path)]
+
+
+def test_journal_in_memory():
+    """
+    Ensure a journal without a path keeps its steps without writing them.
+    """
+    journal = Journal()
+    journal.record('push')
+
+    assert 'push' in journal
+    assert journal.path is None
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+from glob import glob
+
+from mock import patch
+
+from reflex.maintenance import (
+    MIDX_PACKS_FILE, list_packs, maintain, read_file, write_file,
+)
+from reflex.process import run_git
+from reflex.trace import Tracer
+
+
+def test_maintain(released_upstream):
+    """
+    Ensure maintenance writes a layered commit-graph, a multi-pack-index and
+    bitmaps, and leaves out what can not be written.
+    """
+    objects = os.path.join(released_upstream, 'objects')
+
+    assert maintain(released_upstream, bitmaps=False) == ['commit-graph']
+    assert os.path.isfile(os.path.join(
+        objects, 'info', 'commit-graphs', 'commit-graph-chain'))
+
+    run_git(released_upstream, 'repack', '-d')
+    assert maintain(released_upstream) == [
+        'commit-graph', 'multi-pack-index', 'bitmap']
+    assert os.path.isfile(os.path.join(objects, 'pack', 'multi-pack-index'))
+    assert glob(os.path.join(objects, 'pack', 'multi-pack-index-*.bitmap'))
+
+    with patch('reflex.maintenance.git_version', return_value=(2, 30, 0)):
+        assert maintain(released_upstream) == [
+            'commit-graph', 'multi-pack-index']
+
+
+def test_maintain_only_rewrites_for_new_packs(released_upstream):
+    """
+    Ensure the multi-pack-index and bitmaps are only written again once the
+    packs of the repo change.
+    """
+    run_git(released_upstream, 'repack', '-d')
+    assert maintain(released_upstream) == [
+        'commit-graph', 'multi-pack-index', 'bitmap']
+    assert maintain(released_upstream) == ['commit-graph']
+
+    commit = run_git(released_upstream, '-c', 'user.name=ci', '-c',
+                     'user.email=ci@test.com', 'commit-tree', 'main^{tree}',
+                     '-p', 'main', '-m', 'new commit').stdout.strip()
+    run_git(released_upstream, 'update-ref', 'refs/heads/main', commit)
+    run_git(released_upstream, 'repack', '-d')
+    assert maintain(released_upstream) == [
+        'commit-graph', 'multi-pack-index', 'bitmap']
+    assert maintain(released_upstream, bitmaps=False) == [
+        'commit-graph', 'multi-pack-index']
+    assert maintain(released_upstream, bitmaps=False) == ['commit-graph']
+
+
+def test_maintain_after_deadline(released_upstream):
+    """
+    Ensure no maintenance is started once the deadline has passed.
+    """
+    with Tracer() as tracer:
+        assert maintain(released_upstream, deadline=time.time() - 1) == []
+    assert tracer.calls == []
+
+
+def test_maintain_falls_back_without_bitmaps(released_upstream):
+    """
+    Ensure a multi-pack-index is still written when its bitmaps can not be,
+    and that bitmaps are tried again next time.
+    """
+    run_git(released_upstream, 'repack', '-d')
+
+    def no_bitmaps(path, *args, **options):
+        if '--bitmap' in args:
+            args = ('multi-pack-index', 'write', '--no-such-option')
+        return run_git(path, *args, **options)
+
+    with patch('reflex.maintenance.run_git', no_bitmaps):
+        assert maintain(released_upstream) == [
+            'commit-graph', 'multi-pack-index']
+    packs_file = os.path.join(released_upstream, 'objects', MIDX_PACKS_FILE)
+    assert not os.path.exists(packs_file)
+    assert maintain(released_upstream) == [
+        'commit-graph', 'multi-pack-index', 'bitmap']
+
+
+def test_maintain_files(tmpdir):
+    """
+    Ensure a repo without a pack directory has no packs and that the file
+    recording the packs is optional.
+    """
+    assert list_packs(str(tmpdir)) == []
+    assert read_file(str(tmpdir.join('missing'))) is None
+    write_file(str(tmpdir.join('missing', 'file')), 'packs')
+    assert not tmpdir.join('missing').exists()
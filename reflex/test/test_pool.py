@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+
+import pytest
+from mock import patch
+
+from reflex.error import GitTimeout, WorkspaceBusy
+from reflex.pool import WorkspacePool
+from reflex.process import run_git
+from reflex.repo import PrestineRepo
+from reflex.trace import Tracer
+
+
+def test_lease_reuses_workspace(released_upstream, tmpdir):
+    """
+    Ensure a second lease resets the first lease's clone to match origin
+    instead of cloning again, and keeps the workspace on exit.
+    """
+    pool = WorkspacePool(str(tmpdir.join('pool')))
+    with PrestineRepo(released_upstream, pool=pool) as repo:
+        workspace = repo.dir
+        repo.branch('test-1.1.0', 'origin/develop')
+        repo.tag('release-1.1.0', 'Leftover', 'origin/develop')
+        with open(os.path.join(repo.dir, 'scratch'), 'w') as scratch:
+            scratch.write('x')
+    assert os.path.isdir(os.path.join(workspace, '.git'))
+
+    run_git(released_upstream, 'branch', 'test-1.0.1', 'main')
+
+    with Tracer() as tracer, patch('reflex.repo.mkdtemp') as pTmpdir:
+        with PrestineRepo(released_upstream, pool=pool) as repo:
+            assert repo.dir == workspace
+            assert 'origin/test-1.0.1' in repo.branches()
+            assert repo.refs.heads == {}
+            assert repo.releases() == ['release-1.0.0']
+            assert not os.path.exists(os.path.join(repo.dir, 'scratch'))
+    assert not pTmpdir.called
+    assert [call.command[1] for call, _, _ in tracer.calls
+            if call.command[1] in ('clone', 'fetch')] == ['fetch']
+
+
+def test_reset_checked_out_workspace(merge_upstream, tmpdir):
+    """
+    Ensure resetting a workspace with a checked out branch restores its
+    files, and that a workspace can be reset to fetch only some refs.
+    """
+    run_git(merge_upstream, 'symbolic-ref', 'HEAD', 'refs/heads/main')
+    pool = WorkspacePool(str(tmpdir.join('pool')))
+    with PrestineRepo(merge_upstream, pool=pool) as repo:
+        with open(os.path.join(repo.dir, 'f'), 'w') as changed:
+            changed.write('changed')
+        repo.git('checkout', '-b', 'leftover')
+
+    with PrestineRepo(merge_upstream, pool=pool) as repo:
+        assert repo.git('status', '--porcelain').stdout == ''
+        assert repo.refs.heads == {}
+
+    run_git(merge_upstream, 'branch', '--force', 'feature', 'clash')
+    with PrestineRepo(merge_upstream, pool=pool,
+                      fetch_refs=['refs/heads/feature']) as repo:
+        assert repo.refs.remotes['origin/feature'] == \
+            run_git(merge_upstream, 'rev-parse', 'clash').stdout.strip()
+
+
+def test_failed_lease_clears_workspace(released_upstream, tmpdir):
+    """
+    Ensure a workspace is emptied and its lease released when entering a
+    pooled repo fails, so the next lease clones it afresh.
+    """
+    pool = WorkspacePool(str(tmpdir.join('pool')), timeout=0.2)
+    with PrestineRepo(released_upstream, pool=pool) as repo:
+        workspace = repo.dir
+        with open(os.path.join(repo.dir, 'scratch'), 'w') as scratch:
+            scratch.write('x')
+
+    with patch('reflex.repo.PrestineRepo.start_ssh', side_effect=IOError):
+        with pytest.raises(IOError):
+            PrestineRepo(released_upstream, pool=pool).__enter__()
+    assert os.listdir(workspace) == []
+
+    with PrestineRepo(released_upstream, pool=pool) as repo:
+        assert 'origin/develop' in repo.branches()
+
+
+def test_lease_is_exclusive(released_upstream, tmpdir):
+    """
+    Ensure a workspace is leased by one repo at a time and that a lease
+    which waits too long raises WorkspaceBusy without opening an SSH session.
+    """
+    pool = WorkspacePool(str(tmpdir.join('pool')), timeout=0.2)
+    with PrestineRepo(released_upstream, pool=pool):
+        with pytest.raises(WorkspaceBusy):
+            pool.lease(released_upstream)
+    pool.lease(released_upstream).release()
+
+    uri = 'ssh://git@example.com/reflex.git'
+    lease = pool.lease(uri)
+    repo = PrestineRepo(uri, pool=pool, ssh_multiplex=True)
+    with pytest.raises(WorkspaceBusy):
+        repo.__enter__()
+    assert (repo.env, repo._ssh_dir) == (None, None)
+    lease.release()
+
+
+def test_lease_stops_waiting_at_the_deadline(tmpdir):
+    """
+    Ensure a lease gives up with GitTimeout once the deadline of its run
+    passes, even if the pool would wait longer or forever.
+    """
+    uri = 'ssh://git@example.com/reflex.git'
+    for timeout in (None, 60):
+        pool = WorkspacePool(str(tmpdir.join('pool')), timeout=timeout)
+        lease = pool.lease(uri)
+        start = time.time()
+        with pytest.raises(GitTimeout):
+            PrestineRepo(uri, pool=pool, deadline=0.3).__enter__()
+        assert time.time() - start < 5
+        lease.release()
+
+
+def test_broken_workspace(released_upstream, tmpdir):
+    """
+    Ensure a workspace whose clone is broken is cloned again.
+    """
+    pool = WorkspacePool(str(tmpdir.join('pool')))
+    workspace = pool.path(released_upstream)
+    os.makedirs(os.path.join(workspace, '.git'))
+
+    with PrestineRepo(released_upstream, pool=pool) as repo:
+        assert 'origin/develop' in repo.branches()
+
+
+def test_workspace_per_object_filter(released_upstream, tmpdir):
+    """
+    Ensure partial clones with different object filters lease workspaces of
+    their own, so a close never reuses a treeless clone.
+    """
+    pool = WorkspacePool(str(tmpdir.join('pool')))
+    workspaces = {}
+    for strategy in ('treeless', 'blobless', 'full', 'treeless'):
+        with PrestineRepo(released_upstream, clone_strategy=strategy,
+                          pool=pool) as repo:
+            workspaces.setdefault(strategy, repo.dir)
+            assert repo.dir == workspaces[strategy]
+            object_filter = repo._git(
+                'config', 'remote.origin.partialclonefilter',
+                check=False).stdout.strip()
+            assert object_filter == {
+                'treeless': 'tree:0', 'blobless': 'blob:none', 'full': ''
+            }[strategy]
+    assert len(set(workspaces.values())) == 3
+    assert workspaces['full'] == pool.path(released_upstream)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+from subprocess import Popen
+
+import pytest
+
+from reflex.error import GitCommandError, GitTimeout
+from reflex.process import Watchdog, run_git, stream_git, time_left
+
+# A git command which hangs, through a shell alias, in a child of git.
+HANG = ['-c', 'alias.hang=!sleep 30', 'hang']
+
+
+@pytest.fixture
+def chatty_repo(tmpdir):
+    """
+    Fixture which sets up a repo whose config holds far more than a pipe
+    buffer of output.
+    """
+    tempdir = str(tmpdir.mkdir('reflex-chatty'))
+
+    result = Popen(['git', 'init', '.'], cwd=tempdir)
+    result.wait()
+    for i in range(5):
+        run_git(tempdir, 'config', 'chatty.value{}'.format(i), 'x' * 100000)
+    return tempdir
+
+
+def test_run_git_captures_large_output(chatty_repo):
+    """
+    Ensure run_git does not block on commands which fill the pipe buffer and
+    returns the decoded output.
+    """
+    result = run_git(chatty_repo, 'config', '--get-regexp', 'chatty')
+
+    assert result.returncode == 0
+    assert result.command == ['git', 'config', '--get-regexp', 'chatty']
+    assert len(result.lines()) == 5
+    assert result.lines()[0] == 'chatty.value0 {}'.format('x' * 100000)
+    assert result.stderr == ''
+
+
+def test_run_git_failure(chatty_repo):
+    """
+    Ensure run_git raises a GitCommandError holding the lines git wrote to
+    stderr.
+    """
+    with pytest.raises(GitCommandError) as error:
+        run_git(chatty_repo, 'rev-parse', '--verify', 'nothing')
+
+    message, stderr = error.value.args
+    assert message == "Failed to run 'git rev-parse --verify nothing'."
+    assert stderr == ['fatal: Needed a single revision']
+
+
+def test_stream_git(chatty_repo):
+    """
+    Ensure stream_git yields output lines without their line endings.
+    """
+    lines = list(stream_git(chatty_repo, 'config', '--get-regexp', 'chatty'))
+
+    assert len(lines) == 5
+    assert lines[4] == 'chatty.value4 {}'.format('x' * 100000)
+
+
+def test_stream_git_failure(chatty_repo):
+    """
+    Ensure stream_git raises a GitCommandError once a failing command ends.
+    """
+    with pytest.raises(GitCommandError) as error:
+        list(stream_git(chatty_repo, 'rev-parse', '--verify', 'nothing'))
+
+    assert error.value.args[1] == ['fatal: Needed a single revision']
+
+
+def test_stream_git_early_exit(chatty_repo):
+    """
+    Ensure a stream which is closed before git finishes stops the command
+    instead of raising.
+    """
+    lines = stream_git(chatty_repo, 'config', '--get-regexp', 'chatty')
+
+    assert next(lines).startswith('chatty.value0 ')
+    lines.close()
+
+
+def test_timeout(chatty_repo):
+    """
+    Ensure commands which run past their timeout are killed along with the
+    processes they started and raise GitTimeout.
+    """
+    start = time.time()
+    with pytest.raises(GitTimeout):
+        run_git(chatty_repo, *HANG, timeout=0.2)
+    with pytest.raises(GitTimeout):
+        list(stream_git(chatty_repo, *HANG, timeout=0.2))
+    assert time.time() - start < 5
+
+    assert run_git(chatty_repo, 'config', 'chatty.value0',
+                   timeout=10).returncode == 0
+
+
+def test_kill_finished_process():
+    """
+    Ensure a command which finishes just as its timeout passes is marked as
+    expired without failing to kill it.
+    """
+    process = Popen(['true'])
+    process.wait()
+    watchdog = Watchdog(process, None)
+    watchdog.kill()
+    assert watchdog.expired
+
+
+def test_time_left():
+    """
+    Ensure the time a command may take is the tighter of its timeout and
+    the deadline, and that a passed deadline raises GitTimeout.
+    """
+    assert time_left() is None
+    assert time_left(5) == 5
+    assert time_left(5, time.time() + 60) == 5
+    assert time_left(None, time.time() + 60) <= 60
+    with pytest.raises(GitTimeout):
+        time_left(5, time.time() - 1)
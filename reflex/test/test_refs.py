@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from reflex.refs import RefIndex
+
+
+def test_parse():
+    """
+    Ensure refs are indexed by kind under their short names and that refs
+    which are not branches or tags are ignored.
+    """
+    index = RefIndex.parse([
+        'a1 refs/heads/main',
+        'b2 refs/remotes/origin/main',
+        'c3 refs/tags/release-1.0.0',
+        'd4 refs/stash',
+    ])
+
+    assert index.heads == {'main': 'a1'}
+    assert index.remotes == {'origin/main': 'b2'}
+    assert index.tags == {'release-1.0.0': 'c3'}
+
+
+def test_parse_remote():
+    """
+    Ensure `git ls-remote` output is indexed the way a clone of the remote
+    would see it, with peeled tags recorded separately.
+    """
+    index = RefIndex.parse_remote([
+        'a1\trefs/heads/main',
+        'b2\trefs/tags/release-1.0.0',
+        'a1\trefs/tags/release-1.0.0^{}',
+        'c3\trefs/pull/1/head',
+    ], remote='upstream')
+
+    assert index.heads == {}
+    assert index.remotes == {'upstream/main': 'a1'}
+    assert index.tags == {'release-1.0.0': 'b2'}
+    assert index.peeled == {'release-1.0.0': 'a1'}
+
+
+def test_add_and_remove():
+    """
+    Ensure refs can be added without a known sha and removed again.
+    """
+    index = RefIndex()
+    index.add('refs/heads/test-1.0.0')
+    index.add('refs/notes/commits')
+
+    assert index.heads == {'test-1.0.0': None}
+
+    index.remove('refs/heads/test-1.0.0')
+    index.remove('refs/heads/missing')
+    index.remove('refs/notes/commits')
+
+    assert index.heads == {}
+
+
+def test_pushed():
+    """
+    Ensure pushed branches update their remote-tracking branch, deleted
+    branches drop it and pushed tags are left alone.
+    """
+    index = RefIndex.parse([
+        'a1 refs/heads/main',
+        'b2 refs/heads/develop',
+        'c3 refs/remotes/origin/test-1.0.0',
+        'd4 refs/tags/release-1.0.0',
+    ])
+
+    index.pushed('main')
+    index.pushed('+develop:refs/heads/develop-2')
+    index.pushed('refs/tags/release-1.0.0')
+    index.pushed(':test-1.0.0')
+
+    assert index.remotes == {'origin/main': 'a1', 'origin/develop-2': 'b2'}
+    assert index.tags == {'release-1.0.0': 'd4'}
+
+
+def test_pattern_views():
+    """
+    Ensure test branches and release tags are picked out by their patterns.
+    """
+    index = RefIndex.parse([
+        'a1 refs/remotes/origin/test-1.0.0',
+        'a1 refs/remotes/origin/test-1.1.0',
+        'a1 refs/remotes/origin/test-something',
+        'a1 refs/remotes/upstream/test-2.0.0',
+        'a1 refs/tags/release-1.10.0',
+        'a1 refs/tags/release-1.9.0',
+        'a1 refs/tags/release-1.10.0-rc.1',
+        'a1 refs/tags/release-candidate',
+        'a1 refs/tags/test-1.0.0',
+    ])
+
+    assert index.test_branches() == ['origin/test-1.0.0', 'origin/test-1.1.0']
+    assert index.test_branches('upstream') == ['upstream/test-2.0.0']
+    assert index.release_tags() == [
+        'release-1.9.0', 'release-1.10.0-rc.1', 'release-1.10.0']
+
+
+def test_iter_remotes():
+    """
+    Ensure remote branches are matched lazily against a pattern and that an
+    iteration can stop early.
+    """
+    index = RefIndex.parse([
+        'a1 refs/remotes/origin/main',
+        'b2 refs/remotes/origin/test-1.0.0',
+        'c3 refs/remotes/origin/test-[x]',
+        'd4 refs/heads/test-2.0.0',
+    ])
+
+    assert sorted(index.iter_remotes()) == [
+        'origin/main', 'origin/test-1.0.0', 'origin/test-[x]']
+    assert list(index.iter_remotes('*/test-1.*')) == ['origin/test-1.0.0']
+    assert list(index.iter_remotes('origin/test-[[]x]')) == ['origin/test-[x]']
+
+    branches = index.iter_test_branches()
+    assert next(branches) == 'origin/test-1.0.0'
+    assert next(branches, None) is None
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from reflex.process import run_git
+from reflex.refstore import read_refs, ref_storage, resolve
+from reflex.repo import PrestineRepo
+
+
+def for_each_ref(cwd):
+    return run_git(
+        cwd, 'for-each-ref', '--format=%(objectname) %(refname)').lines()
+
+
+def test_read_refs_matches_git(released_upstream):
+    """
+    Ensure refs read from loose ref files and packed-refs match what
+    `git for-each-ref` reports, before and after packing them.
+    """
+    with PrestineRepo(released_upstream) as repo:
+        repo.git('tag', 'light', 'origin/main')
+        repo.git('branch', 'topic', 'origin/develop')
+        git_dir = os.path.join(repo.dir, '.git')
+
+        assert list(read_refs(git_dir)) == for_each_ref(repo.dir)
+
+        repo.git('pack-refs', '--all')
+        repo.git('branch', '--force', 'topic', 'origin/main')
+
+        assert not os.path.exists(os.path.join(git_dir, 'refs', 'tags',
+                                               'light'))
+        assert list(read_refs(git_dir)) == for_each_ref(repo.dir)
+
+
+def test_refs_without_git(released_upstream):
+    """
+    Ensure PrestineRepo#refs does not run git when it can read the refs.
+    """
+    with PrestineRepo(released_upstream) as repo:
+        repo.stream = None
+        assert repo.refs.remotes['origin/develop']
+        assert repo.releases() == ['release-1.0.0']
+
+
+def test_unsupported_ref_storage(tmpdir):
+    """
+    Ensure repos which keep refs as a reftable are left to git.
+    """
+    git_dir = tmpdir.mkdir('reftable')
+    git_dir.mkdir('refs')
+    git_dir.join('config').write(
+        '[core]\n\tbare = true\n[extensions]\n\trefStorage = reftable\n')
+
+    assert ref_storage(str(git_dir)) == 'reftable'
+    assert read_refs(str(git_dir)) is None
+    assert read_refs(str(tmpdir.join('missing'))) is None
+
+
+def test_bare_ref_files(tmpdir):
+    """
+    Ensure a git directory without a config, with an empty packed-refs file
+    and with a ref which is being written is read like git reads it.
+    """
+    sha = 'a' * 40
+    git_dir = tmpdir.mkdir('bare')
+    git_dir.join('packed-refs').write('')
+    heads = git_dir.mkdir('refs').mkdir('heads')
+    heads.join('main').write(sha + '\n')
+    heads.join('main.lock').write('b' * 40 + '\n')
+
+    assert ref_storage(str(git_dir)) == 'files'
+    assert list(read_refs(str(git_dir))) == [
+        '{} refs/heads/main'.format(sha)]
+
+
+def test_resolve():
+    """
+    Ensure symbolic refs are followed and dangling or looping ones resolve
+    to None.
+    """
+    refs = {
+        'refs/remotes/origin/HEAD': 'ref: refs/remotes/origin/main',
+        'refs/remotes/origin/main': 'a1',
+        'refs/heads/gone': 'ref: refs/heads/missing',
+        'refs/heads/loop': 'ref: refs/heads/loop',
+    }
+
+    assert resolve(refs, 'refs/remotes/origin/HEAD') == 'a1'
+    assert resolve(refs, 'refs/heads/gone') is None
+    assert resolve(refs, 'refs/heads/loop') is None
@@ -1,13 +1,20 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 from subprocess import PIPE
 
 import pytest
-from mock import call, Mock, patch
+from mock import ANY, call, Mock, patch
 
-from reflex.repo import PrestineRepo
-from reflex.error import GitCommandError
+import reflex.cli as cli
+from reflex.cache import MirrorCache
+from reflex.repo import PrestineRepo, is_ssh_uri
+from reflex.error import (
+    GitCommandError, GitTimeout, InvalidGitReference, MergeConflict,
+)
+from reflex.process import run_git
+from reflex.refs import RefIndex
 
 
 def test_prestinerepo_creation():
@@ -18,19 +25,17 @@ def test_prestinerepo_creation():
     clone_uri = 'no'
     mResult = Mock()
     mResult.returncode = 0
+    mResult.communicate.return_value = (b'', b'')
     mockTmpdir = patch('reflex.repo.mkdtemp', return_value=temp_dir)
-    mockPopen = patch('reflex.repo.Popen', return_value=mResult)
+    mockPopen = patch('reflex.process.Popen', return_value=mResult)
     mockRmtree = patch('reflex.repo.rmtree')
 
     with mockTmpdir as pTmpdir, mockPopen as pPopen, mockRmtree as pRmtree:
         with PrestineRepo(clone_uri) as repo:
             pTmpdir.assert_called_with()
-            pPopen.assert_has_calls([
-                call(['git', 'clone', clone_uri, temp_dir],
-                     cwd=temp_dir, stderr=PIPE, stdout=PIPE),
-                call(['git', 'fetch', 'origin'],
-                     cwd=temp_dir, stderr=PIPE, stdout=PIPE),
-            ])
+            pPopen.assert_called_once_with(
+                ['git', 'clone', clone_uri, temp_dir],
+                cwd=temp_dir, stderr=PIPE, stdout=PIPE)
             assert repo.dir == temp_dir
             assert repo.clone_uri == clone_uri
             assert repo.production_branch == 'main'
@@ -46,7 +51,8 @@ def test_git(_):
     repo = PrestineRepo('/tmp/stop')
     mResult = Mock()
     mResult.returncode = 0
-    mockPopen = patch('reflex.repo.Popen', return_value=mResult)
+    mResult.communicate.return_value = (b'', b'')
+    mockPopen = patch('reflex.process.Popen', return_value=mResult)
     with mockPopen as patchPopen:
         repo.git('command')
         patchPopen.assert_called_with(
@@ -62,38 +68,66 @@ def test_failed_git_command(_):
     repo = PrestineRepo('/tmp/stop')
     mResult = Mock()
     mResult.returncode = 1
-    mockPopen = patch('reflex.repo.Popen', return_value=mResult)
+    mResult.communicate.return_value = (b'', b'fatal: oops\n')
+    mockPopen = patch('reflex.process.Popen', return_value=mResult)
     with mockPopen:
         with pytest.raises(GitCommandError):
             repo.git('command')
 
 
 @patch('reflex.repo.mkdtemp', return_value='/tmp')
-def test_branches(_):
+def test_refs(_):
     """
-    Ensure git branches are listed when calling PrestineRepo#branches.
+    Ensure PrestineRepo#refs loads the ref index with a single
+    `git for-each-ref` and keeps it until a ref changing command runs.
     """
-    branches_readlines = [
-        b'  brightmd/main\n',
-        b'  brightmd/stable\n',
-        b'  brightmd/develop\n',
+    refs_readlines = [
+        b'a1 refs/heads/main\n',
+        b'b2 refs/remotes/brightmd/main\n',
+        b'c3 refs/tags/release-1.0.0\n',
     ]
 
     repo = PrestineRepo('/tmp/stop')
     mResult = Mock()
     mResult.returncode = 0
-    mResult.stdout.readlines.return_value = branches_readlines
-    mockPopen = patch('reflex.repo.Popen', return_value=mResult)
+    mResult.poll.return_value = 0
+    mResult.communicate.return_value = (b'', b'')
+    mResult.stdout.readline.side_effect = refs_readlines + [b''] + \
+        refs_readlines + [b'']
+    mockPopen = patch('reflex.process.Popen', return_value=mResult)
     with mockPopen as patchPopen:
-        assert repo.branches() == ['brightmd/main', 'brightmd/stable',
-                                   'brightmd/develop']
-        repo.branches('shrubbery')
-        patchPopen.assert_has_calls([
-            call(['git', 'branch', '--list', '--remote'], cwd='/tmp',
-                 stderr=PIPE, stdout=PIPE),
-            call(['git', 'branch', '--list', '--remote', 'shrubbery'],
-                 cwd='/tmp', stderr=PIPE, stdout=PIPE),
-        ])
+        assert repo.refs.heads == {'main': 'a1'}
+        assert repo.refs.remotes == {'brightmd/main': 'b2'}
+        assert repo.refs.tags == {'release-1.0.0': 'c3'}
+        repo.git('status')
+        repo.refs
+        assert patchPopen.call_count == 2
+        repo.git('fetch', 'origin')
+        repo.refs
+        assert patchPopen.call_count == 4
+        patchPopen.assert_called_with(
+            ['git', 'for-each-ref', '--format=%(objectname) %(refname)'],
+            cwd='/tmp', stderr=ANY, stdout=PIPE)
+
+
+@patch('reflex.repo.mkdtemp', return_value='/tmp')
+def test_branches(_):
+    """
+    Ensure remote branches are listed from the ref index when calling
+    PrestineRepo#branches.
+    """
+    repo = PrestineRepo('/tmp/stop')
+    repo._refs = RefIndex.parse([
+        'a1 refs/remotes/brightmd/main',
+        'b2 refs/remotes/brightmd/stable',
+        'c3 refs/remotes/brightmd/develop',
+        'd4 refs/heads/shrubbery',
+    ])
+
+    assert repo.branches() == ['brightmd/develop', 'brightmd/main',
+                               'brightmd/stable']
+    assert repo.branches('*/ma*') == ['brightmd/main']
+    assert repo.branches('shrubbery') == []
 
 
 @patch('reflex.repo.mkdtemp', return_value='/tmp')
@@ -103,10 +137,13 @@ def test_branch_exists(_):
     in a repo and False when the given branch does not exist in a repo.
     """
     repo = PrestineRepo('/tmp/stop')
-    mRepo = patch.object(repo, 'branches', side_effect=['brancha', 'branchb'])
-    with mRepo:
-        assert repo.branch_exists('brancha')
-        assert not repo.branch_exists('branchc')
+    repo._refs = RefIndex.parse([
+        'a1 refs/remotes/brancha',
+        'b2 refs/remotes/branchb',
+    ])
+
+    assert repo.branch_exists('brancha')
+    assert not repo.branch_exists('branchc')
 
 
 @patch('reflex.repo.mkdtemp', return_value='/tmp')
@@ -116,10 +153,12 @@ def test_checkout_new(_):
     a repo.
     """
     repo = PrestineRepo('/tmp/stop')
+    repo._refs = RefIndex()
     mRepo = patch.object(repo, 'branch_exists', side_effect=[False, False])
     mResult = Mock()
     mResult.returncode = 0
-    mockPopen = patch('reflex.repo.Popen', return_value=mResult)
+    mResult.communicate.return_value = (b'', b'')
+    mockPopen = patch('reflex.process.Popen', return_value=mResult)
     with mRepo, mockPopen as patchPopen:
         repo.checkout('branch')
         repo.checkout('branch', 'abcdef12345')
@@ -141,10 +180,12 @@ def test_checkout_existing(_):
     on the repo.
     """
     repo = PrestineRepo('/tmp/stop')
+    repo._refs = RefIndex()
     mRepo = patch.object(repo, 'branch_exists', side_effect=[True, True])
     mResult = Mock()
     mResult.returncode = 0
-    mockPopen = patch('reflex.repo.Popen', return_value=mResult)
+    mResult.communicate.return_value = (b'', b'')
+    mockPopen = patch('reflex.process.Popen', return_value=mResult)
     with mRepo, mockPopen as patchPopen:
         repo.checkout('branch')
         repo.checkout('branch', 'abcdef12345')
@@ -165,9 +206,11 @@ def test_tag(_):
     Ensure PrestineRepo#tag creates annotated tags at a given sha on the repo.
     """
     repo = PrestineRepo('/tmp/stop')
+    repo._refs = RefIndex()
     mResult = Mock()
     mResult.returncode = 0
-    mockPopen = patch('reflex.repo.Popen', return_value=mResult)
+    mResult.communicate.return_value = (b'', b'')
+    mockPopen = patch('reflex.process.Popen', return_value=mResult)
     with mockPopen as patchPopen:
         repo.tag('test-1.0.0', 'test tag')
         repo.tag('release-1.0.0', 'release tag', 'abcdef12345')
@@ -192,8 +235,8 @@ def test_get_last_tag(_):
     repo = PrestineRepo('/tmp/stop')
     mResult = Mock()
     mResult.returncode = 0
-    mResult.stdout.read.return_value = tag
-    mockPopen = patch('reflex.repo.Popen', return_value=mResult)
+    mResult.communicate.return_value = (tag, b'')
+    mockPopen = patch('reflex.process.Popen', return_value=mResult)
     with mockPopen as patchPopen:
         repo.get_last_tag()
         repo.get_last_tag('abc')
@@ -217,11 +260,390 @@ def test_get_last_tag(_):
 @patch('reflex.repo.mkdtemp', return_value='/tmp')
 def test_get_last_release(_):
     """
-    Ensure PrestineRepo#get_last_release calls PrestineRepo#get_last_tag with
-    'release-*' to filter out any non-release tags on the repo.
+    Ensure PrestineRepo#get_last_release picks the highest release tag which
+    is reachable from a sha and caches it per commit until tags change.
+    """
+    repo = PrestineRepo('/tmp/stop')
+    repo._refs = RefIndex()
+    mResult = Mock()
+    mResult.returncode = 0
+    mResult.communicate.side_effect = [
+        (b'abc\n', b''),
+        (b'release-1.9.0\nrelease-1.10.0\nrelease-candidate\n', b''),
+        (b'abc\n', b''),
+        (b'', b''),
+        (b'abc\n', b''),
+        (b'release-1.11.0\n', b''),
+        (b'def\n', b''),
+        (b'', b''),
+    ]
+    mockPopen = patch('reflex.process.Popen', return_value=mResult)
+    with mockPopen as patchPopen:
+        assert repo.get_last_release('sha') == 'release-1.10.0'
+        assert repo.get_last_release('sha') == 'release-1.10.0'
+        patchPopen.assert_has_calls([
+            call(['git', 'rev-parse', '--verify', 'sha^{commit}'],
+                 cwd='/tmp', stderr=PIPE, stdout=PIPE),
+            call(['git', 'for-each-ref', '--merged', 'abc',
+                  '--format=%(refname:short)', 'refs/tags/release-*'],
+                 cwd='/tmp', stderr=PIPE, stdout=PIPE),
+            call(['git', 'rev-parse', '--verify', 'sha^{commit}'],
+                 cwd='/tmp', stderr=PIPE, stdout=PIPE),
+        ])
+        assert patchPopen.call_count == 3
+
+        repo.tag('release-1.11.0', 'Release tag for 1.11.0')
+        assert repo.get_last_release('sha') == 'release-1.11.0'
+
+        with pytest.raises(InvalidGitReference):
+            repo.get_last_release('nothing')
+
+
+@patch('reflex.repo.mkdtemp', return_value='/tmp')
+def test_releases(_):
+    """
+    Ensure PrestineRepo#releases lists release tags in version order.
     """
     repo = PrestineRepo('/tmp/stop')
-    mRepo = patch.object(repo, 'get_last_tag', side_effect=['release-1.0.0'])
-    with mRepo:
-        assert repo.get_last_release('sha') == 'release-1.0.0'
-        repo.get_last_tag.assert_called_with('sha', 'release-*')
+    repo._refs = RefIndex.parse([
+        'a1 refs/tags/release-1.10.0',
+        'a1 refs/tags/release-1.9.0',
+        'a1 refs/tags/release-candidate',
+        'a1 refs/tags/test-1.0.0',
+    ])
+
+    assert repo.releases() == ['release-1.9.0', 'release-1.10.0']
+
+
+@patch('reflex.repo.mkdtemp', return_value='/tmp')
+def test_clone_options(_):
+    """
+    Ensure each clone strategy maps to the matching `git clone` options and
+    that filters are left out of local clones.
+    """
+    def options(strategy, local=False):
+        repo = PrestineRepo('/tmp/stop', clone_strategy=strategy)
+        return repo.clone_options(local)
+
+    assert options('full') == []
+    assert options('no-checkout') == ['--no-checkout']
+    assert options('blobless') == ['--no-checkout', '--filter=blob:none']
+    assert options('treeless') == ['--no-checkout', '--filter=tree:0']
+    assert options('blobless', local=True) == ['--no-checkout']
+
+
+@patch('reflex.repo.mkdtemp', return_value='/tmp')
+def test_partial_clone(_):
+    """
+    Ensure PrestineRepo passes the clone strategy options to `git clone`.
+    """
+    mResult = Mock()
+    mResult.returncode = 0
+    mResult.communicate.return_value = (b'', b'')
+    mockPopen = patch('reflex.process.Popen', return_value=mResult)
+    mockRmtree = patch('reflex.repo.rmtree')
+    with mockPopen as pPopen, mockRmtree:
+        with PrestineRepo('no', clone_strategy='blobless'):
+            pPopen.assert_any_call(
+                ['git', 'clone', '--no-checkout', '--filter=blob:none', 'no',
+                 '/tmp'], cwd='/tmp', stderr=PIPE, stdout=PIPE)
+
+
+@patch('reflex.repo.mkdtemp', return_value='/tmp')
+def test_branch(_):
+    """
+    Ensure PrestineRepo#branch points a branch at a commit with update-ref so
+    the working tree is left alone.
+    """
+    repo = PrestineRepo('/tmp/stop')
+    repo._refs = RefIndex()
+    mResult = Mock()
+    mResult.returncode = 0
+    mResult.communicate.return_value = (b'', b'')
+    mockPopen = patch('reflex.process.Popen', return_value=mResult)
+    with mockPopen as patchPopen:
+        repo.branch('test-1.0.0', 'release-1.0.0')
+        patchPopen.assert_called_with(
+            ['git', 'update-ref', 'refs/heads/test-1.0.0',
+             'release-1.0.0^{commit}'], cwd='/tmp', stderr=PIPE, stdout=PIPE)
+
+
+@patch('reflex.repo.mkdtemp', return_value='/tmp')
+def test_push(_):
+    """
+    Ensure PrestineRepo#push pushes refspecs to origin and records them in the
+    ref index.
+    """
+    repo = PrestineRepo('/tmp/stop')
+    repo._refs = RefIndex.parse(['a1 refs/heads/test-1.0.0'])
+    mResult = Mock()
+    mResult.returncode = 0
+    mResult.communicate.return_value = (b'', b'')
+    mockPopen = patch('reflex.process.Popen', return_value=mResult)
+    with mockPopen as patchPopen:
+        repo.push('test-1.0.0')
+        patchPopen.assert_called_with(
+            ['git', 'push', 'origin', 'test-1.0.0'], cwd='/tmp', stderr=PIPE,
+            stdout=PIPE)
+
+    assert repo.branch_exists('origin/test-1.0.0')
+
+
+@patch('reflex.repo.mkdtemp', return_value='/tmp')
+def test_push_batch(_):
+    """
+    Ensure a PushBatch sends every collected update and deletion in a single
+    atomic push, and nothing at all when it is empty.
+    """
+    repo = PrestineRepo('/tmp/stop')
+    repo._refs = RefIndex()
+    mResult = Mock()
+    mResult.returncode = 0
+    mResult.communicate.return_value = (b'', b'')
+    mockPopen = patch('reflex.process.Popen', return_value=mResult)
+    with mockPopen as patchPopen:
+        repo.push_batch().push()
+        assert not patchPopen.called
+
+        batch = repo.push_batch()
+        batch.update('main')
+        batch.update('release-1.0.0')
+        batch.delete('test-1.0.0')
+        batch.push()
+        patchPopen.assert_called_once_with(
+            ['git', 'push', '--atomic', 'origin', 'main', 'release-1.0.0',
+             ':test-1.0.0'], cwd='/tmp', stderr=PIPE, stdout=PIPE)
+
+
+def test_deadline(released_upstream, tmpdir):
+    """
+    Ensure a repo whose deadline passes while it is set up raises GitTimeout
+    and still removes its clone.
+    """
+    clone = str(tmpdir.mkdir('clone'))
+    with patch('reflex.repo.mkdtemp', return_value=clone):
+        with pytest.raises(GitTimeout):
+            with PrestineRepo(released_upstream, deadline=0):
+                pass
+    assert not os.path.exists(clone)
+
+
+@pytest.fixture
+def merge_repo(merge_upstream):
+    """
+    Fixture which hands out a PrestineRepo of the merge_upstream repo.
+    """
+    with PrestineRepo(merge_upstream) as repo:
+        yield repo
+
+
+def test_merge(merge_repo):
+    """
+    Ensure PrestineRepo#merge creates a merge commit and moves the branch to
+    it without touching the working tree.
+    """
+    commit = merge_repo.merge('main', 'origin/main', 'origin/feature',
+                              'Merge feature')
+
+    assert merge_repo.git('rev-parse', 'main').stdout.strip() == commit
+    parents = merge_repo.git('rev-parse', commit + '^1', commit + '^2')
+    assert parents.lines() == [
+        merge_repo.git('rev-parse', 'origin/main').stdout.strip(),
+        merge_repo.git('rev-parse', 'origin/feature').stdout.strip(),
+    ]
+    assert merge_repo.git('show', commit + ':g').stdout == 'g'
+    assert merge_repo.git('log', '-1', '--format=%s', commit).stdout == \
+        'Merge feature\n'
+    assert not os.path.exists(os.path.join(merge_repo.dir, 'g'))
+
+
+def test_merge_already_merged(merge_repo):
+    """
+    Ensure merging a commit which is already merged leaves the base as is.
+    """
+    base = merge_repo.git('rev-parse', 'origin/main').stdout.strip()
+
+    assert merge_repo.merge('main', 'origin/main', 'origin/main~1',
+                            'Nothing to merge') == base
+
+
+def test_merge_conflict(merge_repo):
+    """
+    Ensure a conflicting merge raises MergeConflict naming the conflicting
+    paths and leaves the branch alone.
+    """
+    merge_repo.branch('main', 'origin/main')
+    before = merge_repo.git('rev-parse', 'main').stdout
+
+    with pytest.raises(MergeConflict) as error:
+        merge_repo.merge('main', 'origin/main', 'origin/clash', 'Clash')
+
+    assert error.value.args[1] == ['f']
+    assert merge_repo.git('rev-parse', 'main').stdout == before
+
+
+def test_merge_failures(merge_repo):
+    """
+    Ensure git failures while merging are raised as GitCommandErrors.
+    """
+    with pytest.raises(GitCommandError):
+        merge_repo.is_ancestor('origin/missing', 'origin/main')
+
+    with patch.object(merge_repo, 'is_ancestor', return_value=False):
+        with pytest.raises(GitCommandError):
+            merge_repo.merge('main', 'origin/main', 'origin/missing', 'Oops')
+
+
+def test_check_merges(merge_repo):
+    """
+    Ensure PrestineRepo#check_merges reports every conflicting merge at once
+    without changing any ref.
+    """
+    before = merge_repo.git('for-each-ref').stdout
+    merge_repo.check_merges([('origin/main', 'origin/feature')])
+
+    with pytest.raises(MergeConflict) as error:
+        merge_repo.check_merges([
+            ('origin/main', 'origin/clash'),
+            ('origin/main', 'origin/feature'),
+            ('origin/feature', 'origin/clash'),
+            ('origin/clash', 'origin/main'),
+        ])
+
+    assert error.value.args[1] == [
+        'origin/clash into origin/main: f',
+        'origin/main into origin/clash: f',
+    ]
+    assert merge_repo.git('for-each-ref').stdout == before
+
+    with patch('reflex.repo.git_version', return_value=(2, 30, 0)):
+        merge_repo.check_merges([('origin/main', 'origin/clash')])
+
+
+def test_merge_commit(merge_repo):
+    """
+    Ensure PrestineRepo#merge_commit only writes the merge as an object, so
+    later merges can be checked against it without changing any ref.
+    """
+    before = merge_repo.git('for-each-ref').stdout
+    commit = merge_repo.merge_commit('origin/main', 'origin/feature',
+                                     'Merge feature')
+    # Releases without development branches have nothing to check.
+    merge_repo.check_merges([])
+
+    assert merge_repo.git('for-each-ref').stdout == before
+    assert merge_repo.git('log', '-1', '--format=%P', commit).lines()[0] == \
+        ' '.join(merge_repo.git(
+            'rev-parse', 'origin/main', 'origin/feature').lines())
+    with pytest.raises(MergeConflict) as error:
+        merge_repo.check_merges([('origin/clash', commit)], {commit: 'main'})
+    assert error.value.args[1] == ['main into origin/clash: f']
+
+
+def test_merge_in_working_tree(merge_repo):
+    """
+    Ensure git releases without `merge-tree --write-tree` merge in the working
+    tree instead.
+    """
+    with patch('reflex.repo.git_version', return_value=(2, 30, 0)):
+        commit = merge_repo.merge('main', 'origin/main', 'origin/feature',
+                                  'Merge feature')
+
+    assert merge_repo.git('rev-parse', 'HEAD').stdout.strip() == commit
+    assert merge_repo.git('log', '-1', '--format=%P', commit).lines()[0] == \
+        ' '.join(merge_repo.git(
+            'rev-parse', 'origin/main', 'origin/feature').lines())
+    assert os.path.exists(os.path.join(merge_repo.dir, 'g'))
+
+
+def test_is_ssh_uri():
+    """
+    Ensure clone uris which git reaches over SSH are told apart from others.
+    """
+    for uri in ['git@github.com:brightmd/reflex.git', 'host:repo',
+                'ssh://git@github.com/brightmd/reflex.git',
+                'git+ssh://host/repo', 'ssh+git://host/repo']:
+        assert is_ssh_uri(uri)
+    for uri in ['/tmp/repo', 'file:///tmp/repo', 'https://host/repo.git',
+                'git://host/repo', './relative/repo']:
+        assert not is_ssh_uri(uri)
+
+
+def test_ssh_multiplex(released_upstream, fake_ssh, tmpdir):
+    """
+    Ensure every SSH connection of a session, with or without a mirror
+    cache, goes through one control socket which is closed on exit.
+    """
+    uri = 'fakehost:{}'.format(released_upstream)
+    cache = MirrorCache(str(tmpdir.join('cache')))
+
+    with PrestineRepo(uri, ssh_multiplex=True,
+                      fetch_refs=cli.action_refs('release')) as repo:
+        control_dir = repo._ssh_dir
+        assert 'ControlMaster=auto' in repo.env['GIT_SSH_COMMAND']
+        cli.release(repo, '1.1.0')
+    with PrestineRepo(uri, cache=cache, ssh_multiplex=True) as repo:
+        cli.complete_release(repo, '1.1.0')
+    assert repo.env is None
+    assert not os.path.exists(control_dir)
+    assert run_git(released_upstream, 'tag', '--list').lines() == [
+        'release-1.0.0', 'release-1.1.0']
+
+    with open(fake_ssh) as log:
+        calls = log.read().splitlines()
+    sessions = [calls[:3], calls[3:]]
+    for session in sessions:
+        paths = set(arg for arg in ' '.join(session).split()
+                    if arg.startswith('ControlPath='))
+        assert len(paths) == 1
+        assert all('ControlMaster=auto' in line for line in session[:-1])
+        assert session[-1].endswith('-O exit reflex')
+    assert 'git-upload-pack' in sessions[0][0]
+    assert 'git-receive-pack' in sessions[0][1]
+    assert 'git-upload-pack' in sessions[1][0]
+    assert 'git-receive-pack' in sessions[1][1]
+
+
+def test_ssh_multiplex_only_for_ssh(released_upstream, fake_ssh):
+    """
+    Ensure SSH multiplexing is left off for remotes which are not SSH.
+    """
+    with PrestineRepo(released_upstream, ssh_multiplex=True) as repo:
+        assert repo.env is None
+    assert not os.path.exists(fake_ssh)
+
+    with PrestineRepo('fakehost:{}'.format(released_upstream)) as repo:
+        assert repo.env is None
+    with open(fake_ssh) as log:
+        assert 'ControlPath' not in log.read()
+
+
+def test_fetch_refs(released_upstream):
+    """
+    Ensure only the refs an action reads are fetched, in a single fetch and
+    without other tags following along.
+    """
+    run_git(released_upstream, 'branch', 'feature-1', 'develop')
+    run_git(released_upstream, 'branch', 'test-1.1.0', 'develop')
+    run_git(released_upstream, 'tag', 'nightly', 'develop')
+    run_git(released_upstream, 'config', 'uploadpack.allowFilter', 'true')
+    uri = 'file://{}'.format(released_upstream)
+
+    with PrestineRepo(uri, clone_strategy='blobless',
+                      fetch_refs=cli.action_refs('close')) as repo:
+        assert sorted(repo.refs.remotes) == [
+            'origin/develop', 'origin/main', 'origin/test-1.1.0']
+        assert sorted(repo.refs.tags) == ['release-1.0.0']
+        assert repo.git('config', 'remote.origin.partialclonefilter') \
+            .stdout.strip() == 'blob:none'
+        assert repo.git('status', '--porcelain', '--branch').stdout \
+            .startswith('## No commits yet')
+        cli.complete_release(repo, '1.1.0')
+
+    assert run_git(released_upstream, 'tag', '--list').lines() == [
+        'nightly', 'release-1.0.0', 'release-1.1.0']
+
+    with PrestineRepo(uri, fetch_refs=cli.action_refs('hotfix')) as repo:
+        assert sorted(repo.refs.remotes) == ['origin/main']
+        assert repo.git('rev-parse', 'HEAD').stdout == \
+            repo.git('rev-parse', 'origin/main').stdout
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+from click.testing import CliRunner
+from mock import patch
+
+import reflex.status as status
+from reflex.cache import MirrorCache
+from reflex.process import run_git
+
+
+def test_scan(released_upstream):
+    """
+    Ensure a scan finds the last release and the open test branches, and
+    counts waiting commits only when a mirror has them.
+    """
+    run_git(released_upstream, 'branch', 'test-1.1.0', 'develop')
+
+    found = status.scan(released_upstream)
+
+    assert found.ok
+    assert found.last_release == 'release-1.0.0'
+    assert found.test_branches == ['origin/test-1.1.0']
+    assert found.waiting == {'develop': None}
+
+    found = status.scan(released_upstream, 'main', ['develop', 'main', 'gone'],
+                        mirror=released_upstream)
+    assert found.waiting == {'develop': 1, 'main': 0, 'gone': None}
+
+
+def test_scan_all(released_upstream, tmpdir):
+    """
+    Ensure repos are scanned in order, failures are captured and results are
+    cached for the ttl.
+    """
+    missing = str(tmpdir.join('missing'))
+    cache_dir = str(tmpdir.join('cache'))
+    MirrorCache(cache_dir).update(released_upstream)
+
+    statuses = status.scan_all([missing, released_upstream], workers=2,
+                               cache=status.StatusCache(cache_dir, 60))
+
+    assert [found.repo for found in statuses] == [missing, released_upstream]
+    assert not statuses[0].ok
+    assert statuses[1].waiting == {'develop': 1}
+
+    with patch('reflex.status.scan') as pScan:
+        cached = status.scan_all([released_upstream],
+                                 cache=status.StatusCache(cache_dir, 60))
+        assert cached[0].as_dict() == statuses[1].as_dict()
+        assert not pScan.called
+
+        status.scan_all([released_upstream],
+                        cache=status.StatusCache(cache_dir, 0))
+        assert pScan.called
+
+
+def test_count_waiting(released_upstream, tmpdir):
+    """
+    Ensure commits are not counted in a mirror which lacks them.
+    """
+    main, develop = run_git(released_upstream, 'rev-parse', 'main',
+                            'develop').lines()
+    run_git(str(tmpdir), 'init', '--bare', '.')
+
+    assert status.count_waiting(released_upstream, main, develop) == 1
+    assert status.count_waiting(str(tmpdir), main, develop) is None
+
+
+def test_scan_nothing(tmpdir):
+    """
+    Ensure scanning no repos returns no statuses and that the status cache
+    creates its directory when saving.
+    """
+    assert status.scan_all([]) == []
+
+    cache_dir = str(tmpdir.join('new', 'cache'))
+    cache = status.StatusCache(cache_dir, 60)
+    cache.put('key', {'repo': 'repo'})
+    cache.save()
+    assert status.StatusCache(cache_dir, 60).get('key') == {'repo': 'repo'}
+
+
+def test_main(released_upstream, tmpdir):
+    """
+    Ensure reflex-status prints a table or JSON and fails if a repo can not
+    be scanned.
+    """
+    runner = CliRunner()
+    result = runner.invoke(status.main, [released_upstream])
+
+    assert result.exit_code == 0
+    header, row = result.output.splitlines()
+    assert header.split()[:2] == ['REPO', 'LAST']
+    assert row.split() == [released_upstream, 'release-1.0.0', '-',
+                           'develop:', '?']
+
+    result = runner.invoke(status.main, [
+        '--json', released_upstream, str(tmpdir.join('missing'))])
+
+    assert result.exit_code == 1
+    found = json.loads(result.output)
+    assert found[0]['last_release'] == 'release-1.0.0'
+    assert found[1]['error']
+
+    missing = str(tmpdir.join('missing'))
+    result = runner.invoke(status.main, [missing])
+
+    assert result.exit_code == 1
+    assert result.output.splitlines()[1].split()[:2] == [missing, 'FAILED']
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+
+import pytest
+from click.testing import CliRunner
+
+import reflex.cli as cli
+import reflex.trace as trace
+from reflex import process
+from reflex.error import GitCommandError
+from reflex.process import GitCall, run_git, stream_git
+from reflex.repo import PrestineRepo
+from reflex.trace import Tracer, current_phase, in_phase, phase
+
+
+def test_git_hooks(tmpdir):
+    """
+    Ensure hooks are told about every finished git command, captured or
+    streamed, including its exit code and output size.
+    """
+    calls = []
+    process.git_hooks.append(calls.append)
+    try:
+        result = run_git(str(tmpdir), 'init', '.')
+        lines = list(stream_git(str(tmpdir), 'config', '--list'))
+        with pytest.raises(GitCommandError):
+            list(stream_git(str(tmpdir), 'rev-parse', 'nowhere'))
+    finally:
+        process.git_hooks.remove(calls.append)
+
+    init, config, failed = calls
+    assert isinstance(init, GitCall)
+    assert init.command == ['git', 'init', '.']
+    assert init.cwd == str(tmpdir)
+    assert init.returncode == 0
+    assert init.stdout_bytes == len(result.stdout)
+    assert init.elapsed >= 0
+    assert config.stdout_bytes == sum(len(line) + 1 for line in lines)
+    assert failed.returncode != 0
+    assert failed.stderr_bytes > 0
+
+
+@pytest.mark.parametrize('phases', [trace._phases, trace._ThreadVar()])
+def test_phases(phases, monkeypatch):
+    """
+    Ensure commands are grouped under the innermost phase of their thread,
+    also on Python releases which keep phases without contextvars.
+    """
+    monkeypatch.setattr(trace, '_phases', phases)
+
+    @in_phase('merge')
+    def merging():
+        return current_phase()
+
+    assert current_phase() == 'other'
+    with phase('validate'):
+        assert current_phase() == 'validate'
+        assert merging() == 'merge'
+
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(current_phase()))
+        thread.start()
+        thread.join()
+        assert seen == ['other']
+        assert current_phase() == 'validate'
+    assert current_phase() == 'other'
+
+
+def test_trace_release_cycle(released_upstream, tmpdir):
+    """
+    Ensure opening and closing a release records every git command under the
+    phase it belongs to.
+    """
+    with Tracer() as tracer:
+        cli.preflight('release', released_upstream, '1.1.0')
+        with PrestineRepo(released_upstream,
+                          fetch_refs=cli.action_refs('release')) as repo:
+            cli.release(repo, '1.1.0')
+        with PrestineRepo(released_upstream,
+                          fetch_refs=cli.action_refs('close')) as repo:
+            cli.complete_release(repo, '1.1.0')
+    recorded = len(tracer.calls)
+    run_git(None, 'version')
+
+    phases = [row[0] for row in tracer.phases()]
+    assert phases == ['clone', 'fetch', 'validate', 'merge', 'tag', 'push',
+                      'other']
+    assert [call.command[1] for call, name, _ in tracer.calls
+            if name in ('clone', 'fetch')] == [
+        'init', 'remote', 'fetch', 'checkout'] * 2
+    assert len(tracer.calls) == recorded
+
+    summary = tracer.summary().splitlines()
+    assert summary[0].split() == ['phase', 'commands', 'seconds', 'bytes']
+    assert [line.split()[0] for line in summary[1:]] == phases + ['total']
+    assert int(summary[-1].split()[1]) == len(tracer.calls)
+
+    path = str(tmpdir.join('trace.json'))
+    tracer.write(path)
+    with open(path) as trace:
+        events = json.load(trace)['traceEvents']
+    assert len(events) == len(tracer.calls)
+    assert min(event['ts'] for event in events) == 0
+    push, = [event for event in events if event['cat'] == 'push'
+             and '--atomic' in event['args']['command']]
+    assert push['name'] == 'git push'
+    assert push['ph'] == 'X'
+    assert push['args']['returncode'] == 0
+
+
+def test_empty_trace():
+    """
+    Ensure a tracer which recorded nothing still reports.
+    """
+    tracer = Tracer()
+
+    assert tracer.chrome_trace()['traceEvents'] == []
+    assert tracer.summary().splitlines()[-1].split() == [
+        'total', '0', '0.000', '0']
+
+
+def test_profile_option(released_upstream, tmpdir):
+    """
+    Ensure --profile writes a trace and prints a summary, even when the
+    action fails.
+    """
+    path = str(tmpdir.join('trace.json'))
+
+    runner = CliRunner()
+    result = runner.invoke(cli.main, ['1.1.0', '--repo', released_upstream,
+                                      '--release', '--profile', path])
+    assert result.exit_code == 0
+    assert 'total' in result.output
+    with open(path) as trace:
+        assert json.load(trace)['traceEvents']
+
+    result = runner.invoke(cli.main, ['1.1.0', '--repo', released_upstream,
+                                      '--release', '--profile', path])
+    assert result.exit_code != 0
+    with open(path) as trace:
+        events = json.load(trace)['traceEvents']
+    assert [event['cat'] for event in events] == ['validate']
+    assert not process.git_hooks
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from reflex import version
+from reflex.error import InvalidVersion
+from reflex.version import (
+    Version, latest_version, next_versions, parse_versions, sort_versions,
+)
+
+
+def test_parse():
+    """
+    Ensure versions are parsed with or without a tag prefix, including their
+    pre-release and build parts.
+    """
+    parsed = Version.parse('release-1.2.3-rc.1+build.5')
+
+    assert (parsed.major, parsed.minor, parsed.patch) == (1, 2, 3)
+    assert parsed.prerelease == ('rc', '1')
+    assert parsed.build == ('build', '5')
+    assert str(parsed) == '1.2.3-rc.1+build.5'
+    assert repr(parsed) == "Version('1.2.3-rc.1+build.5')"
+    assert Version.parse('v1.2.3') == Version(1, 2, 3)
+    assert Version.parse('release-1.2.3') is Version.parse('release-1.2.3')
+
+
+def test_parse_invalid():
+    """
+    Ensure text which is not a semantic version is rejected.
+    """
+    for text in ('', '1.2', '1.2.3.4', '01.2.3', '1.2.3-', 'release-x.y.z',
+                 'release-candidate', '1.2.3 '):
+        with pytest.raises(InvalidVersion):
+            Version.parse(text)
+
+
+def test_parse_cache_limit(monkeypatch):
+    """
+    Ensure the parse cache is emptied rather than growing without bound.
+    """
+    monkeypatch.setattr(version, '_parsed', {})
+    monkeypatch.setattr(version, '_PARSED_LIMIT', 2)
+
+    Version.parse('1.0.0')
+    Version.parse('1.0.1')
+    Version.parse('1.0.2')
+
+    assert list(version._parsed) == ['1.0.2']
+
+
+def test_ordering():
+    """
+    Ensure versions are ordered by semver precedence.
+    """
+    ordered = [
+        '1.0.0-alpha', '1.0.0-alpha.1', '1.0.0-alpha.beta', '1.0.0-beta',
+        '1.0.0-beta.2', '1.0.0-beta.11', '1.0.0-rc.1', '1.0.0', '1.0.1',
+        '1.9.0', '1.10.0', '2.0.0',
+    ]
+    versions = [Version.parse(text) for text in ordered]
+
+    for lower, higher in zip(versions, versions[1:]):
+        assert lower < higher
+        assert higher > lower
+        assert lower != higher
+    assert sorted(reversed(versions)) == versions
+
+
+def test_build_metadata_ignored():
+    """
+    Ensure build metadata does not affect comparisons.
+    """
+    assert Version.parse('1.0.0+build.1') == Version.parse('1.0.0+build.2')
+    assert hash(Version.parse('1.0.0+a')) == hash(Version.parse('1.0.0'))
+    assert Version.parse('1.0.0') != '1.0.0'
+
+
+def test_bump():
+    """
+    Ensure the next major, minor and patch releases are worked out.
+    """
+    current = Version.parse('1.2.3')
+
+    assert current.bump('major') == Version(2, 0, 0)
+    assert current.bump('minor') == Version(1, 3, 0)
+    assert current.bump('patch') == Version(1, 2, 4)
+    assert Version.parse('1.2.3-rc.1').bump('patch') == Version(1, 2, 3)
+
+    with pytest.raises(ValueError):
+        current.bump('build')
+
+
+def test_batch():
+    """
+    Ensure many tag names can be parsed, sorted and searched at once with
+    the names which are not versions left out.
+    """
+    names = ['release-1.10.0', 'release-candidate', 'release-1.9.0',
+             'release-1.10.0-rc.1']
+
+    valid, invalid = parse_versions(names)
+    assert [name for name, _ in valid] == [
+        'release-1.10.0', 'release-1.9.0', 'release-1.10.0-rc.1']
+    assert invalid == ['release-candidate']
+
+    assert sort_versions(names) == [
+        'release-1.9.0', 'release-1.10.0-rc.1', 'release-1.10.0']
+    assert sort_versions(names, reverse=True)[0] == 'release-1.10.0'
+    assert latest_version(names) == 'release-1.10.0'
+    assert latest_version(['release-candidate']) is None
+
+
+def test_next_versions():
+    """
+    Ensure the next versions follow the highest version given, or 0.0.0.
+    """
+    assert next_versions(['release-1.9.0', 'release-1.10.0']) == {
+        'major': Version(2, 0, 0),
+        'minor': Version(1, 11, 0),
+        'patch': Version(1, 10, 1),
+    }
+    assert next_versions([])['patch'] == Version(0, 0, 1)
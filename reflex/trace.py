@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from reflex import process
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # Python before 3.7
+    ContextVar = None
+
+# The phases of an action, in the order they are reported. Git commands run
+# outside of any phase are reported as 'other'.
+PHASES = ('clone', 'fetch', 'validate', 'merge', 'tag', 'push')
+
+
+class _ThreadVar(threading.local):
+    """
+    A per-thread stand-in for a ContextVar on Python releases without
+    contextvars, where coroutines on one thread share their phases.
+    """
+    value = ()
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        token, self.value = self.value, value
+        return token
+
+    def reset(self, token):
+        self.value = token
+
+
+# The stack of phases the current thread, or asyncio task, is in.
+_phases = ContextVar('phases', default=()) if ContextVar else _ThreadVar()
+
+
+@contextmanager
+def phase(name):
+    """
+    Groups the git commands run inside the block, on the current thread or
+    asyncio task, under a phase. The innermost phase wins when phases are
+    nested.
+    """
+    token = _phases.set(_phases.get() + (name,))
+    try:
+        yield
+    finally:
+        _phases.reset(token)
+
+
+def in_phase(name):
+    """ Decorator which runs a function inside a phase.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_phase():
+    """ Returns the phase git commands on the current thread or task belong to.
+    """
+    stack = _phases.get()
+    return stack[-1] if stack else 'other'
+
+
+class Tracer():
+    """
+    Records every git command which finishes while the tracer is active,
+    along with the phase it ran in and the thread which ran it.
+
+    The recording can be written as a Chrome trace (load it in
+    chrome://tracing or https://ui.perfetto.dev) or summarized per phase.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __enter__(self):
+        process.git_hooks.append(self.record)
+        return self
+
+    def __exit__(self, *exc):
+        process.git_hooks.remove(self.record)
+
+    def record(self, call):
+        """ Git hook which records a finished git command.
+        """
+        self.calls.append(
+            (call, current_phase(), threading.current_thread().ident))
+
+    def chrome_trace(self):
+        """ Returns the recorded commands in the Chrome trace event format.
+        """
+        origin = min([call.start for call, _, _ in self.calls] or [0])
+        events = []
+        for call, name, thread in self.calls:
+            events.append({
+                'name': ' '.join(call.command[:2]),
+                'cat': name,
+                'ph': 'X',
+                'ts': int((call.start - origin) * 1000000),
+                'dur': int(call.elapsed * 1000000),
+                'pid': os.getpid(),
+                'tid': thread,
+                'args': {
+                    'command': ' '.join(call.command),
+                    'cwd': call.cwd,
+                    'returncode': call.returncode,
+                    'stdout_bytes': call.stdout_bytes,
+                    'stderr_bytes': call.stderr_bytes,
+                },
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path):
+        """ Writes the recorded commands to a Chrome trace file.
+        """
+        with open(path, 'w') as trace:
+            json.dump(self.chrome_trace(), trace, indent=1)
+
+    def phases(self):
+        """
+        Totals the recorded commands per phase. Returns a list of
+        (phase, commands, seconds, output bytes) for phases which ran.
+        """
+        totals = {}
+        for call, name, _ in self.calls:
+            count, seconds, size = totals.get(name, (0, 0.0, 0))
+            totals[name] = (count + 1, seconds + call.elapsed,
+                            size + call.stdout_bytes + call.stderr_bytes)
+        order = list(PHASES) + sorted(set(totals) - set(PHASES))
+        return [(name,) + totals[name] for name in order if name in totals]
+
+    def summary(self):
+        """ Returns a table of the time spent in each phase.
+        """
+        rows = self.phases()
+        lines = ['{:<10} {:>8} {:>10} {:>12}'.format(
+            'phase', 'commands', 'seconds', 'bytes')]
+        for name, count, seconds, size in rows:
+            lines.append('{:<10} {:>8} {:>10.3f} {:>12}'.format(
+                name, count, seconds, size))
+        lines.append('{:<10} {:>8} {:>10.3f} {:>12}'.format(
+            'total', sum(row[1] for row in rows),
+            sum(row[2] for row in rows), sum(row[3] for row in rows)))
+        return '\n'.join(lines) + '\n'
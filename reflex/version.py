@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+from functools import total_ordering
+
+from reflex.error import InvalidVersion
+
+# A semantic version, optionally behind a tag prefix such as 'release-'.
+VERSION_PATTERN = re.compile(
+    r'^(?:[A-Za-z][A-Za-z_]*-)?v?'
+    r'(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)'
+    r'(?:-([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?'
+    r'(?:\+([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?$')
+
+# Parsed versions by the text they were parsed from.
+_parsed = {}
+_PARSED_LIMIT = 100000
+
+
+@total_ordering
+class Version(object):
+    """
+    A semantic version (https://semver.org) ordered by semver precedence.
+
+    Pre-release versions sort before the release they lead up to and build
+    metadata is ignored when comparing. Parsing is cached, so the same tag
+    names can be compared over and over without being parsed again.
+    """
+
+    __slots__ = ('major', 'minor', 'patch', 'prerelease', 'build', '_key')
+
+    def __init__(self, major, minor, patch, prerelease=(), build=()):
+        self.major = major
+        self.minor = minor
+        self.patch = patch
+        self.prerelease = tuple(prerelease)
+        self.build = tuple(build)
+        # A release outranks all of its pre-releases. Numeric identifiers
+        # rank below alphanumeric ones and compare as numbers.
+        self._key = (major, minor, patch, not self.prerelease, tuple(
+            (0, int(part), '') if part.isdigit() else (1, 0, part)
+            for part in self.prerelease))
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parses a version such as '1.2.3', '1.2.3-rc.1+build.5' or a tag name
+        like 'release-1.2.3'. Raises InvalidVersion if it is not one.
+        """
+        version = _parsed.get(text)
+        if version is None:
+            match = VERSION_PATTERN.match(text)
+            if not match:
+                raise InvalidVersion(
+                    "'{}' is not a semantic version.".format(text))
+            major, minor, patch, prerelease, build = match.groups()
+            version = cls(int(major), int(minor), int(patch),
+                          prerelease.split('.') if prerelease else (),
+                          build.split('.') if build else ())
+            if len(_parsed) >= _PARSED_LIMIT:
+                _parsed.clear()
+            _parsed[text] = version
+        return version
+
+    def bump(self, part):
+        """ Returns the next 'major', 'minor' or 'patch' release.
+        """
+        if part == 'major':
+            return Version(self.major + 1, 0, 0)
+        if part == 'minor':
+            return Version(self.major, self.minor + 1, 0)
+        if part == 'patch':
+            if self.prerelease:
+                return Version(self.major, self.minor, self.patch)
+            return Version(self.major, self.minor, self.patch + 1)
+        raise ValueError("Unknown version part '{}'.".format(part))
+
+    def __eq__(self, other):
+        return isinstance(other, Version) and self._key == other._key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        return self._key < other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __str__(self):
+        text = '{}.{}.{}'.format(self.major, self.minor, self.patch)
+        if self.prerelease:
+            text += '-' + '.'.join(self.prerelease)
+        if self.build:
+            text += '+' + '.'.join(self.build)
+        return text
+
+    def __repr__(self):
+        return 'Version({!r})'.format(str(self))
+
+
+def parse_versions(names):
+    """
+    Parses many version strings or tag names in one pass. Returns a list of
+    (name, Version) pairs for the valid ones and a list of the invalid names.
+    """
+    valid = []
+    invalid = []
+    for name in names:
+        try:
+            valid.append((name, Version.parse(name)))
+        except InvalidVersion:
+            invalid.append(name)
+    return valid, invalid
+
+
+def sort_versions(names, reverse=False):
+    """
+    Sorts version strings or tag names by semver precedence, leaving out any
+    which are not versions.
+    """
+    valid, _ = parse_versions(names)
+    valid.sort(key=lambda pair: pair[1], reverse=reverse)
+    return [name for name, _ in valid]
+
+
+def latest_version(names):
+    """
+    Returns the name with the highest version out of many version strings or
+    tag names, or None if none of them are versions.
+    """
+    valid, _ = parse_versions(names)
+    if not valid:
+        return None
+    return max(valid, key=lambda pair: pair[1])[0]
+
+
+def next_versions(names):
+    """
+    Returns the next major, minor and patch release after the highest of
+    many version strings or tag names, as a dict of Versions.
+    """
+    latest = latest_version(names)
+    current = Version.parse(latest) if latest else Version(0, 0, 0)
+    return dict((part, current.bump(part))
+                for part in ('major', 'minor', 'patch'))
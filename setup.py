@@ -34,6 +34,9 @@ setup(
     entry_points={
         'console_scripts': [
             'reflex = reflex.cli:main',
+            'reflex-batch = reflex.batch:main',
+            'reflex-daemon = reflex.daemon:main',
+            'reflex-status = reflex.status:main',
         ]
     },
 )